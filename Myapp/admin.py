@@ -1,15 +1,72 @@
-from django.contrib import admin
-from django.contrib.auth.admin import UserAdmin
-from .models import UserSignup, CourseUnit, UploadedFile, EmailNotification
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .models import UserSignup, CourseUnit, UploadedFile, NotificationEvent, StorageUsage, Enrollment
+from . import services
 
-class UserSignupAdmin(admin.ModelAdmin):
+class EstimatedCountPaginator(Paginator):
+    """Paginator that reads the size of an unfiltered table from the database instead of COUNT(*).
+
+    PostgreSQL's planner statistics (``pg_class.reltuples``) and SQLite's
+    highest rowid are both single-row lookups, while COUNT(*) scans the table.
+    The estimate can be off by rows deleted or added since, so the last page
+    may come up short. Filtered lists and small tables are counted exactly.
+    """
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = self.estimate(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.exact_below:
+                return estimate
+        return super().count
+
+    @staticmethod
+    def estimate(model, using):
+        connection = connections[using]
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [connection.ops.quote_name(table)])
+            elif connection.vendor == 'sqlite':
+                cursor.execute(f"SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}")
+            else:
+                return None
+            row = cursor.fetchone()
+        # reltuples is -1 until the table is first analyzed
+        return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelists that cost the same number of queries at any table size"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Skip the second, unfiltered COUNT(*) behind "N total"
+    list_per_page = 50
+
+class TrashAdmin(LargeTableAdmin):
+    """Tombstoned models: rows leave through the trash actions, which keep the quota counters in step"""
+
+    def get_actions(self, request):
+        # The stock delete action would skip the trash and its quota release
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def report_restore(self, request, count, noun, errors):
+        self.message_user(request, f"Restored {count} {noun}(s).", messages.SUCCESS)
+        for error in errors:
+            self.message_user(request, error, messages.ERROR)
+
+class UserSignupAdmin(LargeTableAdmin):
     """Custom admin for UserSignup model"""
     list_display = ('full_name', 'email', 'role', 'subject', 'agreed', 'created_at')
     list_filter = ('role', 'agreed', 'created_at')
     search_fields = ('full_name', 'email', 'subject')
-    ordering = ('-created_at',)
+    ordering = ('-id',)  # Same order as -created_at, but walks the primary key index
     readonly_fields = ('created_at', 'password')  # Make password readonly for security
-    
+
     fieldsets = (
         ('Personal Information', {
             'fields': ('full_name', 'email', 'role', 'subject')
@@ -22,20 +79,151 @@ class UserSignupAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
-    
+
     def get_readonly_fields(self, request, obj=None):
         """Make email readonly when editing existing users"""
         if obj:  # Editing an existing object
             return self.readonly_fields + ('email',)
         return self.readonly_fields
 
-# Register only UserSignup for now
+class CourseUnitAdmin(TrashAdmin):
+    list_display = ('name', 'teacher', 'created_at', 'deleted_at')
+    list_select_related = ('teacher',)
+    list_filter = (('deleted_at', admin.EmptyFieldListFilter),)
+    search_fields = ('name',)
+    raw_id_fields = ('teacher',)
+    date_hierarchy = 'created_at'
+    ordering = ('-created_at',)
+    actions = ('publish_files', 'move_to_trash', 'restore')
+
+    def get_queryset(self, request):
+        # Trashed units too, so admins can see and restore them
+        return CourseUnit.all_objects.all()
+
+    @admin.action(description="Publish all files in the selected units")
+    def publish_files(self, request, queryset):
+        count = services.set_published(None, UploadedFile.objects.filter(unit__in=queryset), True)
+        self.message_user(request, f"Published {count} file(s).", messages.SUCCESS)
+
+    @admin.action(description="Move the selected units and their files to the trash")
+    def move_to_trash(self, request, queryset):
+        count = services.trash_units(queryset)
+        self.message_user(request, f"Moved {count} unit(s) to the trash.", messages.SUCCESS)
+
+    @admin.action(description="Restore the selected units and their files from the trash")
+    def restore(self, request, queryset):
+        count, errors = 0, []
+        for unit in queryset.filter(deleted_at__isnull=False).select_related('teacher'):
+            try:
+                services.restore_unit(unit.teacher, unit.id)
+                count += 1
+            except services.BulkActionError as e:
+                errors.append(f"{unit.name}: {e}")
+        self.report_restore(request, count, 'unit', errors)
+
+class UploadedFileAdmin(TrashAdmin):
+    list_display = ('original_name', 'teacher', 'unit_name', 'file_kind', 'file_size', 'tag', 'is_published', 'uploaded_at', 'deleted_at')
+    list_select_related = ('teacher', 'unit')
+    list_filter = ('is_published', 'file_kind', 'tag', ('deleted_at', admin.EmptyFieldListFilter))
+    search_fields = ('original_name',)
+    raw_id_fields = ('teacher', 'unit')
+    # deleted_at changes only through the trash actions, which release and charge quota with it
+    readonly_fields = ('file_kind', 'public_url', 'uploaded_at', 'deleted_at')
+    date_hierarchy = 'uploaded_at'
+    ordering = ('-uploaded_at',)
+    actions = ('publish', 'unpublish', 'move_to_trash', 'restore')
+
+    def get_queryset(self, request):
+        # Trashed files too, so admins can see and restore them
+        return UploadedFile.all_objects.all()
+
+    # Names from the joined rows: str() of a unit or file would look up its teacher once per row
+    @admin.display(description='unit', ordering='unit__name')
+    def unit_name(self, obj):
+        return obj.unit.name
+
+    @admin.action(description="Publish the selected files")
+    def publish(self, request, queryset):
+        count = services.set_published(None, queryset.filter(deleted_at__isnull=True), True)
+        self.message_user(request, f"Published {count} file(s).", messages.SUCCESS)
+
+    @admin.action(description="Unpublish the selected files")
+    def unpublish(self, request, queryset):
+        count = services.set_published(None, queryset.filter(deleted_at__isnull=True), False)
+        self.message_user(request, f"Unpublished {count} file(s).", messages.SUCCESS)
+
+    @admin.action(description="Move the selected files to the trash")
+    def move_to_trash(self, request, queryset):
+        count = services.trash_files(None, queryset.filter(deleted_at__isnull=True))
+        self.message_user(request, f"Moved {count} file(s) to the trash.", messages.SUCCESS)
+
+    @admin.action(description="Restore the selected files from the trash")
+    def restore(self, request, queryset):
+        # One restore per teacher, since each is charged to that teacher's quota
+        file_ids = {}
+        for teacher_id, file_id in queryset.filter(deleted_at__isnull=False).values_list('teacher_id', 'id'):
+            file_ids.setdefault(teacher_id, []).append(file_id)
+        count, errors = 0, []
+        for teacher in UserSignup.objects.filter(id__in=file_ids):
+            try:
+                count += services.restore_files(teacher, file_ids[teacher.id])
+            except services.BulkActionError as e:
+                errors.append(f"{teacher.full_name}: {e}")
+        self.report_restore(request, count, 'file', errors)
+
+class NotificationEventAdmin(LargeTableAdmin):
+    list_display = ('notification_type', 'teacher', 'unit_name', 'file_name', 'created_at')
+    list_select_related = ('teacher', 'unit', 'file')
+    list_filter = ('notification_type',)
+    raw_id_fields = ('teacher', 'unit', 'file')
+    date_hierarchy = 'created_at'
+    actions = ('delete_events',)
+
+    @admin.display(description='unit', ordering='unit__name')
+    def unit_name(self, obj):
+        return obj.unit.name
+
+    @admin.display(description='file', ordering='file__original_name')
+    def file_name(self, obj):
+        return obj.file.original_name if obj.file_id else None
+
+    @admin.action(description="Delete the selected notifications")
+    def delete_events(self, request, queryset):
+        # Nothing references events (read cursors store ids), so this is a single DELETE
+        count, _ = queryset.delete()
+        self.message_user(request, f"Deleted {count} notification(s).", messages.SUCCESS)
+
+class StorageUsageAdmin(LargeTableAdmin):
+    """Usage counters; set max_bytes/max_files to give a teacher or unit its own quota"""
+    list_display = ('teacher', 'unit_name', 'bytes_used', 'files_used', 'max_bytes', 'max_files')
+    list_select_related = ('teacher', 'unit')
+    raw_id_fields = ('teacher', 'unit')
+    readonly_fields = ('bytes_used', 'files_used')
+
+    @admin.display(description='unit', ordering='unit__name')
+    def unit_name(self, obj):
+        return obj.unit.name if obj.unit_id else None
+
+class EnrollmentAdmin(LargeTableAdmin):
+    list_display = ('student', 'teacher', 'created_at')
+    list_select_related = ('student', 'teacher')
+    raw_id_fields = ('student', 'teacher')
+    actions = ('unenroll',)
+
+    @admin.action(description="Unenroll the selected students")
+    def unenroll(self, request, queryset):
+        # Nothing references enrollments, so this is a single DELETE
+        count, _ = queryset.delete()
+        self.message_user(request, f"Removed {count} enrollment(s).", messages.SUCCESS)
+
 admin.site.register(UserSignup, UserSignupAdmin)
+admin.site.register(CourseUnit, CourseUnitAdmin)
+admin.site.register(UploadedFile, UploadedFileAdmin)
+admin.site.register(NotificationEvent, NotificationEventAdmin)
+admin.site.register(StorageUsage, StorageUsageAdmin)
+admin.site.register(Enrollment, EnrollmentAdmin)
 
 # Customize admin site headers
 admin.site.site_header = "cloudED Administration"
 admin.site.site_title = "cloudED Admin"
 admin.site.index_title = "Welcome to cloudED Administration"
-admin.site.register(UploadedFile)
-
-admin.site.register(CourseUnit)
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""Hourly and daily usage rollups of download events, and the teacher analytics read from them.
+
+``rollup()`` looks at the ``DownloadEvent`` rows added since its
+``RollupWatermark`` and rebuilds every day they fall in: the day's ``day``
+rows and its ``hour`` rows, per file, per unit and per teacher, recomputed
+from that day's events. Rebuilding instead of incrementing keeps unique
+students exact and makes re-runs (or a run after a crash) produce the same
+rows; events a worker flushes late just mark their day for the next run. A
+run costs the days it touches, not the size of the history, and analytics
+queries read only ``UsageRollup`` rows.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import DownloadEvent, RollupWatermark, UsageRollup
+
+logger = logging.getLogger(__name__)
+
+WATERMARK = 'download_events'
+PERIODS = {'hour': TruncHour, 'day': TruncDay}
+PERIOD_LENGTH = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+# Rows per (period, start): per teacher, per unit, per file
+SCOPES = (('teacher',), ('teacher', 'unit'), ('teacher', 'unit', 'file'))
+TOTALS = ('downloads', 'previews', 'bytes_served')
+
+
+def _aggregate(events, period, scope):
+    owners = {'teacher': F('file__teacher_id'), 'unit': F('file__unit_id')}
+    grouped = events.values(
+        *(['file'] if 'file' in scope else []),
+        start=PERIODS[period]('created_at'),
+        **{name: owners[name] for name in scope if name in owners},
+    )
+    return grouped.annotate(
+        downloads=Count('id', filter=Q(kind='download')),
+        previews=Count('id', filter=Q(kind='preview')),
+        unique_students=Count('student_id', distinct=True),
+        bytes_served=Sum('file__file_size'),
+    )
+
+
+def _rebuild_day(day):
+    """Replace the rollups of the day starting at ``day`` with totals recomputed from its events"""
+    end = day + PERIOD_LENGTH['day']
+    # Events of purged files drop out with the inner join on the file
+    events = DownloadEvent.objects.filter(created_at__gte=day, created_at__lt=end).order_by()
+    rows = [
+        UsageRollup(
+            period=period, period_start=row['start'], teacher_id=row['teacher'], unit_id=row.get('unit'),
+            file_id=row.get('file'), downloads=row['downloads'], previews=row['previews'],
+            unique_students=row['unique_students'], bytes_served=row['bytes_served'] or 0,
+        )
+        for period in PERIODS
+        for scope in SCOPES
+        for row in _aggregate(events, period, scope)
+    ]
+    with transaction.atomic():
+        # Concurrent runs rebuild one day at a time, in turn
+        RollupWatermark.objects.select_for_update().get(name=WATERMARK)
+        UsageRollup.objects.filter(period_start__gte=day, period_start__lt=end).delete()
+        UsageRollup.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def rollup():
+    """Bring the rollups up to date with the events added since the last run; returns the days rebuilt"""
+    watermark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK)
+    new_events = DownloadEvent.objects.filter(id__gt=watermark.last_event_id)
+    last_id = new_events.aggregate(last_id=Max('id'))['last_id']
+    if last_id is None:
+        return 0
+    days = sorted(
+        new_events.filter(id__lte=last_id).order_by()
+        .annotate(day=TruncDay('created_at')).values_list('day', flat=True).distinct()
+    )
+    for day in days:
+        logger.info("Rebuilt %d usage rollups of %s", _rebuild_day(day), day.date())
+    # Only once every touched day is rebuilt, so an interrupted run starts over from the same events
+    RollupWatermark.objects.filter(name=WATERMARK, last_event_id__lt=last_id).update(last_event_id=last_id)
+    return len(days)
+
+
+def window_start(period, last):
+    """Start of the oldest of the ``last`` periods up to and including the current one"""
+    now = timezone.now()
+    current = now.replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        current = current.replace(hour=0)
+    return current - PERIOD_LENGTH[period] * (last - 1)
+
+
+def _totals(rows, limit=None):
+    # Annotations can't reuse the names of the summed fields; rename them on the way out
+    rows = rows.annotate(**{f'total_{name}': Sum(name) for name in TOTALS}).order_by('-total_downloads', '-total_previews')[:limit]
+    return [
+        {**{key: value for key, value in row.items() if not key.startswith('total_')},
+         **{name: row[f'total_{name}'] for name in TOTALS}}
+        for row in rows
+    ]
+
+
+def teacher_usage(teacher_id, period, since, unit_id=None, file_id=None):
+    """Series and per-unit/per-file totals of a teacher's materials since ``since``, from the rollups only.
+
+    Scoped to one unit or one file if given. Breakdown totals are sums over
+    the periods, so they leave out unique students.
+    """
+    rows = UsageRollup.objects.filter(teacher_id=teacher_id, period=period, period_start__gte=since)
+    if file_id is not None:
+        series = rows.filter(file_id=file_id)
+    elif unit_id is not None:
+        series = rows.filter(unit_id=unit_id, file__isnull=True)
+    else:
+        series = rows.filter(unit__isnull=True)
+    result = {
+        'series': list(
+            series.order_by('period_start').values('period_start', 'unique_students', *TOTALS)
+        ),
+    }
+    if unit_id is None and file_id is None:
+        result['units'] = _totals(rows.filter(unit__isnull=False, file__isnull=True).values('unit_id', name=F('unit__name')))
+    if file_id is None:
+        files = rows.filter(file__isnull=False)
+        if unit_id is not None:
+            files = files.filter(unit_id=unit_id)
+        result['files'] = _totals(files.values('file_id', 'unit_id', name=F('file__original_name')), limit=50)
+    return result
@@ -0,0 +1,87 @@
+"""Async versions of the read-heavy v1 endpoints.
+
+Plain Django async views (DRF's APIView is sync-only) returning the same
+JSON as the DRF views they replaced. Under ASGI a request waiting on the
+database or cache suspends instead of holding a worker thread; under WSGI
+Django runs them in an event loop per request, so they keep working there.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+
+from .. import notifications
+from ..middleware import aget_principal
+from ..models import UploadedFile, UserSignup
+from .serializers import CourseUnitSerializer, NotificationSerializer, UserSerializer
+
+logger = logging.getLogger(__name__)
+
+
+@require_safe
+async def teachers_list(request):
+    """Teachers with their units and files; ``?kind=pdf`` (etc.) lists only files of that kind.
+
+    A logged-in student gets only the teachers of their courses.
+    """
+    files = UploadedFile.objects.all()
+    kind = request.GET.get('kind')
+    if kind:
+        if kind not in dict(UploadedFile.KIND_CHOICES):
+            return JsonResponse({'success': False, 'error': f'Unknown file kind: {kind}'}, status=400)
+        files = files.filter(file_kind=kind)
+    teachers = UserSignup.objects.filter(role='teacher')
+    if await request.session.aget('user_role') == 'student':
+        teachers = teachers.filter(course_enrollments__student_id=await request.session.aget('user_id'))
+    teachers = teachers.prefetch_related(Prefetch('course_units__files', queryset=files))
+    data = []
+    async for t in teachers:
+        # Units and files come from the prefetch above; no queries per teacher
+        data.append({
+            'teacher': UserSerializer(t).data,
+            'units': CourseUnitSerializer(t.course_units.all(), many=True).data,
+        })
+    return JsonResponse({'teachers': data})
+
+
+@require_safe
+async def me(request):
+    """The logged-in user, or ``user: null``"""
+    user_id = await request.session.aget('user_id')
+    if not user_id:
+        return JsonResponse({'user': None, 'error': 'No user session found'})
+    user = await aget_principal(request)
+    if user is None:
+        logger.info("me: session user %s not found", user_id, extra={'sample_rate': 0.1})
+        return JsonResponse({'user': None, 'error': 'Error retrieving user: User not found'})
+    return JsonResponse({'user': UserSerializer(user).data})
+
+
+@require_safe
+async def notification_feed(request):
+    """One page of the student's notification feed, newest first"""
+    user_id = await request.session.aget('user_id')
+    if not user_id or await request.session.aget('user_role') != 'student':
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+
+    try:
+        limit = int(request.GET.get('limit', notifications.FEED_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'limit must be an integer'}, status=400)
+
+    try:
+        # The feed is a few dependent queries; run them in one thread hop
+        page, next_cursor, last_seen = await sync_to_async(notifications.get_feed)(
+            user_id, cursor=request.GET.get('cursor'), limit=limit
+        )
+    except notifications.InvalidCursor:
+        return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+    unread_count = await sync_to_async(notifications.get_unread_count)(user_id, last_seen=last_seen)
+
+    return JsonResponse({
+        'notifications': NotificationSerializer(page, many=True, context={'last_seen': last_seen}).data,
+        'next_cursor': next_cursor,
+        'unread_count': unread_count,
+    })
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from ..models import UserSignup, CourseUnit, UploadedFile
+from ..models import UserSignup, CourseUnit, UploadedFile, NotificationEvent
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -28,13 +28,11 @@ class UploadedFileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = UploadedFile
-        fields = ['id', 'original_name', 'file_size', 'file_type', 'tag', 'is_published', 'uploaded_at', 'file_url', 'get_file_size_display']
+        fields = ['id', 'original_name', 'file_size', 'file_type', 'file_kind', 'tag', 'is_published', 'publish_at', 'unpublish_at', 'uploaded_at', 'file_url', 'get_file_size_display']
 
     def get_file_url(self, obj):
         """Get the Cloudinary URL for direct download"""
-        if obj.file:
-            return obj.file.url
-        return None
+        return obj.get_file_url()
 
     def get_file_size_display(self, obj):
         """Format file size for display"""
@@ -48,3 +46,18 @@ class CourseUnitSerializer(serializers.ModelSerializer):
     class Meta:
         model = CourseUnit
         fields = ['id', 'name', 'description', 'created_at', 'updated_at', 'teacher', 'files']
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    teacher_name = serializers.CharField(source='teacher.full_name', read_only=True)
+    unit_name = serializers.CharField(source='unit.name', read_only=True)
+    file_name = serializers.CharField(source='file.original_name', read_only=True, default=None)
+    is_read = serializers.SerializerMethodField()
+
+    class Meta:
+        model = NotificationEvent
+        fields = ['id', 'notification_type', 'created_at', 'is_read', 'teacher', 'teacher_name', 'unit', 'unit_name', 'file', 'file_name']
+
+    def get_is_read(self, obj):
+        """Everything at or below the student's cursor has been read"""
+        return obj.id <= self.context.get('last_seen', 0)
@@ -0,0 +1,84 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods
+
+from .. import enrollments
+from ..events import hub, events_since, format_sse
+
+
+def _parse_last_event_id(request):
+    raw = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        return int(raw) if raw else None
+    except ValueError:
+        return None
+
+
+def _audience(user_id, role):
+    """Predicate for the events a user may see: a teacher's own, or those of a student's courses.
+
+    A student's courses are read once, when the stream opens; after enrolling
+    elsewhere the new course's events arrive from the next reconnect.
+    """
+    if role == 'teacher':
+        return lambda event: event['data'].get('teacher_id') == user_id
+    teacher_ids = set(enrollments.teacher_ids(user_id).values_list('teacher_id', flat=True))
+    return lambda event: event['data'].get('teacher_id') in teacher_ids
+
+
+async def _event_stream(subscription, last_event_id):
+    replayed = set()
+    try:
+        yield f"retry: {settings.LIVE_EVENTS_RETRY_MS}\n\n"
+        if last_event_id is not None:
+            for event in await sync_to_async(events_since)(last_event_id):
+                if subscription.wants(event):
+                    replayed.add(event['id'])
+                    yield format_sse(event)
+        while True:
+            try:
+                event = await subscription.get(timeout=settings.LIVE_EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Comment frame keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                break
+            if event['id'] in replayed or (last_event_id is not None and event['id'] <= last_event_id):
+                # Already sent during replay, or before the client reconnected. Ids of different
+                # workers interleave, so this is not a running maximum.
+                continue
+            yield format_sse(event)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@require_http_methods(["GET"])
+async def event_stream(request):
+    """Stream file_published, file_unpublished, unit_created and file_deleted events to a dashboard.
+
+    Students get the events of the teachers they are enrolled with, teachers their own.
+
+    Only served over ASGI: under WSGI Django buffers the whole (endless)
+    response and the stream holds a sync worker until it is killed.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'success': False, 'error': 'Live events need the ASGI server (Project.asgi)'}, status=503)
+    user_id = await request.session.aget('user_id')
+    if not user_id:
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=403)
+
+    predicate = await sync_to_async(_audience)(user_id, await request.session.aget('user_role'))
+    subscription = await sync_to_async(hub.subscribe)(asyncio.get_running_loop(), predicate)
+    response = StreamingHttpResponse(
+        _event_stream(subscription, _parse_last_event_id(request)),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
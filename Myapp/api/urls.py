@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views, stream
 
 urlpatterns = [
     # Authentication endpoints
@@ -7,15 +7,46 @@ urlpatterns = [
     path('auth/csrf/', views.CsrfTokenView.as_view(), name='api_csrf'),
     path('auth/login/', views.LoginView.as_view(), name='api_login'),
     path('auth/logout/', views.LogoutView.as_view(), name='api_logout'),
-    path('auth/me/', views.MeView.as_view(), name='api_me'),
+    path('auth/me/', async_views.me, name='api_me'),
 
     # Teacher and unit endpoints
-    path('teachers/', views.TeachersListView.as_view(), name='api_teachers'),
+    path('teachers/', async_views.teachers_list, name='api_teachers'),
     path('units/create/', views.UnitCreateView.as_view(), name='api_create_unit'),
     path('units/<int:unit_id>/upload/', views.UnitUploadView.as_view(), name='api_unit_upload'),
     path('units/<int:unit_id>/', views.UnitDeleteView.as_view(), name='api_delete_unit'),
     
     # File endpoints
     path('files/publish/', views.FilePublishView.as_view(), name='api_publish_file'),
+    path('files/bulk/', views.FileBulkActionView.as_view(), name='api_bulk_files'),
     path('files/<int:file_id>/', views.FileDeleteView.as_view(), name='api_delete_file'),
+
+    # Full-text search inside documents, indexed by `index_documents`
+    path('search/', views.DocumentSearchView.as_view(), name='api_search'),
+
+    # Most used published files right now, refreshed by `refresh_trending`
+    path('materials/trending/', views.TrendingMaterialsView.as_view(), name='api_trending_materials'),
+
+    # Bulk enroll/unenroll students in the teacher's course
+    path('enrollments/', views.EnrollmentView.as_view(), name='api_enrollments'),
+
+    # Storage used and quotas of the logged-in teacher
+    path('storage/', views.StorageUsageView.as_view(), name='api_storage_usage'),
+
+    # Usage of the teacher's materials, from the hourly/daily rollups
+    path('analytics/', views.AnalyticsView.as_view(), name='api_analytics'),
+
+    # Trash (deleted units/files within the retention window)
+    path('trash/', views.TrashListView.as_view(), name='api_trash'),
+    path('trash/restore/', views.TrashRestoreView.as_view(), name='api_trash_restore'),
+
+    # Bulk student onboarding from a CSV roster
+    path('roster/import/', views.RosterImportView.as_view(), name='api_roster_import'),
+
+    # Live dashboard events (Server-Sent Events)
+    path('events/', stream.event_stream, name='api_events'),
+
+    # Notification endpoints
+    path('notifications/', async_views.notification_feed, name='api_notifications'),
+    path('notifications/unread-count/', views.NotificationUnreadCountView.as_view(), name='api_notifications_unread_count'),
+    path('notifications/read/', views.NotificationMarkReadView.as_view(), name='api_notifications_mark_read'),
 ]
@@ -1,14 +1,27 @@
+import csv
+import io
+import logging
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status, permissions
+from rest_framework import serializers, status, permissions
 from django.contrib.auth import authenticate
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.utils.decorators import method_decorator
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from ..models import UserSignup, CourseUnit, UploadedFile
+from .. import analytics, enrollments, notifications, quotas, roster, search, services, trending
+from ..events import publish_event
+from ..middleware import principal_or_404
+from ..login_guard import HashingBusy, check_login_throttle, verify_password
 from .serializers import UserSerializer, SignupSerializer, CourseUnitSerializer, UploadedFileSerializer
 from django.core.files.storage import default_storage
 
+logger = logging.getLogger(__name__)
+
 
 class SignupView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -17,6 +30,8 @@ class SignupView(APIView):
         serializer = SignupSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
+            if user.role == 'student':
+                notifications.start_cursors([user.id])
             return Response({'success': True, 'user': UserSerializer(user).data}, status=status.HTTP_201_CREATED)
         return Response({'success': False, 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -34,12 +49,30 @@ class LoginView(APIView):
         if not email or not password or not role:
             return Response({'success': False, 'error': 'email, password and role are required'}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Throttle before the user lookup and before any hashing work
+        retry_after = check_login_throttle(request, email)
+        if retry_after:
+            return Response(
+                {'success': False, 'error': 'Too many login attempts, try again later'},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(retry_after)},
+            )
+
         try:
             user = UserSignup.objects.get(email=email, role=role)
         except UserSignup.DoesNotExist:
             return Response({'success': False, 'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        if user.check_password(password):
+        try:
+            password_ok = verify_password(user, password)
+        except HashingBusy as e:
+            return Response(
+                {'success': False, 'error': 'Server busy, try again shortly'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(e.retry_after)},
+            )
+
+        if password_ok:
             # Set session values
             request.session['user_id'] = user.id
             request.session['user_name'] = user.full_name
@@ -55,25 +88,6 @@ class LogoutView(APIView):
         return Response({'success': True})
 
 
-class MeView(APIView):
-    def get(self, request):
-        user_id = request.session.get('user_id')
-        print(f"DEBUG: MeView - user_id from session: {user_id}")  # Debug logging
-        print(f"DEBUG: MeView - all session keys: {list(request.session.keys())}")  # Debug logging
-
-        if not user_id:
-            print("DEBUG: MeView - No user_id in session, returning None")  # Debug logging
-            return Response({'user': None, 'error': 'No user session found'})
-
-        try:
-            user = get_object_or_404(UserSignup, id=user_id)
-            print(f"DEBUG: MeView - Found user: {user.full_name} ({user.email})")  # Debug logging
-            return Response({'user': UserSerializer(user).data})
-        except Exception as e:
-            print(f"DEBUG: MeView - Error retrieving user: {str(e)}")  # Debug logging
-            return Response({'user': None, 'error': f'Error retrieving user: {str(e)}'})
-
-
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.utils.decorators import method_decorator
 
@@ -87,19 +101,6 @@ class CsrfTokenView(APIView):
         return Response({'csrf': 'set'})
 
 
-class TeachersListView(APIView):
-    permission_classes = [permissions.AllowAny]
-
-    def get(self, request):
-        teachers = UserSignup.objects.filter(role='teacher').prefetch_related('course_units__files')
-        data = []
-        for t in teachers:
-            units = CourseUnit.objects.filter(teacher=t).prefetch_related('files')
-            serializer = CourseUnitSerializer(units, many=True)
-            data.append({'teacher': UserSerializer(t).data, 'units': serializer.data})
-        return Response({'teachers': data})
-
-
 class UnitCreateView(APIView):
     def post(self, request):
         user_id = request.session.get('user_id')
@@ -108,10 +109,12 @@ class UnitCreateView(APIView):
         name = request.data.get('name')
         if not name:
             return Response({'success': False, 'error': 'Unit name required'}, status=status.HTTP_400_BAD_REQUEST)
-        teacher = get_object_or_404(UserSignup, id=user_id)
+        teacher = principal_or_404(request)
         if CourseUnit.objects.filter(teacher=teacher, name=name).exists():
             return Response({'success': False, 'error': 'Unit exists'}, status=status.HTTP_400_BAD_REQUEST)
         unit = CourseUnit.objects.create(teacher=teacher, name=name)
+        notifications.record_event(teacher, unit, 'unit_created')
+        publish_event('unit_created', teacher_id=teacher.id, unit_id=unit.id, unit_name=unit.name)
         return Response({'success': True, 'unit': CourseUnitSerializer(unit).data})
 
 
@@ -121,21 +124,23 @@ class UnitUploadView(APIView):
         if not user_id or request.session.get('user_role') != 'teacher':
             return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
         unit = get_object_or_404(CourseUnit, id=unit_id)
+        # Before the body is parsed: stop reading it once the files pass the remaining quota
+        quota_guard = quotas.guard_upload(request, unit.teacher_id, unit.id)
         files = request.FILES.getlist('files')
+        if quota_guard.exceeded:
+            return Response(
+                {'success': False, 'error': 'Storage quota exceeded'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
         tag = request.POST.get('tag', 'study_material')
         uploaded = []
-        for f in files:
-            file_record = UploadedFile.objects.create(
-                teacher=unit.teacher,
-                unit=unit,
-                original_name=f.name,
-                file=f,
-                file_size=f.size,
-                file_type=f.content_type,
-                tag=tag,
-                is_published=False
+        try:
+            for f in files:
+                file_record = services.store_upload(unit.teacher, unit, f, tag)
+                uploaded.append(UploadedFileSerializer(file_record).data)
+        except quotas.QuotaExceeded as e:
+            return Response(
+                {'success': False, 'error': str(e), 'files': uploaded}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
             )
-            uploaded.append(UploadedFileSerializer(file_record).data)
         return Response({'success': True, 'files': uploaded})
 
 
@@ -145,14 +150,11 @@ class UnitDeleteView(APIView):
         if not user_id or request.session.get('user_role') != 'teacher':
             return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
         
-        teacher = get_object_or_404(UserSignup, id=user_id)
+        teacher = principal_or_404(request)
         unit = get_object_or_404(CourseUnit, id=unit_id, teacher=teacher)
         
-        # Delete all associated files
-        for file in unit.files.all():
-            file.delete()  # This will also delete the physical file
-        
-        unit.delete()
+        # Tombstone the unit and its files; purge_trash removes the blobs later
+        services.trash_unit(teacher, unit)
         return Response({'success': True, 'message': 'Unit deleted successfully'})
 
 
@@ -163,16 +165,19 @@ class FilePublishView(APIView):
             return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
         
         file_id = request.data.get('file_id')
-        is_published = request.data.get('is_published', True)
-        
         if not file_id:
             return Response({'success': False, 'error': 'file_id required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # Form posts send "false"/"0" as strings; parse them the way the serializers do
+            is_published = serializers.BooleanField().to_internal_value(request.data.get('is_published', True))
+        except serializers.ValidationError:
+            return Response({'success': False, 'error': 'is_published must be true or false'}, status=status.HTTP_400_BAD_REQUEST)
         
-        teacher = get_object_or_404(UserSignup, id=user_id)
+        teacher = principal_or_404(request)
         file_record = get_object_or_404(UploadedFile, id=file_id, teacher=teacher)
         
         file_record.is_published = is_published
-        file_record.save()
+        services.set_published(teacher, UploadedFile.objects.filter(id=file_record.id), file_record.is_published)
         
         return Response({
             'success': True,
@@ -180,14 +185,289 @@ class FilePublishView(APIView):
         })
 
 
+def _parse_schedule_time(value):
+    """Parse an ISO 8601 timestamp from a request; naive values are taken as server time"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise services.BulkActionError(f'Invalid timestamp: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class FileBulkActionView(APIView):
+    """Apply publish/unpublish/set_tag/move/schedule to many files with one UPDATE"""
+
+    def post(self, request):
+        user_id = request.session.get('user_id')
+        if not user_id or request.session.get('user_role') != 'teacher':
+            return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+
+        teacher = principal_or_404(request)
+        action = request.data.get('action')
+        try:
+            file_ids = request.data.get('file_ids')
+            if file_ids is not None and not isinstance(file_ids, list):
+                raise services.BulkActionError('file_ids must be a list')
+            files = services.select_files(
+                teacher,
+                file_ids=[int(i) for i in file_ids] if file_ids else None,
+                unit_id=request.data.get('unit_id'),
+                tag=request.data.get('filter_tag'),
+            )
+            updated = services.run_bulk_action(
+                teacher,
+                action,
+                files,
+                tag=request.data.get('tag'),
+                target_unit_id=request.data.get('target_unit_id'),
+                publish_at=_parse_schedule_time(request.data.get('publish_at')),
+                unpublish_at=_parse_schedule_time(request.data.get('unpublish_at')),
+            )
+        except (services.BulkActionError, TypeError, ValueError) as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'success': True, 'action': action, 'updated': updated})
+
+
 class FileDeleteView(APIView):
     def delete(self, request, file_id):
         user_id = request.session.get('user_id')
         if not user_id or request.session.get('user_role') != 'teacher':
             return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
         
-        teacher = get_object_or_404(UserSignup, id=user_id)
+        teacher = principal_or_404(request)
         file_record = get_object_or_404(UploadedFile, id=file_id, teacher=teacher)
         
-        file_record.delete()  # This will also delete the physical file
+        services.trash_files(teacher, UploadedFile.objects.filter(id=file_record.id))
         return Response({'success': True, 'message': 'File deleted successfully'})
+
+
+class TrashListView(APIView):
+    """Units and files the teacher deleted that can still be restored"""
+
+    def get(self, request):
+        user_id = request.session.get('user_id')
+        if not user_id or request.session.get('user_role') != 'teacher':
+            return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+
+        cutoff = services.trash_cutoff()
+        units = CourseUnit.all_objects.filter(teacher_id=user_id, deleted_at__gte=cutoff).order_by('-deleted_at')
+        files = UploadedFile.all_objects.filter(teacher_id=user_id, deleted_at__gte=cutoff).order_by('-deleted_at')
+        return Response({
+            'units': [{'id': u.id, 'name': u.name, 'deleted_at': u.deleted_at} for u in units],
+            'files': [
+                {'id': f.id, 'name': f.original_name, 'unit_id': f.unit_id, 'deleted_at': f.deleted_at}
+                for f in files
+            ],
+            'retention_days': settings.TRASH_RETENTION_DAYS,
+        })
+
+
+class TrashRestoreView(APIView):
+    def post(self, request):
+        user_id = request.session.get('user_id')
+        if not user_id or request.session.get('user_role') != 'teacher':
+            return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+
+        teacher = principal_or_404(request)
+        try:
+            if request.data.get('unit_id') is not None:
+                restored = services.restore_unit(teacher, int(request.data['unit_id']))
+            else:
+                file_ids = request.data.get('file_ids')
+                if not isinstance(file_ids, list) or not file_ids:
+                    raise services.BulkActionError('unit_id or file_ids required')
+                restored = services.restore_files(teacher, [int(i) for i in file_ids])
+        except (services.BulkActionError, TypeError, ValueError) as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'success': True, 'restored_files': restored})
+
+
+class RosterImportView(APIView):
+    """Create student accounts from an uploaded CSV roster of at most ``ROSTER_API_MAX_ROWS`` rows,
+    enrolled in the logged-in teacher's course"""
+
+    def post(self, request):
+        user_id = request.session.get('user_id')
+        if not user_id or request.session.get('user_role') != 'teacher':
+            return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'success': False, 'error': 'A CSV file is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = roster.import_roster(
+                io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''),
+                default_password=request.data.get('default_password') or None,
+                max_rows=settings.ROSTER_API_MAX_ROWS,
+                teacher_id=user_id,
+            )
+        except (roster.RosterError, UnicodeDecodeError, csv.Error) as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'success': True,
+            'created': result.created,
+            'errors': [{'line': line, 'email': email, 'error': message} for line, email, message in result.errors],
+        })
+
+
+class EnrollmentView(APIView):
+    """Bulk enroll or unenroll students in the logged-in teacher's course.
+
+    ``{"action": "enroll"|"unenroll", "student_ids": [...], "emails": [...]}``;
+    ids and emails that match no student are returned in ``not_found``.
+    """
+    MAX_STUDENTS = 10000
+
+    def post(self, request):
+        user_id = request.session.get('user_id')
+        if not user_id or request.session.get('user_role') != 'teacher':
+            return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+
+        action = request.data.get('action')
+        if action not in ('enroll', 'unenroll'):
+            return Response({'success': False, 'error': 'action must be enroll or unenroll'}, status=status.HTTP_400_BAD_REQUEST)
+        student_ids = request.data.get('student_ids') or []
+        emails = request.data.get('emails') or []
+        try:
+            if not isinstance(student_ids, list) or not isinstance(emails, list):
+                raise ValueError('student_ids and emails must be lists')
+            student_ids = [int(i) for i in student_ids]
+            emails = [str(email) for email in emails]
+        except (TypeError, ValueError) as e:
+            return Response({'success': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not student_ids and not emails:
+            return Response({'success': False, 'error': 'student_ids or emails required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(student_ids) + len(emails) > self.MAX_STUDENTS:
+            return Response(
+                {'success': False, 'error': f'At most {self.MAX_STUDENTS} students per request'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        found, unknown_emails = enrollments.resolve_students(student_ids, emails)
+        change = enrollments.enroll if action == 'enroll' else enrollments.unenroll
+        count = change(user_id, found)
+        return Response({
+            'success': True,
+            f'{action}ed': count,
+            'not_found': sorted({i for i in student_ids if i not in found}) + unknown_emails,
+        })
+
+
+class StorageUsageView(APIView):
+    def get(self, request):
+        user_id = request.session.get('user_id')
+        if not user_id or request.session.get('user_role') != 'teacher':
+            return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+        return Response({'success': True, 'usage': quotas.usage(user_id)})
+
+
+class AnalyticsView(APIView):
+    """Downloads, previews, unique students and bytes served of the teacher's materials, from the rollups.
+
+    ``?period=hour|day`` (default day), ``?last=`` periods (default 48 hours
+    or 30 days), and ``?unit=``/``?file=`` to narrow it to one unit or file.
+    """
+    DEFAULT_LAST = {'hour': 48, 'day': 30}
+    MAX_LAST = {'hour': 24 * 31, 'day': 366}
+
+    def get(self, request):
+        user_id = request.session.get('user_id')
+        if not user_id or request.session.get('user_role') != 'teacher':
+            return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+
+        period = request.query_params.get('period', 'day')
+        if period not in self.DEFAULT_LAST:
+            return Response({'success': False, 'error': 'period must be hour or day'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            last = int(request.query_params.get('last', self.DEFAULT_LAST[period]))
+            unit_id = int(request.query_params['unit']) if 'unit' in request.query_params else None
+            file_id = int(request.query_params['file']) if 'file' in request.query_params else None
+        except ValueError:
+            return Response({'success': False, 'error': 'last, unit and file must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= last <= self.MAX_LAST[period]:
+            return Response(
+                {'success': False, 'error': f'last must be between 1 and {self.MAX_LAST[period]}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        since = analytics.window_start(period, last)
+        # Rollups carry the teacher, so another teacher's unit or file just comes back empty
+        usage = analytics.teacher_usage(user_id, period, since, unit_id=unit_id, file_id=file_id)
+        return Response({'success': True, 'period': period, 'since': since, **usage})
+
+
+class TrendingMaterialsView(APIView):
+    """Published files classmates are using right now in the student's courses (a teacher's: their own),
+    overall or for one subject (``?subject=``)"""
+
+    def get(self, request):
+        user_id = request.session.get('user_id')
+        if not user_id:
+            return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+
+        if request.session.get('user_role') == 'teacher':
+            teacher_ids = [user_id]
+        else:
+            teacher_ids = list(enrollments.teacher_ids(user_id).values_list('teacher_id', flat=True))
+        subject = request.query_params.get('subject')
+        computed_at, materials = trending.materials(teacher_ids, subject=subject or None)
+        return Response({'success': True, 'subject': subject, 'computed_at': computed_at, 'materials': materials})
+
+
+class DocumentSearchView(APIView):
+    """Search inside documents: students the published files of their courses, teachers their own.
+
+    ``?q=`` takes words, ``"quoted phrases"`` and ``prefix*`` terms; ``?limit=`` up to 50 (default 20).
+    """
+
+    def get(self, request):
+        user_id = request.session.get('user_id')
+        if not user_id:
+            return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'success': False, 'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+        except ValueError:
+            return Response({'success': False, 'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.session.get('user_role') == 'teacher':
+            results = search.search(query, teacher_id=user_id, limit=limit)
+        else:
+            results = search.search(query, student_id=user_id, limit=limit)
+        return Response({'success': True, 'query': query, 'results': results})
+
+
+class NotificationUnreadCountView(APIView):
+    def get(self, request):
+        user_id = request.session.get('user_id')
+        if not user_id or request.session.get('user_role') != 'student':
+            return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+        return Response({'unread_count': notifications.get_unread_count(user_id)})
+
+
+class NotificationMarkReadView(APIView):
+    def post(self, request):
+        user_id = request.session.get('user_id')
+        if not user_id or request.session.get('user_role') != 'student':
+            return Response({'success': False, 'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+
+        if request.data.get('all'):
+            notifications.mark_all_read(user_id)
+        else:
+            try:
+                up_to = int(request.data.get('up_to'))
+            except (TypeError, ValueError):
+                return Response({'success': False, 'error': 'up_to event id or all=true required'}, status=status.HTTP_400_BAD_REQUEST)
+            notifications.mark_read(user_id, up_to)
+
+        return Response({
+            'success': True,
+            'unread_count': notifications.get_unread_count(user_id),
+        })
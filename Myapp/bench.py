@@ -0,0 +1,255 @@
+"""Helpers shared by the benchmark management commands.
+
+Requests go through ``django.test.Client``, i.e. the full middleware stack
+and real views, in-process and without any external services.
+:func:`run_http` instead drives a real server over HTTP.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import Client
+
+from .models import CourseUnit, Enrollment, NotificationCursor, NotificationEvent, UploadedFile, UserSignup
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, statuses=None):
+    """Throughput and latency percentiles (milliseconds) for one scenario"""
+    ordered = sorted(latencies)
+    summary = {
+        'requests': len(ordered),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+    if statuses is not None:
+        summary['statuses'] = {str(code): count for code, count in sorted(statuses.items(), key=lambda item: str(item[0]))}
+    return summary
+
+
+def new_client():
+    """Test client that reports view errors as 500 responses instead of raising them"""
+    return Client(raise_request_exception=False)
+
+
+def run_concurrently(request_fn, total, concurrency, client_factory=new_client):
+    """Call ``request_fn(client, i)`` ``total`` times across ``concurrency`` threads.
+
+    Each thread gets its own client (and, through Django, its own DB
+    connection). Returns the scenario summary.
+    """
+    local = threading.local()
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def one(i):
+        if not hasattr(local, 'client'):
+            local.client = client_factory()
+        start = time.perf_counter()
+        response = request_fn(local.client, i)
+        took = time.perf_counter() - start
+        with lock:
+            latencies.append(took)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(one, i) for i in range(total)]
+        for future in futures:
+            future.result()
+    return summarize(latencies, time.perf_counter() - started, statuses)
+
+
+async def _http_get(host, port, path, cookies, timeout):
+    """Status code of one ``GET`` over a fresh connection"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        cookie = '; '.join(f'{name}={value}' for name, value in cookies.items())
+        head = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n'
+        if cookie:
+            head += f'Cookie: {cookie}\r\n'
+        writer.write((head + '\r\n').encode('latin-1'))
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        # Read the rest so the server is not cut off mid-response
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+def run_http(host, port, request_fn, total, concurrency, timeout=30.0):
+    """Send ``total`` GETs to a running server, ``concurrency`` connections at a time.
+
+    ``request_fn(i)`` returns ``(path, cookies)`` for request ``i``. A
+    refused, reset or timed-out connection is counted under status ``error``.
+    Returns the scenario summary.
+    """
+    async def main():
+        latencies = []
+        statuses = Counter()
+        pending = iter(range(total))
+
+        async def connection():
+            for i in pending:
+                path, cookies = request_fn(i)
+                start = time.perf_counter()
+                try:
+                    code = await _http_get(host, port, path, cookies, timeout)
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                    code = 'error'
+                latencies.append(time.perf_counter() - start)
+                statuses[code] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connection() for _ in range(concurrency)))
+        return summarize(latencies, time.perf_counter() - started, statuses)
+
+    return asyncio.run(main())
+
+
+SEED_PASSWORD = 'seed-password'
+SEED_DOMAIN = 'example.invalid'
+SEED_FILE_TYPES = (
+    ('pdf', 'application/pdf'),
+    ('docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    ('pptx', 'application/vnd.openxmlformats-officedocument.presentationml.presentation'),
+    ('txt', 'text/plain'),
+)
+
+
+def seed_email(prefix, role, i):
+    return f'{prefix}-{role}-{i}@{SEED_DOMAIN}'
+
+
+def seeded_users(prefix):
+    return UserSignup.objects.filter(email__startswith=f'{prefix}-', email__endswith=f'@{SEED_DOMAIN}')
+
+
+def seed_dataset(prefix, teachers, units, files, students, courses=3, blob_size=2048, published_ratio=0.7, seed=0):
+    """Create ``teachers`` x ``units`` x ``files`` with small on-disk blobs, ``students`` and their notification history.
+
+    Each student is enrolled with ``courses`` random teachers, so their
+    catalog, dashboard and feed hold that much content. Everything is bulk inserted; all accounts share one password hash
+    (``SEED_PASSWORD``). Returns counts of the rows created.
+    """
+    rng = random.Random(seed)
+    hashed = make_password(SEED_PASSWORD)
+    tags = [value for value, _ in UploadedFile.TAG_CHOICES]
+
+    teacher_rows = UserSignup.objects.bulk_create([
+        UserSignup(full_name=f'Teacher {i}', email=seed_email(prefix, 'teacher', i), password=hashed,
+                   role='teacher', subject=f'Subject {i % 12}', agreed=True)
+        for i in range(teachers)
+    ])
+    unit_rows = CourseUnit.objects.bulk_create(
+        [
+            CourseUnit(teacher=teacher, name=f'Unit {j + 1}', description=f'Seeded unit {j + 1}')
+            for teacher in teacher_rows
+            for j in range(units)
+        ],
+        batch_size=1000,
+    )
+
+    file_rows = []
+    for unit in unit_rows:
+        for k in range(files):
+            extension, content_type = rng.choice(SEED_FILE_TYPES)
+            blob = rng.randbytes(blob_size)
+            name = default_storage.save(
+                f'course_files/seed/{prefix}/{unit.teacher_id}/{unit.id}/file-{k}.{extension}', ContentFile(blob)
+            )
+            row = UploadedFile(
+                teacher_id=unit.teacher_id,
+                unit=unit,
+                original_name=f'Lecture {k + 1}.{extension}',
+                file=name,
+                file_size=blob_size,
+                file_type=content_type,
+                tag=rng.choice(tags),
+                is_published=rng.random() < published_ratio,
+            )
+            # bulk_create skips save(), which fills these
+            row.set_derived_fields()
+            file_rows.append(row)
+    UploadedFile.objects.bulk_create(file_rows, batch_size=1000)
+
+    events = [NotificationEvent(teacher_id=u.teacher_id, unit=u, notification_type='unit_created') for u in unit_rows]
+    events += [
+        NotificationEvent(teacher_id=f.teacher_id, unit=f.unit, file=f, notification_type='file_published')
+        for f in file_rows if f.is_published
+    ]
+    NotificationEvent.objects.bulk_create(events, batch_size=1000, ignore_conflicts=True)
+    last_event_id = NotificationEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    student_rows = UserSignup.objects.bulk_create(
+        [
+            UserSignup(full_name=f'Student {i}', email=seed_email(prefix, 'student', i), password=hashed,
+                       role='student', agreed=True)
+            for i in range(students)
+        ],
+        batch_size=1000,
+    )
+    enrollment_rows = [
+        Enrollment(teacher=teacher, student=student)
+        for student in student_rows
+        for teacher in rng.sample(teacher_rows, min(courses, len(teacher_rows)))
+    ]
+    Enrollment.objects.bulk_create(enrollment_rows, batch_size=1000)
+    # Students are part-way through the feed, so unread counts and feed pages are realistic
+    NotificationCursor.objects.bulk_create(
+        [NotificationCursor(student=s, last_seen_event_id=rng.randint(0, last_event_id)) for s in student_rows],
+        batch_size=1000,
+    )
+    return {
+        'teachers': len(teacher_rows),
+        'units': len(unit_rows),
+        'files': len(file_rows),
+        'students': len(student_rows),
+        'enrollments': len(enrollment_rows),
+        'notification_events': len(events),
+    }
+
+
+def clear_dataset(prefix):
+    """Remove a seeded data set, blobs included; returns the number of accounts removed"""
+    users = seeded_users(prefix)
+    for name in UploadedFile.all_objects.filter(teacher__in=users).values_list('file', flat=True).iterator():
+        default_storage.delete(name)
+    return users.delete()[1].get('Myapp.UserSignup', 0)
+
+
+def create_session(user):
+    """Session key of a new session logged in as ``user`` (created directly, no password hashing)"""
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session['user_id'] = user.id
+    session['user_role'] = user.role
+    session.create()
+    return session.session_key
+
+
+def session_client(user):
+    """A test client already logged in as ``user``"""
+    client = new_client()
+    client.cookies[settings.SESSION_COOKIE_NAME] = create_session(user)
+    return client
@@ -0,0 +1,110 @@
+"""Send read queries of web requests to read replicas.
+
+Replicas are the aliases in ``settings.DATABASE_REPLICAS`` (configured from
+``DATABASE_REPLICA_URLS``). A request reads from one replica, chosen once per
+request, unless it is pinned to the primary:
+
+- requests with an unsafe method (POST, PUT, PATCH, DELETE) read from the primary;
+- once a request writes, its remaining reads go to the primary, and the
+  response sets a cookie that keeps the client on the primary for
+  ``REPLICA_STICKY_SECONDS``, so users see their own uploads and publishes
+  despite replication lag;
+- sessions always use the primary.
+
+A replica that cannot be connected to is skipped for ``REPLICA_RETRY_SECONDS``
+and its reads go to the next replica or the primary. Queries outside a
+request (management commands, the scheduler) always use the primary.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Set by ReplicaPinMiddleware for the request being served
+_request_state = contextvars.ContextVar('db_request_state', default=None)
+
+# Cookie holding the time (epoch seconds) until which the client reads from the primary
+PIN_COOKIE = 'db_pin'
+
+_down_until = {}  # replica alias -> monotonic time it may be retried
+_down_lock = threading.Lock()
+
+
+class RequestState:
+    """Routing state of one request"""
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+def start_request(pinned):
+    """Begin routing a request; returns the token for :func:`end_request`"""
+    return _request_state.set(RequestState(pinned))
+
+
+def end_request(token):
+    """Routing state of the finished request"""
+    state = _request_state.get()
+    _request_state.reset(token)
+    return state
+
+
+def pin_active(cookie_value, now=None):
+    """Whether a ``PIN_COOKIE`` value still pins the client to the primary"""
+    try:
+        return float(cookie_value) > (now or time.time())
+    except (TypeError, ValueError):
+        return False
+
+
+def _available(alias):
+    """Connect to a replica, marking it down for a while if that fails"""
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+        return True
+    except DatabaseError:
+        with _down_lock:
+            _down_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        logger.warning("Replica %s unavailable; reading from the primary", alias, exc_info=True)
+        return False
+
+
+def _is_session(model):
+    return model._meta.app_label == 'sessions'
+
+
+class PrimaryReplicaRouter:
+    """Reads of pinned-free requests go to a replica; everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or state.pinned or state.wrote or not settings.DATABASE_REPLICAS or _is_session(model):
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            replicas = list(settings.DATABASE_REPLICAS)
+            random.shuffle(replicas)
+            state.replica = next((alias for alias in replicas if _available(alias)), DEFAULT_DB_ALIAS)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and not _is_session(model):
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -0,0 +1,107 @@
+"""Download and preview events, buffered in memory and written in batches.
+
+``record()`` runs on the request path and only appends to a bounded ring
+buffer in this worker. A flusher thread writes the buffer with one
+``bulk_create`` every ``DOWNLOAD_EVENTS_FLUSH_INTERVAL`` seconds, or sooner
+once ``DOWNLOAD_EVENTS_BATCH_SIZE`` events are waiting, and whatever is left
+is written when the worker exits. If the database falls behind and the buffer
+fills, the oldest events are overwritten and counted in ``dropped`` instead of
+making requests wait, so the table is a close lower bound of real traffic,
+not an audit log. A worker that is killed loses its unflushed events.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import DownloadEvent
+
+logger = logging.getLogger(__name__)
+
+
+class Recorder:
+    """Per-process buffer of (file_id, student_id, kind, time) tuples and the thread that writes them.
+
+    Sizes default to the ``DOWNLOAD_EVENTS_*`` settings. The buffer and thread
+    are (re)created lazily in each process, so it also works after a pre-fork
+    server forks its workers.
+    """
+
+    def __init__(self, capacity=None, batch_size=None, interval=None):
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._reported = 0
+        self._lock = threading.Lock()
+        self._buffer = deque()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def record(self, file_id, student_id, kind):
+        """Queue one event; never touches the database and never blocks on it"""
+        if not settings.DOWNLOAD_EVENTS_ENABLED:
+            return
+        event = (file_id, student_id, kind, timezone.now())
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _start(self):
+        # Events buffered by a parent process are the parent's to write; start empty
+        self.capacity = self.capacity or settings.DOWNLOAD_EVENTS_BUFFER_SIZE
+        self.batch_size = self.batch_size or settings.DOWNLOAD_EVENTS_BATCH_SIZE
+        self.interval = self.interval or settings.DOWNLOAD_EVENTS_FLUSH_INTERVAL
+        self._buffer = deque(maxlen=self.capacity)
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name='download-events-flusher', daemon=True).start()
+        atexit.register(self.flush)
+        self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Download events flush failed")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of events written"""
+        with self._lock:
+            events = list(self._buffer)
+            self._buffer.clear()
+            dropped, self._reported = self.dropped - self._reported, self.dropped
+        if dropped:
+            logger.warning("Download events buffer full: dropped %d events", dropped)
+        if not events:
+            return 0
+        DownloadEvent.objects.bulk_create(
+            [
+                DownloadEvent(file_id=file_id, student_id=student_id, kind=kind, created_at=created_at)
+                for file_id, student_id, kind, created_at in events
+            ],
+            batch_size=self.batch_size,
+        )
+        return len(events)
+
+
+recorder = Recorder()
+
+
+def record(file_id, student_id, kind):
+    recorder.record(file_id, student_id, kind)
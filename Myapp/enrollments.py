@@ -0,0 +1,45 @@
+"""Course enrollments: which students take which teacher's course.
+
+A student's catalog, notification feed and notification emails cover only
+the teachers they are enrolled with, so their cost follows one student's
+courses rather than the size of the institution. Enrolling and unenrolling
+are set-based: one query to resolve the students, one or two to write.
+"""
+from django.db.models import Q
+
+from . import notifications
+from .models import Enrollment, UserSignup
+
+
+def teacher_ids(student_id):
+    """Subquery of the teachers a student is enrolled with, for ``teacher_id__in=`` filters"""
+    return Enrollment.objects.filter(student_id=student_id).values('teacher_id')
+
+
+def resolve_students(student_ids=(), emails=()):
+    """(ids of the student accounts matching ``student_ids`` or ``emails``, emails that matched none)"""
+    emails = {email.strip() for email in emails if email.strip()}
+    if not student_ids and not emails:
+        return set(), []
+    rows = UserSignup.objects.filter(Q(id__in=student_ids) | Q(email__in=emails), role='student').values_list('id', 'email')
+    found = dict(rows)
+    return set(found), sorted(emails - set(found.values()))
+
+
+def enroll(teacher_id, student_ids):
+    """Enroll students in the teacher's course; returns how many were not enrolled before"""
+    existing = set(
+        Enrollment.objects.filter(teacher_id=teacher_id, student_id__in=student_ids).values_list('student_id', flat=True)
+    )
+    new = [Enrollment(teacher_id=teacher_id, student_id=student_id) for student_id in set(student_ids) - existing]
+    # A concurrent enroll of the same student is not an error
+    Enrollment.objects.bulk_create(new, batch_size=1000, ignore_conflicts=True)
+    notifications.start_cursors([enrollment.student_id for enrollment in new])
+    return len(new)
+
+
+def unenroll(teacher_id, student_ids):
+    """Remove students from the teacher's course; returns how many were enrolled"""
+    # Nothing references enrollments, so this is a single DELETE
+    deleted, _ = Enrollment.objects.filter(teacher_id=teacher_id, student_id__in=student_ids).delete()
+    return deleted
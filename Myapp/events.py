@@ -0,0 +1,202 @@
+"""Live dashboard events pushed to connected clients over Server-Sent Events.
+
+Views call ``publish_event`` after a write commits. Each process keeps one
+``EventHub`` that fans events out to the asyncio queues of its open streams,
+so an idle dashboard costs one suspended coroutine instead of a poll request.
+With ``LIVE_EVENTS_DB_BRIDGE`` enabled, events are written to the
+``LiveEvent`` table instead and a single poller thread per process dispatches
+rows written by any worker.
+
+Event ids come from ``EventHub.next_id`` in both modes (bridged rows store
+theirs in ``LiveEvent.event_id``), so a ``Last-Event-ID`` means the same thing
+to every worker, whichever mode issued it.
+"""
+import asyncio
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import LiveEvent
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('file_published', 'file_unpublished', 'unit_created', 'file_deleted')
+
+SUBSCRIBER_QUEUE_SIZE = 100
+HISTORY_SIZE = 500
+ID_SLOT_BITS = 10  # Low bits of an event id: the issuing process, so workers never issue the same id
+
+
+class Subscription:
+    """A single open stream: an asyncio queue bound to the loop that created it"""
+
+    def __init__(self, loop, predicate=None):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.predicate = predicate
+        self.closed = False
+
+    def _deliver(self, event):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumer: close the stream and let the client resume with Last-Event-ID
+            self.closed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    def wants(self, event):
+        return self.predicate is None or self.predicate(event)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+
+
+class EventHub:
+    """Thread-safe in-process fan-out with a short replay history"""
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = collections.deque(maxlen=history_size)
+        self._last_id = 0
+        self._poller = None
+
+    def next_id(self):
+        # Millisecond-based ids stay monotonic across restarts, so Last-Event-ID keeps working
+        with self._lock:
+            candidate = int(time.time() * 1000) << ID_SLOT_BITS | os.getpid() % (1 << ID_SLOT_BITS)
+            if candidate <= self._last_id:
+                candidate = self._last_id + (1 << ID_SLOT_BITS)
+            self._last_id = candidate
+            return candidate
+
+    def dispatch(self, event):
+        """Hand an event to every local subscriber; safe to call from any thread"""
+        with self._lock:
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.wants(event):
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+                except RuntimeError:
+                    # The subscriber's loop has already shut down
+                    self.unsubscribe(subscription)
+
+    def subscribe(self, loop, predicate=None):
+        """Register a stream running on ``loop``; call from sync code (it may start the bridge)"""
+        subscription = Subscription(loop, predicate)
+        with self._lock:
+            self._subscribers.add(subscription)
+        if settings.LIVE_EVENTS_DB_BRIDGE:
+            self._ensure_poller()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def replay_since(self, last_event_id):
+        """Events newer than last_event_id from local history (no DB bridge)"""
+        with self._lock:
+            return [event for event in self._history if event['id'] > last_event_id]
+
+    def _ensure_poller(self):
+        with self._lock:
+            if self._poller is not None:
+                return
+            self._poller = DatabaseBridge(self)
+            self._poller.start()
+
+
+class DatabaseBridge(threading.Thread):
+    """Polls LiveEvent for rows written by any worker and dispatches them locally"""
+
+    def __init__(self, hub):
+        super().__init__(name='live-events-bridge', daemon=True)
+        self.hub = hub
+        # Rows are polled in insertion order; their event ids may interleave across workers
+        self.last_pk = LiveEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    def poll(self):
+        """Dispatch the rows written since the last poll"""
+        for row in LiveEvent.objects.filter(id__gt=self.last_pk).order_by('id')[:500]:
+            self.last_pk = row.id
+            self.hub.dispatch(_row_to_event(row))
+
+    def run(self):
+        polls = 0
+        while True:
+            with self.hub._lock:
+                if not self.hub._subscribers:
+                    # Last stream closed; the next subscribe starts a fresh poller
+                    self.hub._poller = None
+                    break
+            try:
+                self.poll()
+                polls += 1
+                if polls % 300 == 0:
+                    prune_live_events()
+            except Exception:
+                logger.exception("Live events bridge poll failed")
+            finally:
+                close_old_connections()
+            time.sleep(settings.LIVE_EVENTS_POLL_INTERVAL)
+        connection.close()
+
+
+def _row_to_event(row):
+    return {'id': row.event_id, 'type': row.event_type, 'data': row.payload}
+
+
+def prune_live_events():
+    """Drop bridged events older than the resume window"""
+    cutoff = timezone.now() - timedelta(seconds=settings.LIVE_EVENTS_RETENTION)
+    return LiveEvent.objects.filter(created_at__lt=cutoff).delete()[0]
+
+
+hub = EventHub()
+
+
+def publish_event(event_type, **data):
+    """Publish a dashboard event once the surrounding transaction commits"""
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"Unknown live event type: {event_type}")
+
+    def _publish():
+        if settings.LIVE_EVENTS_DB_BRIDGE:
+            # The bridge poller dispatches it, in this worker and every other one
+            LiveEvent.objects.create(event_id=hub.next_id(), event_type=event_type, payload=data)
+        else:
+            hub.dispatch({'id': hub.next_id(), 'type': event_type, 'data': data})
+
+    transaction.on_commit(_publish)
+
+
+def events_since(last_event_id):
+    """Events a resuming client missed, oldest first"""
+    if settings.LIVE_EVENTS_DB_BRIDGE:
+        rows = LiveEvent.objects.filter(event_id__gt=last_event_id).order_by('event_id')[:HISTORY_SIZE]
+        return [_row_to_event(row) for row in rows]
+    return hub.replay_since(last_event_id)
+
+
+def format_sse(event):
+    """Serialize an event in text/event-stream framing"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
@@ -0,0 +1,124 @@
+"""Plain text of uploaded documents, one page at a time.
+
+``pages(file_kind, stream)`` yields the text of each page (PDF page, slide,
+or a few thousand characters of a Word or text file) so callers can stop as
+soon as a budget runs out without the whole document ever being in memory.
+DOCX and PPTX are read straight from their zip archives with an incremental
+XML parser; PDFs need ``pypdf``. Legacy ``.doc``/``.ppt`` files and anything
+else raise ``UnsupportedDocument``.
+"""
+import codecs
+import re
+import zipfile
+from xml.etree import ElementTree
+
+PAGE_CHARS = 3000  # Page size for formats without real pages
+READ_CHUNK = 64 * 1024
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DRAWING_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+
+
+class UnsupportedDocument(ValueError):
+    """Raised for files whose text can't be extracted"""
+
+
+def _pdf_pages(stream):
+    from pypdf import PdfReader
+    from pypdf.errors import PdfReadError
+
+    try:
+        reader = PdfReader(stream, strict=False)
+        for page in reader.pages:
+            yield page.extract_text() or ''
+    except PdfReadError as e:
+        raise UnsupportedDocument(f'Unreadable PDF: {e}') from e
+
+
+def _open_zip(stream, kind):
+    try:
+        return zipfile.ZipFile(stream)
+    except zipfile.BadZipFile as e:
+        # .doc/.ppt share the MIME family of their OOXML successors but are not zip archives
+        raise UnsupportedDocument(f'Not a {kind} archive (legacy binary format?)') from e
+
+
+def _word_pages(stream):
+    with _open_zip(stream, 'DOCX') as archive, archive.open('word/document.xml') as xml:
+        page, size = [], 0
+        for _, elem in ElementTree.iterparse(xml):
+            if elem.tag == f'{WORD_NS}t' and elem.text:
+                page.append(elem.text)
+                size += len(elem.text)
+            elif elem.tag == f'{WORD_NS}tab':
+                page.append(' ')
+            elif elem.tag == f'{WORD_NS}br' and elem.get(f'{WORD_NS}type') == 'page' and page:
+                yield ''.join(page)
+                page, size = [], 0
+            elif elem.tag == f'{WORD_NS}p':
+                page.append('\n')
+                # Drop the parsed paragraph; memory stays at one page of text
+                elem.clear()
+                if size >= PAGE_CHARS:
+                    yield ''.join(page)
+                    page, size = [], 0
+        if size:
+            yield ''.join(page)
+
+
+def _slide_number(name):
+    return int(re.search(r'(\d+)\.xml$', name).group(1))
+
+
+def _powerpoint_pages(stream):
+    with _open_zip(stream, 'PPTX') as archive:
+        slides = sorted(
+            (name for name in archive.namelist() if re.fullmatch(r'ppt/slides/slide\d+\.xml', name)), key=_slide_number,
+        )
+        for name in slides:
+            with archive.open(name) as xml:
+                texts = []
+                for _, elem in ElementTree.iterparse(xml):
+                    if elem.tag == f'{DRAWING_NS}t' and elem.text:
+                        texts.append(elem.text)
+                    elif elem.tag == f'{DRAWING_NS}p':
+                        texts.append('\n')
+                        elem.clear()
+                yield ''.join(texts)
+
+
+def _text_pages(stream):
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+    while True:
+        chunk = stream.read(READ_CHUNK)
+        pending += decoder.decode(chunk, final=not chunk)
+        while len(pending) >= PAGE_CHARS:
+            # Break at a line end if there is one, so pages don't split words
+            cut = pending.rfind('\n', 0, PAGE_CHARS) + 1 or PAGE_CHARS
+            yield pending[:cut]
+            pending = pending[cut:]
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+
+EXTRACTORS = {
+    'pdf': _pdf_pages,
+    'word': _word_pages,
+    'powerpoint': _powerpoint_pages,
+    'text': _text_pages,
+}
+
+
+def pages(file_kind, stream):
+    """Text of each page of a seekable binary ``stream`` holding a file of ``file_kind``"""
+    extractor = EXTRACTORS.get(file_kind)
+    if extractor is None:
+        raise UnsupportedDocument(f'No text extractor for {file_kind} files')
+    try:
+        yield from extractor(stream)
+    except (KeyError, ElementTree.ParseError) as e:
+        # Missing document part or malformed XML inside the archive
+        raise UnsupportedDocument(f'Damaged {file_kind} file: {e}') from e
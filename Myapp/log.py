@@ -0,0 +1,168 @@
+"""Structured logging: JSON lines with request context, sampling and a non-blocking queue.
+
+Configured from ``LOGGING`` in settings. Request threads only run the
+filters and put the record on a bounded in-memory queue; formatting and
+writing happen on a listener thread. When the queue is full the record is
+dropped rather than blocking the request; the next record that fits is
+preceded by a warning with the number dropped.
+
+Usage in views::
+
+    logger = logging.getLogger(__name__)
+    logger.info("Files uploaded", extra={'unit_id': unit.id, 'count': n})
+    # Kept with probability 0.01; warnings and errors are never sampled
+    logger.info("Cache miss", extra={'sample_rate': 0.01})
+
+Pass data as ``%s`` arguments or ``extra`` rather than f-strings, so nothing
+is formatted for records that are filtered out.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+# The request being served by this thread/task, for RequestContextFilter
+current_request = contextvars.ContextVar('current_request', default=None)
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+_CONTEXT_ATTRS = {'request_id', 'user_id', 'route', 'sample_rate'}
+
+
+class RequestContextFilter(logging.Filter):
+    """Add request_id, user_id and route of the current request to each record"""
+
+    def filter(self, record):
+        request = current_request.get()
+        if request is None:
+            record.request_id = record.user_id = record.route = None
+            return True
+        record.request_id = getattr(request, 'request_id', None)
+        match = getattr(request, 'resolver_match', None)
+        record.route = (match.url_name or match.view_name) if match else None
+        # Only read the user from a session the view already loaded; never add a session query for logging
+        session = getattr(request, 'session', None)
+        record.user_id = session.get('user_id') if session is not None and session.accessed else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep records that carry ``sample_rate`` with that probability; WARNING and above always pass"""
+
+    def filter(self, record):
+        rate = getattr(record, 'sample_rate', None)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'user_id': getattr(record, 'user_id', None),
+            'route': getattr(record, 'route', None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in _CONTEXT_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full when stopping: wait for room instead of failing
+        self.queue.put(self._sentinel)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to a listener thread that formats and writes them to ``stream``.
+
+    The listener is (re)started lazily in each process, so it also works
+    after a pre-fork server forks its workers.
+    """
+
+    def __init__(self, maxsize=10000, stream=None):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.dropped = 0
+        self._reported = 0
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Merge the arguments and render the traceback now, as the stdlib handler does: by the time
+        # the listener formats the record, mutable arguments may have changed and the frames moved on.
+        # The JSON layout itself is still built on the listener thread.
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = (self.target.formatter or logging.Formatter()).formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start_listener()
+        try:
+            if self.dropped != self._reported:
+                with self._lock:
+                    if self.dropped != self._reported:
+                        self._report_dropped()
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _report_dropped(self):
+        dropped = self.dropped
+        self.queue.put_nowait(self.prepare(logging.makeLogRecord({
+            'name': __name__,
+            'levelno': logging.WARNING,
+            'levelname': logging.getLevelName(logging.WARNING),
+            'msg': "Log queue full: dropped %d records",
+            'args': (dropped - self._reported,),
+        })))
+        self._reported = dropped
+
+    def _start_listener(self):
+        # A listener inherited from a parent process has no thread here; start afresh
+        self.queue = queue.Queue(self.queue.maxsize)
+        self._listener = _QueueListener(self.queue, self.target)
+        self._listener.start()
+        atexit.register(self.close)
+        self._pid = os.getpid()
+
+    def close(self):
+        """Write out everything queued and stop this process's listener"""
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = self._pid = None
+        super().close()
@@ -0,0 +1,91 @@
+"""Protects worker CPU from password hashing during login storms.
+
+Every login attempt first spends a token from a per-IP bucket and then one
+from a bucket for that IP and email, before any hashing or user lookup
+happens. Keying the email bucket on the IP too means failed guesses only
+lock the guesser out of an account, not its owner. Verification then runs on
+a small shared thread pool (PBKDF2 in hashlib releases the GIL) with a cap
+on queued work; when the pool is saturated the attempt is rejected at once
+instead of piling more hashing onto an overloaded worker.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class HashingBusy(Exception):
+    """Raised when the password hashing pool is full; callers should answer 503"""
+    retry_after = 1
+
+
+class TokenBucket:
+    """Cache-backed token bucket.
+
+    The read-modify-write is not atomic across workers, so a burst can
+    overshoot by a few tokens; that is acceptable for throttling logins.
+    """
+
+    def __init__(self, prefix, capacity, per_minute):
+        self.prefix = prefix
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+
+    def consume(self, key, now=None):
+        """Take one token; returns 0 when allowed, otherwise seconds until a token is available"""
+        now = now or time.time()
+        cache_key = f"throttle:{self.prefix}:{key}"
+        tokens, updated = cache.get(cache_key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            cache.set(cache_key, (tokens, now), self.ttl)
+            return (1 - tokens) / self.rate
+        cache.set(cache_key, (tokens - 1, now), self.ttl)
+        return 0
+
+    @property
+    def ttl(self):
+        # Long enough for an empty bucket to refill completely
+        return int(self.capacity / self.rate) + 1
+
+
+def client_ip(request):
+    if settings.LOGIN_THROTTLE_TRUST_X_FORWARDED_FOR:
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_login_throttle(request, email):
+    """Return 0 if this attempt may proceed, otherwise a Retry-After in whole seconds"""
+    ip_bucket = TokenBucket('login-ip', settings.LOGIN_THROTTLE_IP_BURST, settings.LOGIN_THROTTLE_IP_PER_MINUTE)
+    email_bucket = TokenBucket('login-email', settings.LOGIN_THROTTLE_EMAIL_BURST, settings.LOGIN_THROTTLE_EMAIL_PER_MINUTE)
+    ip = client_ip(request)
+    # A throttled IP doesn't spend its per-email tokens
+    wait = ip_bucket.consume(ip) or email_bucket.consume(f"{ip}:{(email or '').strip().lower()}")
+    return int(wait) + 1 if wait else 0
+
+
+_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+# Running plus queued verifications allowed at once
+_slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_DEPTH)
+
+
+def verify_password(user, raw_password):
+    """Check a password on the bounded hashing pool; raises HashingBusy when saturated"""
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = _executor.submit(user.check_password, raw_password)
+    except Exception:
+        _slots.release()
+        raise
+    # Free the slot when the hash finishes, even if the caller stopped waiting
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=settings.PASSWORD_HASH_TIMEOUT)
+    except FutureTimeout:
+        raise HashingBusy()
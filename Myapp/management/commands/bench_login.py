@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from Myapp.bench import run_concurrently
+from Myapp.models import UserSignup
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login throughput under concurrency, and catalog (/api/v1/teachers/) latency "
+        "on its own and during a login storm. Creates temporary bench users and removes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--logins', type=int, default=60, help='Login attempts in the storm')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--catalog-requests', type=int, default=100)
+        parser.add_argument('--shared-ip', action='store_true', help='Send every login from one address (classroom NAT)')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        run_id = int(time.time())
+        password = 'bench-password'
+        # Hash once and reuse it, so setup does not dominate the run
+        hashed = make_password(password)
+        users = UserSignup.objects.bulk_create([
+            UserSignup(
+                full_name=f'Bench Student {i}',
+                email=f'bench-login-{run_id}-{i}@example.invalid',
+                password=hashed,
+                role='student',
+            )
+            for i in range(options['users'])
+        ])
+        emails = [u.email for u in users]
+
+        def login(client, i):
+            ip = '10.0.0.1' if options['shared_ip'] else f'10.0.{i // 250}.{i % 250 + 1}'
+            return client.post(
+                '/api/v1/auth/login/',
+                {'email': emails[i % len(emails)], 'password': password, 'role': 'student'},
+                content_type='application/json',
+                REMOTE_ADDR=ip,
+            )
+
+        def catalog(client, i):
+            return client.get('/api/v1/teachers/')
+
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                report = {
+                    'catalog_baseline': run_concurrently(catalog, options['catalog_requests'], options['concurrency']),
+                }
+                storm = {}
+                storm_thread = threading.Thread(
+                    target=lambda: storm.update(run_concurrently(login, options['logins'], options['concurrency']))
+                )
+                storm_thread.start()
+                report['catalog_during_login_storm'] = run_concurrently(
+                    catalog, options['catalog_requests'], options['concurrency']
+                )
+                storm_thread.join()
+                report['login_storm'] = storm
+        finally:
+            UserSignup.objects.filter(email__in=emails).delete()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output)
+        self.stdout.write(output)
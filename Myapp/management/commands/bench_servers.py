@@ -0,0 +1,145 @@
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Myapp.bench import create_session, run_http, seeded_users
+from Myapp.models import UploadedFile
+
+PROFILES = {
+    # The Procfile deployment: gunicorn's default sync worker, one request at a time
+    'wsgi': ['Project.wsgi:application'],
+    'asgi': ['-c', os.path.join('Project', 'gunicorn_asgi.py'), 'Project.asgi:application'],
+}
+SCENARIOS = ('api_teachers', 'me', 'download')
+HOST = '127.0.0.1'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def capacity(levels, slo_ms):
+    """Highest concurrency whose requests all succeeded with p95 within ``slo_ms``, or 0"""
+    best = 0
+    for level, summary in levels.items():
+        failed = any(code == 'error' or int(code) >= 500 for code in summary['statuses'])
+        if not failed and summary['p95_ms'] <= slo_ms:
+            best = max(best, int(level))
+    return best
+
+
+class Command(BaseCommand):
+    help = (
+        "Start the app under gunicorn with one sync (WSGI) worker and with one uvicorn (ASGI) worker, "
+        "drive the catalog, /auth/me/ and download endpoints at increasing numbers of concurrent "
+        "connections and report throughput, latency and errors per level as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='seed', help='Data set created by seed_scale')
+        parser.add_argument('--profile', action='append', choices=sorted(PROFILES), help='Run only these (repeatable)')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Run only these (repeatable)')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and concurrency level')
+        parser.add_argument('--slo-ms', type=float, default=1000, help='p95 a level must stay within to count as served')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request counts as an error')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        users = seeded_users(options['prefix'])
+        students = list(users.filter(role='student')[:200])
+        published = list(
+            UploadedFile.objects.filter(teacher__in=users, is_published=True).values_list('id', flat=True)[:1000]
+        )
+        if not students or not published:
+            raise CommandError(f"No data set with prefix '{options['prefix']}'; run seed_scale first")
+
+        # The servers share this process's database, so sessions created here are valid there
+        cookies = [{settings.SESSION_COOKIE_NAME: create_session(s)} for s in students]
+        published_ids = itertools.cycle(published)
+        scenarios = {
+            'api_teachers': lambda i: ('/api/v1/teachers/', {}),
+            'me': lambda i: ('/api/v1/auth/me/', random.choice(cookies)),
+            'download': lambda i: (f'/api/download-file/{next(published_ids)}/', random.choice(cookies)),
+        }
+
+        report = {
+            'cpus': os.cpu_count(),
+            'requests': options['requests'],
+            'slo_ms': options['slo_ms'],
+            'profiles': {},
+        }
+        for profile in options['profile'] or sorted(PROFILES, reverse=True):
+            port = free_port()
+            with _Server(profile, port):
+                results = {}
+                for name in options['scenario'] or SCENARIOS:
+                    levels = {}
+                    for level in options['concurrency']:
+                        levels[str(level)] = run_http(
+                            HOST, port, scenarios[name], options['requests'], level, timeout=options['timeout']
+                        )
+                        self.stderr.write(f"{profile} {name} x{level}: {levels[str(level)]}")
+                    results[name] = {'levels': levels, 'capacity': capacity(levels, options['slo_ms'])}
+                report['profiles'][profile] = results
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output)
+        self.stdout.write(output)
+
+
+class _Server:
+    """One gunicorn worker serving ``profile`` on ``port`` for the duration of a ``with`` block"""
+
+    def __init__(self, profile, port):
+        self.profile = profile
+        self.port = port
+
+    def __enter__(self):
+        env = dict(
+            os.environ,
+            DJANGO_ALLOWED_HOSTS=HOST,
+            LOG_LEVEL='WARNING',
+            LOG_ACCESS_SAMPLE_RATE='0',
+        )
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', *PROFILES[self.profile],
+             '--workers', '1', '--bind', f'{HOST}:{self.port}'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=self.log,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                socket.create_connection((HOST, self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.log.seek(0)
+        output = self.log.read().decode(errors='replace')[-2000:]
+        self.__exit__(None, None, None)
+        raise CommandError(f'{self.profile} server did not start:\n{output}')
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
@@ -0,0 +1,137 @@
+import json
+import multiprocessing
+import shutil
+import tempfile
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections, transaction
+
+from Myapp.bench import summarize
+from Myapp.models import CourseUnit, UploadedFile, UserSignup
+
+PROFILES = ('default', 'production')
+
+
+class Command(BaseCommand):
+    help = (
+        "Run catalog-style reader processes next to upload/publish-style writer processes on a scratch "
+        "SQLite file, once with Django's default SQLite settings and once with the SQLITE_PRODUCTION "
+        "profile, and report read and write latency and 'database is locked' errors as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per profile')
+        parser.add_argument('--rows-per-write', type=int, default=50, help='Files created per write transaction')
+        parser.add_argument('--profile', action='append', choices=PROFILES, help='Run only these (repeatable)')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        report = {
+            'readers': options['readers'],
+            'writers': options['writers'],
+            'duration_s': options['duration'],
+            'rows_per_write': options['rows_per_write'],
+            'profiles': {},
+        }
+        for profile in options['profile'] or PROFILES:
+            report['profiles'][profile] = self.run_profile(profile, options)
+            self.stderr.write(f"{profile}: {report['profiles'][profile]}")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output)
+        self.stdout.write(output)
+
+    def run_profile(self, profile, options):
+        alias = f'bench_sqlite_{profile}'
+        directory = tempfile.mkdtemp(prefix='clouded-bench-sqlite-')
+        database = {
+            **connections.settings['default'],
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'{directory}/bench.sqlite3',
+            'OPTIONS': {},
+        }
+        if profile == 'production':
+            database.update(ENGINE='Myapp.sqlite_backend', OPTIONS=dict(settings.SQLITE_PRODUCTION_OPTIONS))
+        connections.settings[alias] = database
+        try:
+            call_command('migrate', database=alias, verbosity=0)
+            return self.run_load(alias, options)
+        finally:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run_load(self, alias, options):
+        teacher = UserSignup.objects.using(alias).create(
+            full_name='Bench Teacher', email='bench-sqlite@example.invalid', password='!', role='teacher'
+        )
+        unit = CourseUnit.objects.using(alias).create(teacher=teacher, name='Bench unit')
+        create_files(alias, teacher.id, unit.id, 500)
+        with connections[alias].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+
+        # Children must open their own connections
+        connections.close_all()
+        deadline = time.time() + options['duration']
+        jobs = [('reads', alias, unit.id, teacher.id, deadline, options['rows_per_write'])] * options['readers']
+        jobs += [('writes', alias, unit.id, teacher.id, deadline, options['rows_per_write'])] * options['writers']
+        started = time.perf_counter()
+        with multiprocessing.get_context('fork').Pool(len(jobs)) as pool:
+            outcomes = pool.starmap(worker, jobs)
+        elapsed = time.perf_counter() - started
+
+        results = {'reads': ([], Counter()), 'writes': ([], Counter())}
+        for (kind, *_), (latencies, statuses) in zip(jobs, outcomes):
+            results[kind][0].extend(latencies)
+            results[kind][1].update(statuses)
+        return {
+            'journal_mode': journal_mode,
+            'reads': summarize(results['reads'][0], elapsed, results['reads'][1]),
+            'writes': summarize(results['writes'][0], elapsed, results['writes'][1]),
+        }
+
+
+def worker(kind, alias, unit_id, teacher_id, deadline, rows_per_write):
+    """One reader or writer process, like a gunicorn worker; returns its latencies and outcomes"""
+    latencies = []
+    statuses = Counter()
+    files = UploadedFile.objects.using(alias).filter(unit_id=unit_id)
+    i = 0
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            if kind == 'reads':
+                list(files.filter(is_published=True).order_by('-id')[:50])
+                files.count()
+            else:
+                with transaction.atomic(using=alias):
+                    create_files(alias, teacher_id, unit_id, rows_per_write)
+                    # Publish/unpublish toggle over a window of the seeded files
+                    files.filter(id__range=(i % 400, i % 400 + 100)).update(is_published=i % 2 == 0)
+            statuses['ok'] += 1
+        except DatabaseError as exc:
+            statuses['locked' if 'locked' in str(exc) else 'error'] += 1
+        latencies.append(time.perf_counter() - started)
+        i += 1
+    connections[alias].close()
+    return latencies, statuses
+
+
+def create_files(alias, teacher_id, unit_id, count):
+    UploadedFile.objects.using(alias).bulk_create([
+        UploadedFile(
+            teacher_id=teacher_id, unit_id=unit_id, original_name=f'bench-{i}.pdf', file=f'course_files/bench/{i}.pdf',
+            file_size=1024, file_type='application/pdf', is_published=i % 2 == 0,
+        )
+        for i in range(count)
+    ])
@@ -0,0 +1,50 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Myapp.models import UserSignup
+from Myapp.roster import BATCH_SIZE, RosterError, default_workers, import_roster
+
+
+class Command(BaseCommand):
+    help = "Create student accounts from a CSV roster (columns: full_name, email[, password, subject])"
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--default-password', help='Password for rows without a password column value')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--workers', type=int, help='Hashing processes (default: ROSTER_HASH_WORKERS or one per CPU)')
+        parser.add_argument('--errors', help='Write rows that were not imported to this CSV file')
+        parser.add_argument('--teacher', help="Email of the teacher whose course the new students are enrolled in")
+
+    def handle(self, *args, **options):
+        teacher_id = None
+        if options['teacher']:
+            teacher_id = (
+                UserSignup.objects.filter(email=options['teacher'], role='teacher').values_list('id', flat=True).first()
+            )
+            if teacher_id is None:
+                raise CommandError(f"No teacher with email {options['teacher']}")
+        try:
+            with open(options['csv_path'], newline='', encoding='utf-8-sig') as fh:
+                result = import_roster(
+                    fh,
+                    default_password=options['default_password'],
+                    batch_size=options['batch_size'],
+                    workers=options['workers'] or default_workers(),
+                    teacher_id=teacher_id,
+                )
+        except (OSError, RosterError) as e:
+            raise CommandError(str(e))
+
+        if options['errors'] and result.errors:
+            with open(options['errors'], 'w', newline='') as fh:
+                writer = csv.writer(fh)
+                writer.writerow(['line', 'email', 'error'])
+                writer.writerows(result.errors)
+        self.stdout.write(f"Created {result.created} student account(s); {len(result.errors)} row(s) skipped")
+        if result.errors and not options['errors']:
+            for line, email, message in result.errors[:20]:
+                self.stdout.write(f"  line {line}: {email or '-'}: {message}")
+            if len(result.errors) > 20:
+                self.stdout.write(f"  ... {len(result.errors) - 20} more (use --errors to write them all)")
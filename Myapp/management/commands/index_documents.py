@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from Myapp.search import index_pending
+
+
+class Command(BaseCommand):
+    help = "Extract the text of uploaded documents that have none yet and add it to the search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--recheck', action='store_true', help='Re-read every file and re-extract those whose content changed')
+        parser.add_argument('--loop', action='store_true', help='Keep running, indexing every --interval seconds')
+        parser.add_argument('--interval', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        while True:
+            result = index_pending(batch_size=options['batch_size'], recheck=options['recheck'])
+            self.stdout.write(
+                f"Indexed {result.indexed} file(s); {result.unchanged} unchanged, {result.failed} failed"
+            )
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
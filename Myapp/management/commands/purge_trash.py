@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from Myapp.trash import BATCH_SIZE, MAX_PURGE_ATTEMPTS, purge_expired, retry_stuck
+
+
+class Command(BaseCommand):
+    help = "Delete blobs and rows of files and units trashed longer than TRASH_RETENTION_DAYS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep running, purging every --interval seconds')
+        parser.add_argument('--interval', type=float, default=3600.0)
+        parser.add_argument(
+            '--retry-stuck', action='store_true',
+            help=f'First reset files that failed {MAX_PURGE_ATTEMPTS} storage deletes, so they are tried again',
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_stuck']:
+            self.stdout.write(f"Retrying {retry_stuck()} stuck file(s)")
+        while True:
+            result = purge_expired(batch_size=options['batch_size'])
+            self.stdout.write(
+                f"Purged {result.files_purged} file(s) and {result.units_purged} unit(s); "
+                f"{result.files_failed} file(s) failed and will be retried"
+            )
+            if result.files_stuck:
+                self.stderr.write(
+                    f"{result.files_stuck} file(s) failed {MAX_PURGE_ATTEMPTS} times and are no longer retried; "
+                    "fix storage and run with --retry-stuck"
+                )
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
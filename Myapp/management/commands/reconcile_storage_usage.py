@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Myapp.quotas import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recompute every teacher's and unit's storage usage counters from their live files"
+
+    def handle(self, *args, **options):
+        corrected = reconcile()
+        self.stdout.write(f"Corrected {corrected} storage usage counter(s)")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from Myapp.trending import refresh
+
+
+class Command(BaseCommand):
+    help = "Add new download/preview events to the trending scores and publish the top materials"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, refreshing every --interval seconds')
+        parser.add_argument('--interval', type=float, default=300.0)
+
+    def handle(self, *args, **options):
+        while True:
+            courses = refresh()
+            materials = sum(len(data['materials']) for data in courses.values())
+            self.stdout.write(f"Trending: {materials} material(s) in {len(courses)} course(s)")
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
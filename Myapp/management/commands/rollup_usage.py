@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from Myapp.analytics import rollup
+
+
+class Command(BaseCommand):
+    help = "Update the hourly and daily usage rollups with the download events added since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, rolling up every --interval seconds')
+        parser.add_argument('--interval', type=float, default=300.0)
+
+    def handle(self, *args, **options):
+        while True:
+            self.stdout.write(f"Rebuilt the usage rollups of {rollup()} day(s)")
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
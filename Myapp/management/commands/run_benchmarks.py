@@ -0,0 +1,132 @@
+import itertools
+import json
+import random
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from Myapp import enrollments
+from Myapp.bench import new_client, run_concurrently, seeded_users, session_client
+from Myapp.models import CourseUnit, UploadedFile
+
+SCENARIOS = ('api_teachers', 'student_dashboard', 'download', 'upload', 'publish')
+
+
+def find_regressions(report, baseline, threshold):
+    """Scenarios whose p95 latency grew, or throughput fell, by more than ``threshold`` (a fraction)"""
+    regressions = []
+    for name, current in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        if before['p95_ms'] and current['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {current['p95_ms']}ms")
+        if before['throughput_rps'] and current['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {current['throughput_rps']} req/s")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the real endpoints concurrently against a seed_scale data set (in-process, no external "
+        "services) and report throughput and p50/p95/p99 latency as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='seed', help='Data set created by seed_scale')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Run only these (repeatable)')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Baseline report to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed regression, as a fraction (default 0.2)')
+
+    def handle(self, *args, **options):
+        users = seeded_users(options['prefix'])
+        teacher = users.filter(role='teacher').order_by('id').first()
+        students = list(users.filter(role='student'))
+        published = list(
+            UploadedFile.objects.filter(teacher__in=users, is_published=True).values_list('id', flat=True)[:1000]
+        )
+        if teacher is None or not students or not published:
+            raise CommandError(f"No data set with prefix '{options['prefix']}'; run seed_scale first")
+
+        # Uploads and publish toggles go to a scratch unit that is removed afterwards
+        scratch_unit = CourseUnit.objects.create(teacher=teacher, name=f"Benchmark scratch {random.getrandbits(32):08x}")
+
+        def as_student():
+            return session_client(random.choice(students))
+
+        def as_downloading_student():
+            # Students can only download the published files of their own courses
+            student = random.choice(students)
+            client = session_client(student)
+            visible = list(
+                UploadedFile.objects.filter(is_published=True, teacher_id__in=enrollments.teacher_ids(student.id))
+                .values_list('id', flat=True)[:1000]
+            )
+            client.file_ids = itertools.cycle(visible or published)
+            return client
+
+        def as_teacher():
+            return session_client(teacher)
+
+        scenarios = {
+            'api_teachers': (lambda client, i: client.get('/api/v1/teachers/'), new_client),
+            'student_dashboard': (lambda client, i: client.get('/student-dashboard/'), as_student),
+            'download': (lambda client, i: client.get(f'/api/download-file/{next(client.file_ids)}/'), as_downloading_student),
+            'upload': (
+                lambda client, i: client.post(
+                    f'/api/v1/units/{scratch_unit.id}/upload/',
+                    {'files': [SimpleUploadedFile(f'bench-{i}.txt', b'x' * 2048, 'text/plain')]},
+                ),
+                as_teacher,
+            ),
+            'publish': (
+                lambda client, i: client.post(
+                    '/api/v1/files/bulk/',
+                    {'action': 'publish' if i % 2 == 0 else 'unpublish', 'unit_id': scratch_unit.id},
+                    content_type='application/json',
+                ),
+                as_teacher,
+            ),
+        }
+
+        report = {
+            'dataset': {
+                'prefix': options['prefix'],
+                'teachers': users.filter(role='teacher').count(),
+                'students': len(students),
+                'files': UploadedFile.objects.filter(teacher__in=users).count(),
+            },
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'scenarios': {},
+        }
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for name in options['scenario'] or SCENARIOS:
+                    request_fn, client_factory = scenarios[name]
+                    report['scenarios'][name] = run_concurrently(
+                        request_fn, options['requests'], options['concurrency'], client_factory=client_factory
+                    )
+                    self.stderr.write(f"{name}: {report['scenarios'][name]}")
+        finally:
+            for file_record in UploadedFile.all_objects.filter(unit=scratch_unit):
+                file_record.delete()
+            CourseUnit.all_objects.filter(id=scratch_unit.id).delete()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output)
+        self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as fh:
+                baseline = json.load(fh)
+            regressions = find_regressions(report, baseline, options['threshold'])
+            if regressions:
+                raise CommandError('Regressions against baseline:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(f"No regressions against {options['compare']} (threshold {options['threshold']:.0%})")
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from Myapp.scheduler import next_due_at, run_due
+
+
+class Command(BaseCommand):
+    help = "Publish and unpublish files whose publish_at/unpublish_at time has arrived"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Apply due schedules once and exit')
+        parser.add_argument(
+            '--max-sleep',
+            type=float,
+            default=60.0,
+            help='Upper bound in seconds on each sleep, so schedules added meanwhile are picked up',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            published, unpublished = run_due()
+            if published or unpublished:
+                self.stdout.write(f"Published {published} file(s), unpublished {unpublished} file(s)")
+            if options['once']:
+                return
+
+            # Sleep until the next due item instead of polling the table on a fixed tick
+            due = next_due_at()
+            close_old_connections()
+            delay = options['max_sleep']
+            if due is not None:
+                delay = min(delay, max((due - timezone.now()).total_seconds(), 0))
+            time.sleep(delay)
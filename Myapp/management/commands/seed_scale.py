@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Myapp.bench import SEED_PASSWORD, clear_dataset, seed_dataset, seeded_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic data set for benchmarks: N teachers x M units x K files with small "
+        "on-disk blobs, S students enrolled in C courses each and notification history. Accounts use "
+        "@example.invalid emails."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teachers', type=int, default=20)
+        parser.add_argument('--units', type=int, default=5, help='Units per teacher')
+        parser.add_argument('--files', type=int, default=10, help='Files per unit')
+        parser.add_argument('--students', type=int, default=500)
+        parser.add_argument('--courses', type=int, default=3, help="Teachers' courses each student is enrolled in")
+        parser.add_argument('--blob-size', type=int, default=2048, help='Bytes per generated file')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible data sets')
+        parser.add_argument('--prefix', default='seed', help='Email prefix identifying this data set')
+        parser.add_argument('--clear', action='store_true', help='Remove the data set with this prefix first')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['clear']:
+            removed = clear_dataset(prefix)
+            self.stdout.write(f"Removed {removed} seeded account(s) with prefix '{prefix}'")
+        elif seeded_users(prefix).exists():
+            raise CommandError(f"A data set with prefix '{prefix}' already exists; use --clear to replace it")
+
+        counts = seed_dataset(
+            prefix,
+            teachers=options['teachers'],
+            units=options['units'],
+            files=options['files'],
+            students=options['students'],
+            courses=options['courses'],
+            blob_size=options['blob_size'],
+            seed=options['seed'],
+        )
+        self.stdout.write(
+            "Created {teachers} teacher(s), {units} unit(s), {files} file(s), {students} student(s), "
+            "{enrollments} enrollment(s) and {notification_events} notification event(s)".format(**counts)
+        )
+        self.stdout.write(f"All seeded accounts use the password '{SEED_PASSWORD}'")
@@ -0,0 +1,35 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions in small batches so the sweep never holds a long lock on django_session"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='Keep running, sweeping every --interval seconds')
+        parser.add_argument('--interval', type=float, default=3600.0)
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = self.sweep(options['batch_size'])
+            self.stdout.write(f"Deleted {deleted} expired session(s)")
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def sweep(self, batch_size):
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(
+                Session.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:batch_size]
+            )
+            if not keys:
+                return deleted
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
@@ -0,0 +1,205 @@
+"""Per-endpoint request metrics in Prometheus text format.
+
+Each worker process aggregates in memory, keyed by resolved URL name, and
+every ``METRICS_FLUSH_INTERVAL`` seconds writes its cumulative totals to its
+own JSON file in ``METRICS_DIR``. The ``/metrics`` endpoint sums the files of
+all workers, so any worker can answer a scrape.
+
+When a worker exits, the gunicorn master folds its file into ``retired.json``
+and deletes it (:func:`retire_worker`), so the sums stay monotonic without
+files piling up or a recycled pid overwriting an old worker's totals. The
+master empties the directory when it starts (:func:`reset`): a redeploy is a
+counter reset, which Prometheus expects.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import suppress
+
+from django.conf import settings
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNRESOLVED = 'unresolved'
+WORKER_PREFIX = 'metrics-'
+RETIRED = 'retired.json'
+
+COUNTERS = (
+    ('db_queries', 'clouded_db_queries_total', 'Database queries executed while serving requests'),
+    ('db_seconds', 'clouded_db_query_seconds_total', 'Time spent in database queries'),
+    ('render_seconds', 'clouded_render_seconds_total', 'Time spent rendering templates and API responses'),
+    ('response_bytes', 'clouded_response_bytes_total', 'Response body bytes (streaming responses excluded)'),
+)
+
+
+def _empty():
+    return {
+        'count': 0,
+        'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+        'latency_seconds': 0.0,
+        'db_queries': 0,
+        'db_seconds': 0.0,
+        'render_seconds': 0.0,
+        'response_bytes': 0,
+    }
+
+
+class Registry:
+    """In-process totals per view, flushed periodically to this worker's file"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._last_flush = time.monotonic()
+        # Tells this process's file apart from an exited worker's that had the same pid
+        self._started = time.time_ns()
+
+    def observe(self, view, latency, db_queries=0, db_seconds=0.0, render_seconds=0.0, response_bytes=0):
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = _empty()
+            stats['count'] += 1
+            stats['buckets'][bisect_left(LATENCY_BUCKETS, latency)] += 1
+            stats['latency_seconds'] += latency
+            stats['db_queries'] += db_queries
+            stats['db_seconds'] += db_seconds
+            stats['render_seconds'] += render_seconds
+            stats['response_bytes'] += response_bytes
+            due = time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_INTERVAL
+            if due:
+                self._last_flush = time.monotonic()
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {view: dict(stats, buckets=list(stats['buckets'])) for view, stats in self._views.items()}
+
+    def flush(self):
+        """Write this process's totals to its file (atomically, via rename)"""
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        name = f'{WORKER_PREFIX}{os.getpid()}-{self._started}.json'
+        _write(os.path.join(settings.METRICS_DIR, name), self.snapshot())
+
+
+registry = Registry()
+
+
+def _write(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(data, fh)
+    os.replace(tmp_path, path)
+
+
+def _load(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(total_views, views):
+    for view, stats in views.items():
+        total = total_views.setdefault(view, _empty())
+        for key, value in stats.items():
+            if key == 'buckets':
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], value)]
+            else:
+                total[key] += value
+
+
+def _worker_files(directory):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [name for name in names if name.startswith(WORKER_PREFIX) and name.endswith('.json')]
+
+
+def collect():
+    """Totals per view summed over every worker's metrics file and the retired workers"""
+    registry.flush()
+    directory = settings.METRICS_DIR
+    workers = {}
+    for name in _worker_files(directory):
+        views = _load(os.path.join(directory, name))
+        if views is not None:
+            workers[name] = views
+    # Read after the workers' files: one retired in between is in this copy, and skipped below
+    retired = _load(os.path.join(directory, RETIRED)) or {'files': [], 'views': {}}
+    merged = {}
+    _add(merged, retired['views'])
+    for name, views in workers.items():
+        if name not in retired['files']:
+            _add(merged, views)
+    return merged
+
+
+def retire_worker(pid):
+    """Fold the files of exited worker ``pid`` into the retired totals, then delete them.
+
+    Runs in the gunicorn master (``child_exit``), one worker at a time.
+    """
+    directory = settings.METRICS_DIR
+    present = _worker_files(directory)
+    names = [name for name in present if name.startswith(f'{WORKER_PREFIX}{pid}-')]
+    if not names:
+        return
+    path = os.path.join(directory, RETIRED)
+    retired = _load(path) or {'files': [], 'views': {}}
+    for name in names:
+        _add(retired['views'], _load(os.path.join(directory, name)) or {})
+    # Names are listed until their file is gone, so a scrape never counts a worker twice
+    retired['files'] = [name for name in retired['files'] if name in present] + names
+    _write(path, retired)
+    for name in names:
+        with suppress(FileNotFoundError):
+            os.remove(os.path.join(directory, name))
+
+
+def reset():
+    """Delete every metrics file; the gunicorn master calls this before starting workers"""
+    for name in _worker_files(settings.METRICS_DIR) + [RETIRED]:
+        with suppress(FileNotFoundError):
+            os.remove(os.path.join(settings.METRICS_DIR, name))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(views):
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = [
+        '# HELP clouded_http_requests_total Requests served, by resolved URL name',
+        '# TYPE clouded_http_requests_total counter',
+    ]
+    ordered = sorted(views.items())
+    for view, stats in ordered:
+        lines.append(f'clouded_http_requests_total{{view="{_escape(view)}"}} {stats["count"]}')
+
+    lines += [
+        '# HELP clouded_http_request_duration_seconds Request latency, by resolved URL name',
+        '# TYPE clouded_http_request_duration_seconds histogram',
+    ]
+    for view, stats in ordered:
+        label = _escape(view)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), stats['buckets']):
+            cumulative += count
+            lines.append(f'clouded_http_request_duration_seconds_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'clouded_http_request_duration_seconds_sum{{view="{label}"}} {stats["latency_seconds"]:.6f}')
+        lines.append(f'clouded_http_request_duration_seconds_count{{view="{label}"}} {stats["count"]}')
+
+    for key, metric, help_text in COUNTERS:
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+        for view, stats in ordered:
+            value = stats[key]
+            value = f'{value:.6f}' if isinstance(value, float) else value
+            lines.append(f'{metric}{{view="{_escape(view)}"}} {value}')
+    return '\n'.join(lines) + '\n'
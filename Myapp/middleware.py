@@ -0,0 +1,292 @@
+import contextvars
+import logging
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.http import Http404
+from django.utils.functional import SimpleLazyObject
+
+from . import db_router
+from .log import current_request
+from .metrics import UNRESOLVED, registry
+from .models import UserSignup
+
+access_logger = logging.getLogger('Myapp.access')
+
+
+# What the principal cache holds: the public profile, never the password hash. Other fields
+# of a principal are deferred and load on first access.
+PRINCIPAL_FIELDS = ('id', 'full_name', 'email', 'role', 'subject')
+
+
+def _principal_query(user_id):
+    return UserSignup.objects.only(*PRINCIPAL_FIELDS).filter(id=user_id)
+
+
+def _cached_principal(values):
+    return UserSignup.from_db(DEFAULT_DB_ALIAS, PRINCIPAL_FIELDS, [values[name] for name in PRINCIPAL_FIELDS])
+
+
+def _principal_values(user):
+    return {name: getattr(user, name) for name in PRINCIPAL_FIELDS}
+
+
+def get_principal(user_id):
+    """Return the UserSignup for a session user id, from the cache when warm"""
+    if not user_id:
+        return None
+    timeout = settings.PRINCIPAL_CACHE_TIMEOUT
+    key = UserSignup.principal_cache_key(user_id)
+    values = cache.get(key) if timeout else None
+    if values is not None:
+        return _cached_principal(values)
+    user = _principal_query(user_id).first()
+    if user is not None and timeout:
+        cache.set(key, _principal_values(user), timeout)
+    return user
+
+
+async def aget_principal(request):
+    """Async counterpart of ``request.principal`` for async views; cached on the request"""
+    if not hasattr(request, '_aprincipal'):
+        user_id = await request.session.aget('user_id')
+        user = None
+        if user_id:
+            timeout = settings.PRINCIPAL_CACHE_TIMEOUT
+            key = UserSignup.principal_cache_key(user_id)
+            values = await cache.aget(key) if timeout else None
+            if values is not None:
+                user = _cached_principal(values)
+            else:
+                user = await _principal_query(user_id).afirst()
+                if user is not None and timeout:
+                    await cache.aset(key, _principal_values(user), timeout)
+        request._aprincipal = user
+    return request._aprincipal
+
+
+class AsyncCapableMiddleware:
+    """Base for middleware that runs natively under both WSGI and ASGI.
+
+    Subclasses implement ``__call__`` and ``__acall__``; under ASGI Django
+    then calls the coroutine directly instead of hopping to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+class PrincipalMiddleware(AsyncCapableMiddleware):
+    """Expose the logged-in UserSignup as ``request.principal``.
+
+    Resolved lazily, at most once per request, and from a short-TTL cache so
+    warm requests need no identity query. ``UserSignup.save``/``delete``
+    drop the cache entry, which only reaches every worker through a shared
+    cache; ``PRINCIPAL_CACHE_TIMEOUT`` is 0 (no caching) without one.
+    Evaluates to None when nobody is logged in.
+    Async views use ``await aget_principal(request)`` instead.
+    """
+
+    def __call__(self, request):
+        request.principal = SimpleLazyObject(lambda: get_principal(request.session.get('user_id')))
+        # Under ASGI this returns the downstream coroutine for Django to await
+        return self.get_response(request)
+
+
+def current_user(request):
+    """``request.principal``, raising UserSignup.DoesNotExist like the direct lookup it replaces"""
+    if not request.principal:
+        raise UserSignup.DoesNotExist
+    return request.principal
+
+
+def principal_or_404(request):
+    """``request.principal``, or Http404 when the session user no longer exists"""
+    if not request.principal:
+        raise Http404("User not found")
+    return request.principal
+
+
+# Query counter of the request being served; follows the request into
+# sync_to_async threads, where async views run their queries.
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+class _QueryTimer:
+    """Counts queries and their time for one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+def _time_query(execute, sql, params, many, context):
+    timer = _request_queries.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.seconds += time.perf_counter() - start
+        timer.queries += 1
+
+
+def _install_query_timer(connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+# Every connection, in whichever thread it is opened, reports to the current request's timer
+connection_created.connect(_install_query_timer)
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """Record latency, DB queries/time, render time and response size per URL name.
+
+    Goes first in MIDDLEWARE so the whole stack is timed. Totals are served
+    by the ``/metrics`` endpoint (see ``Myapp.metrics``).
+    """
+
+    def _start(self, request):
+        # Connections opened before this module was imported never sent connection_created
+        for connection in connections.all(initialized_only=True):
+            _install_query_timer(connection)
+        request.metrics_render_seconds = 0.0
+        timer = _QueryTimer()
+        return timer, _request_queries.set(timer), time.perf_counter()
+
+    def _finish(self, request, response, timer, token, start):
+        latency = time.perf_counter() - start
+        _request_queries.reset(token)
+        match = getattr(request, 'resolver_match', None)
+        registry.observe(
+            (match.url_name or match.view_name) if match else UNRESOLVED,
+            latency,
+            db_queries=timer.queries,
+            db_seconds=timer.seconds,
+            render_seconds=request.metrics_render_seconds,
+            response_bytes=0 if response.streaming else len(response.content),
+        )
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        timer, token, start = self._start(request)
+        response = self.get_response(request)
+        return self._finish(request, response, timer, token, start)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        timer, token, start = self._start(request)
+        response = await self.get_response(request)
+        return self._finish(request, response, timer, token, start)
+
+    def process_template_response(self, request, response):
+        # Render here rather than in the handler so the time can be measured;
+        # the handler's own render() call is then a no-op.
+        if settings.METRICS_ENABLED:
+            start = time.perf_counter()
+            response.render()
+            request.metrics_render_seconds += time.perf_counter() - start
+        return response
+
+
+class RequestLogMiddleware(AsyncCapableMiddleware):
+    """Tag the request with an id for log records and write a sampled access log line.
+
+    Uses the client's ``X-Request-ID`` when present and echoes the id back.
+    Successful and client-error requests are logged at INFO, sampled by
+    ``LOG_ACCESS_SAMPLE_RATE``; server errors are always logged.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token, start = self._start(request)
+        try:
+            response = self.get_response(request)
+            return self._finish(request, response, start)
+        finally:
+            current_request.reset(token)
+
+    async def __acall__(self, request):
+        token, start = self._start(request)
+        try:
+            response = await self.get_response(request)
+            return self._finish(request, response, start)
+        finally:
+            current_request.reset(token)
+
+    def _start(self, request):
+        request.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        return current_request.set(request), time.perf_counter()
+
+    def _finish(self, request, response, start):
+        duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        response['X-Request-ID'] = request.request_id
+        if response.status_code >= 500:
+            access_logger.warning(
+                "%s %s %s", request.method, request.path, response.status_code,
+                extra={'status': response.status_code, 'duration_ms': duration_ms},
+            )
+        elif access_logger.isEnabledFor(logging.INFO):
+            access_logger.info(
+                "%s %s %s", request.method, request.path, response.status_code,
+                extra={
+                    'status': response.status_code,
+                    'duration_ms': duration_ms,
+                    'sample_rate': settings.LOG_ACCESS_SAMPLE_RATE,
+                },
+            )
+        return response
+
+
+class ReplicaPinMiddleware(AsyncCapableMiddleware):
+    """Route each request's reads (see ``Myapp.db_router``) and keep clients that just wrote on the primary"""
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = db_router.end_request(token)
+        return self._finish(response, state)
+
+    async def __acall__(self, request):
+        token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = db_router.end_request(token)
+        return self._finish(response, state)
+
+    def _start(self, request):
+        pinned = request.method not in ('GET', 'HEAD', 'OPTIONS') or db_router.pin_active(
+            request.COOKIES.get(db_router.PIN_COOKIE)
+        )
+        return db_router.start_request(pinned)
+
+    def _finish(self, response, state):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                db_router.PIN_COOKIE, str(int(time.time()) + seconds), max_age=seconds, httponly=True, samesite='Lax'
+            )
+        return response
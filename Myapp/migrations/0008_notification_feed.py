@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_unread_counts(apps, schema_editor):
+    EmailNotification = apps.get_model('Myapp', 'EmailNotification')
+    NotificationCounter = apps.get_model('Myapp', 'NotificationCounter')
+    db_alias = schema_editor.connection.alias
+    rows = (
+        EmailNotification.objects.using(db_alias).filter(is_read=False)
+        .values('student_id')
+        .annotate(unread=Count('id'))
+    )
+    NotificationCounter.objects.using(db_alias).bulk_create(
+        [NotificationCounter(student_id=row['student_id'], unread_count=row['unread']) for row in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0007_uploadedfile_tag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to='Myapp.usersignup')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='emailnotification',
+            index=models.Index(fields=['student', '-sent_at', '-id'], name='notification_feed_idx'),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def fold_notifications(apps, schema_editor):
+    """Collapse per-student EmailNotification rows into broadcast events plus read cursors"""
+    EmailNotification = apps.get_model('Myapp', 'EmailNotification')
+    NotificationEvent = apps.get_model('Myapp', 'NotificationEvent')
+    NotificationCursor = apps.get_model('Myapp', 'NotificationCursor')
+    db_alias = schema_editor.connection.alias
+
+    groups = (
+        EmailNotification.objects.using(db_alias).values('teacher_id', 'unit_id', 'file_id', 'notification_type')
+        .annotate(first_sent=Min('sent_at'))
+        .order_by('first_sent')
+    )
+    # Create events oldest first so event ids keep increasing with time
+    event_ids = {}
+    for group in groups:
+        key = (group['teacher_id'], group['unit_id'], group['file_id'], group['notification_type'])
+        event = NotificationEvent.objects.using(db_alias).create(
+            teacher_id=key[0],
+            unit_id=key[1],
+            file_id=key[2],
+            notification_type=key[3],
+            created_at=group['first_sent'],
+        )
+        event_ids[key] = event.id
+    if not event_ids:
+        return
+    latest_event_id = max(event_ids.values())
+
+    # A student's cursor sits just below their oldest unread event, or at the
+    # newest event when they had read everything
+    first_unread = {}
+    students = set()
+    rows = EmailNotification.objects.using(db_alias).values_list(
+        'student_id', 'teacher_id', 'unit_id', 'file_id', 'notification_type', 'is_read'
+    )
+    for student_id, teacher_id, unit_id, file_id, notification_type, is_read in rows.iterator():
+        students.add(student_id)
+        if not is_read:
+            event_id = event_ids[(teacher_id, unit_id, file_id, notification_type)]
+            first_unread[student_id] = min(first_unread.get(student_id, event_id), event_id)
+
+    NotificationCursor.objects.using(db_alias).bulk_create(
+        [
+            NotificationCursor(
+                student_id=student_id,
+                last_seen_event_id=first_unread[student_id] - 1 if student_id in first_unread else latest_event_id,
+            )
+            for student_id in students
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0009_liveevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCursor',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_cursor', serialize=False, to='Myapp.usersignup')),
+                ('last_seen_event_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NotificationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(choices=[('unit_created', 'Unit Created'), ('file_uploaded', 'File Uploaded'), ('file_published', 'File Published')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='Myapp.uploadedfile')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_events', to='Myapp.usersignup')),
+                ('unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Myapp.courseunit')),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='notificationevent',
+            constraint=models.UniqueConstraint(fields=('teacher', 'unit', 'file', 'notification_type'), name='unique_notification_event'),
+        ),
+        migrations.RunPython(fold_notifications, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='NotificationCounter',
+        ),
+        migrations.DeleteModel(
+            name='EmailNotification',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0010_notification_event_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='publish_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='unpublish_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(condition=models.Q(('publish_at__isnull', False)), fields=['publish_at'], name='file_publish_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(condition=models.Q(('unpublish_at__isnull', False)), fields=['unpublish_at'], name='file_unpublish_due_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0011_uploadedfile_schedule'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='courseunit',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='courseunit',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='purge_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='courseunit',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('teacher', 'name'), name='unique_live_unit_name'),
+        ),
+    ]
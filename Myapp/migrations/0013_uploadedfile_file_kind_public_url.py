@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:18
+
+from functools import reduce
+from operator import or_
+
+from django.db import migrations, models
+
+# Copy of models.FILE_KIND_RULES at the time of this migration
+FILE_KIND_RULES = [
+    ('pdf', ('pdf',)),
+    ('powerpoint', ('powerpoint', 'presentation')),
+    ('word', ('word', 'document')),
+    ('text', ('text',)),
+]
+
+
+def backfill(apps, schema_editor):
+    """Classify existing files and store their public URLs"""
+    UploadedFile = apps.get_model('Myapp', 'UploadedFile')
+    files = UploadedFile.objects.using(schema_editor.connection.alias)
+
+    # One UPDATE per kind; rows still 'other' didn't match an earlier rule, so the first match wins
+    for kind, needles in FILE_KIND_RULES:
+        matches = reduce(or_, (models.Q(file_type__icontains=needle) for needle in needles))
+        files.filter(matches, file_kind='other').update(file_kind=kind)
+
+    batch = []
+    for f in files.exclude(file='').only('id', 'file').iterator(chunk_size=1000):
+        f.public_url = f.file.url
+        batch.append(f)
+        if len(batch) == 1000:
+            files.bulk_update(batch, ['public_url'])
+            batch = []
+    files.bulk_update(batch, ['public_url'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0012_trash_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='file_kind',
+            field=models.CharField(choices=[('pdf', 'PDF'), ('word', 'Word'), ('powerpoint', 'PowerPoint'), ('text', 'Text'), ('other', 'Other')], db_index=True, default='other', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='public_url',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def count_usage(apps, schema_editor):
+    """Counters for the live files that exist already"""
+    UploadedFile = apps.get_model('Myapp', 'UploadedFile')
+    StorageUsage = apps.get_model('Myapp', 'StorageUsage')
+    db_alias = schema_editor.connection.alias
+
+    totals = {}
+    per_unit = (
+        UploadedFile.objects.using(db_alias).filter(deleted_at__isnull=True)
+        .values('teacher_id', 'unit_id').annotate(size=Sum('file_size'), count=Count('id')).order_by()
+    )
+    for row in per_unit:
+        for key in ((row['teacher_id'], row['unit_id']), (row['teacher_id'], None)):
+            size, count = totals.get(key, (0, 0))
+            totals[key] = (size + row['size'], count + row['count'])
+    StorageUsage.objects.using(db_alias).bulk_create(
+        [
+            StorageUsage(teacher_id=teacher_id, unit_id=unit_id, bytes_used=size, files_used=count)
+            for (teacher_id, unit_id), (size, count) in totals.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0013_uploadedfile_file_kind_public_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bytes_used', models.BigIntegerField(default=0)),
+                ('files_used', models.IntegerField(default=0)),
+                ('max_bytes', models.BigIntegerField(blank=True, null=True)),
+                ('max_files', models.IntegerField(blank=True, null=True)),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='storage_usage', to='Myapp.usersignup')),
+                ('unit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='storage_usage', to='Myapp.courseunit')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('unit__isnull', True)), fields=('teacher',), name='unique_teacher_storage_usage'), models.UniqueConstraint(fields=('unit',), name='unique_unit_storage_usage')],
+            },
+        ),
+        migrations.RunPython(count_usage, migrations.RunPython.noop),
+    ]
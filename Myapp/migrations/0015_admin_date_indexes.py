@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0014_storage_usage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='courseunit',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='notificationevent',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='uploadedfile',
+            name='uploaded_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0015_admin_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('download', 'Download'), ('preview', 'Preview')], max_length=10)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('file', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='Myapp.uploadedfile')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0016_download_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('period_start', models.DateTimeField()),
+                ('downloads', models.IntegerField(default=0)),
+                ('previews', models.IntegerField(default=0)),
+                ('unique_students', models.IntegerField(default=0)),
+                ('bytes_served', models.BigIntegerField(default=0)),
+                ('file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='usage_rollups', to='Myapp.uploadedfile')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_rollups', to='Myapp.usersignup')),
+                ('unit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='usage_rollups', to='Myapp.courseunit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['teacher', 'period', 'period_start'], name='usage_rollup_teacher_period')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('file__isnull', False)), fields=('period', 'period_start', 'file'), name='unique_file_usage_rollup'), models.UniqueConstraint(condition=models.Q(('file__isnull', True), ('unit__isnull', False)), fields=('period', 'period_start', 'unit'), name='unique_unit_usage_rollup'), models.UniqueConstraint(condition=models.Q(('unit__isnull', True)), fields=('period', 'period_start', 'teacher'), name='unique_teacher_usage_rollup')],
+            },
+        ),
+    ]
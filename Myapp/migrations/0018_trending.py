@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0017_usage_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending_score', serialize=False, to='Myapp.uploadedfile')),
+                ('log_score', models.FloatField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingSnapshot',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('data', models.JSONField(default=dict)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
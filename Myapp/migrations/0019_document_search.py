@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_index(apps, schema_editor):
+    """Page-level full-text index: FTS5 on SQLite, tsvector + GIN on PostgreSQL"""
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE "Myapp_search_index" USING fts5('
+            "body, content='', tokenize='porter unicode61 remove_diacritics 2')"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE "Myapp_search_page" ('
+            'file_id bigint NOT NULL, page integer NOT NULL, vector tsvector NOT NULL, PRIMARY KEY (file_id, page))'
+        )
+        schema_editor.execute('CREATE INDEX "Myapp_search_page_vector" ON "Myapp_search_page" USING gin (vector)')
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS "Myapp_search_index"')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS "Myapp_search_page"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0018_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document_text', serialize=False, to='Myapp.uploadedfile')),
+                ('content_hash', models.CharField(db_index=True, max_length=64)),
+                ('status', models.CharField(choices=[('done', 'Done'), ('truncated', 'Truncated'), ('failed', 'Failed')], max_length=10)),
+                ('text', models.BinaryField(default=b'')),
+                ('pages', models.IntegerField(default=0)),
+                ('error', models.CharField(blank=True, default='', max_length=200)),
+                ('extracted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
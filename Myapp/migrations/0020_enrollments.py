@@ -0,0 +1,65 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def enroll_existing_students(apps, schema_editor):
+    """Every student already saw every teacher: enroll them all, so nobody loses access on upgrade"""
+    UserSignup = apps.get_model('Myapp', 'UserSignup')
+    Enrollment = apps.get_model('Myapp', 'Enrollment')
+    db_alias = schema_editor.connection.alias
+
+    teacher_ids = list(UserSignup.objects.using(db_alias).filter(role='teacher').values_list('id', flat=True))
+    students = UserSignup.objects.using(db_alias).filter(role='student').order_by('id').values_list('id', flat=True)
+    last_id = 0
+    while True:
+        batch = list(students.filter(id__gt=last_id)[:1000])
+        if not batch:
+            break
+        last_id = batch[-1]
+        Enrollment.objects.using(db_alias).bulk_create(
+            [Enrollment(student_id=student_id, teacher_id=teacher_id) for student_id in batch for teacher_id in teacher_ids],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0019_document_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Enrollment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notificationevent',
+            index=models.Index(fields=['teacher', '-id'], name='notification_teacher_feed'),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='enrollments', to='Myapp.usersignup'),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='teacher',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='course_enrollments', to='Myapp.usersignup'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['teacher', 'student'], name='enrollment_teacher_student'),
+        ),
+        migrations.AddConstraint(
+            model_name='enrollment',
+            constraint=models.UniqueConstraint(fields=('student', 'teacher'), name='unique_enrollment'),
+        ),
+        migrations.RunPython(enroll_existing_students, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+def drop_bridged_events(apps, schema_editor):
+    """Bridged events are kept for an hour and their row ids can't be resumed under the new ids; start empty"""
+    LiveEvent = apps.get_model('Myapp', 'LiveEvent')
+    LiveEvent.objects.using(schema_editor.connection.alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Myapp', '0020_enrollments'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_bridged_events, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='liveevent',
+            name='event_id',
+            field=models.BigIntegerField(db_index=True, default=0),
+            preserve_default=False,
+        ),
+    ]
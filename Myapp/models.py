@@ -1,6 +1,7 @@
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.hashers import make_password, check_password
-import os
 
 class UserSignup(models.Model):
     ROLE_CHOICES = [
@@ -20,6 +21,18 @@ class UserSignup(models.Model):
         if not self.password.startswith('pbkdf2_'):
             self.password = make_password(self.password)
         super().save(*args, **kwargs)
+        # Drop the cached request principal so profile changes show up immediately
+        cache.delete(self.principal_cache_key(self.id))
+    
+    def delete(self, *args, **kwargs):
+        user_id = self.id
+        result = super().delete(*args, **kwargs)
+        cache.delete(self.principal_cache_key(user_id))
+        return result
+    
+    @staticmethod
+    def principal_cache_key(user_id):
+        return f"principal:{user_id}"
     
     def check_password(self, raw_password):
         """Check if the provided password matches the stored hashed password"""
@@ -28,21 +41,64 @@ class UserSignup(models.Model):
     def __str__(self):
         return f"{self.full_name} - {self.role.capitalize()}"
 
+class LiveManager(models.Manager):
+    """Default manager that hides tombstoned (trashed) rows"""
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 class CourseUnit(models.Model):
     """Model to store course units/folders created by teachers"""
     teacher = models.ForeignKey(UserSignup, on_delete=models.CASCADE, related_name='course_units')
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)  # Set when moved to trash
+    
+    objects = LiveManager()
+    all_objects = models.Manager()  # Includes trashed units
     
     class Meta:
-        unique_together = ['teacher', 'name']  # Prevent duplicate unit names per teacher
         ordering = ['created_at']
+        constraints = [
+            # Prevent duplicate unit names per teacher; trashed units don't block reuse of a name
+            models.UniqueConstraint(fields=['teacher', 'name'], condition=models.Q(deleted_at__isnull=True), name='unique_live_unit_name'),
+        ]
     
     def __str__(self):
         return f"{self.teacher.full_name} - {self.name}"
 
+# Substrings of the MIME type, checked in order, that decide a file's kind. PowerPoint comes
+# before Word: the .pptx type, ...officedocument.presentationml..., also contains "document"
+FILE_KIND_RULES = [
+    ('pdf', ('pdf',)),
+    ('powerpoint', ('powerpoint', 'presentation')),
+    ('word', ('word', 'document')),
+    ('text', ('text',)),
+]
+FILE_KIND_ICONS = {
+    'pdf': 'fa-file-pdf',
+    'word': 'fa-file-word',
+    'powerpoint': 'fa-file-powerpoint',
+    'text': 'fa-file-alt',
+    'other': 'fa-file',
+}
+FILE_KIND_COLORS = {
+    'pdf': '#dc3545',  # Red for PDF
+    'word': '#2b579a',  # Blue for Word
+    'powerpoint': '#d24726',  # Orange for PowerPoint
+    'text': '#6c757d',  # Gray for text
+    'other': '#6c757d',
+}
+
+def file_kind_for(file_type):
+    """Kind of a file (one of ``UploadedFile.KIND_CHOICES``) from its MIME type"""
+    file_type = (file_type or '').lower()
+    for kind, needles in FILE_KIND_RULES:
+        if any(needle in file_type for needle in needles):
+            return kind
+    return 'other'
+
 class UploadedFile(models.Model):
     """Model to store uploaded files"""
     TAG_CHOICES = [
@@ -51,6 +107,13 @@ class UploadedFile(models.Model):
         ('study_material', 'Study Material'),
         ('question_bank', 'Question Bank'),
     ]
+    KIND_CHOICES = [
+        ('pdf', 'PDF'),
+        ('word', 'Word'),
+        ('powerpoint', 'PowerPoint'),
+        ('text', 'Text'),
+        ('other', 'Other'),
+    ]
 
     teacher = models.ForeignKey(UserSignup, on_delete=models.CASCADE, related_name='uploaded_files')
     unit = models.ForeignKey(CourseUnit, on_delete=models.CASCADE, related_name='files')
@@ -58,12 +121,27 @@ class UploadedFile(models.Model):
     file = models.FileField(upload_to='course_files/%Y/%m/%d/')
     file_size = models.BigIntegerField()  # Size in bytes
     file_type = models.CharField(max_length=50)
+    # Derived from file_type and the stored name on save, so listings don't recompute them per row
+    file_kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='other', db_index=True)
+    public_url = models.CharField(max_length=500, blank=True, default='')
     tag = models.CharField(max_length=20, choices=TAG_CHOICES, default='study_material')
     is_published = models.BooleanField(default=False)
-    uploaded_at = models.DateTimeField(auto_now_add=True)
+    publish_at = models.DateTimeField(null=True, blank=True)  # Cleared once the scheduler publishes
+    unpublish_at = models.DateTimeField(null=True, blank=True)  # Cleared once the scheduler unpublishes
+    uploaded_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)  # Set when moved to trash
+    purge_attempts = models.PositiveSmallIntegerField(default=0)  # Failed storage deletes by the trash collector
+    
+    objects = LiveManager()
+    all_objects = models.Manager()  # Includes trashed files
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Partial indexes: only scheduled rows are indexed, so finding the next due item stays cheap
+            models.Index(fields=['publish_at'], name='file_publish_due_idx', condition=models.Q(publish_at__isnull=False)),
+            models.Index(fields=['unpublish_at'], name='file_unpublish_due_idx', condition=models.Q(unpublish_at__isnull=False)),
+        ]
     
     def __str__(self):
         return f"{self.original_name} - {self.teacher.full_name}"
@@ -79,33 +157,35 @@ class UploadedFile(models.Model):
     
     def get_file_icon(self):
         """Return appropriate icon based on file type"""
-        if 'pdf' in self.file_type.lower():
-            return 'fa-file-pdf'
-        elif 'word' in self.file_type.lower() or 'document' in self.file_type.lower():
-            return 'fa-file-word'
-        elif 'powerpoint' in self.file_type.lower() or 'presentation' in self.file_type.lower():
-            return 'fa-file-powerpoint'
-        elif 'text' in self.file_type.lower():
-            return 'fa-file-alt'
-        else:
-            return 'fa-file'
+        return FILE_KIND_ICONS[self.file_kind]
 
     def get_file_color(self):
         """Return appropriate color based on file type"""
-        if 'pdf' in self.file_type.lower():
-            return '#dc3545'  # Red for PDF
-        elif 'word' in self.file_type.lower() or 'document' in self.file_type.lower():
-            return '#2b579a'  # Blue for Word
-        elif 'powerpoint' in self.file_type.lower() or 'presentation' in self.file_type.lower():
-            return '#d24726'  # Orange for PowerPoint
-        elif 'text' in self.file_type.lower():
-            return '#6c757d'  # Gray for text
-        else:
-            return '#6c757d'
+        return FILE_KIND_COLORS[self.file_kind]
 
     def can_preview(self):
         """Check if file can be previewed in browser"""
-        return 'pdf' in self.file_type.lower()
+        return self.file_kind == 'pdf'
+
+    def get_file_url(self):
+        """Public URL of the stored file; rows bulk-created without one build it from storage"""
+        if not self.file:
+            return None
+        return self.public_url or self.file.url
+
+    def set_derived_fields(self):
+        """Fill ``file_kind`` and ``public_url`` from ``file_type`` and the stored file name"""
+        self.file_kind = file_kind_for(self.file_type)
+        self.public_url = self.file.url if self.file else ''
+
+    def save(self, *args, **kwargs):
+        uploading = bool(self.file) and not self.file._committed
+        if uploading:
+            # Store the upload first so its final name, and so its URL, is known for this write
+            self.file.save(self.file.name, self.file.file, save=False)
+        if uploading or not self.public_url or self.file_kind != file_kind_for(self.file_type):
+            self.set_derived_fields()
+        super().save(*args, **kwargs)
 
     def get_preview_url(self):
         """Get URL for file preview"""
@@ -114,28 +194,216 @@ class UploadedFile(models.Model):
         return None
     
     def delete(self, *args, **kwargs):
-        # Delete the actual file when model instance is deleted
+        # Myapp.quotas imports this module
+        from .quotas import release
+        with transaction.atomic():
+            # A live file still counts against the quotas; a trashed one gave its share back when trashed
+            if self.deleted_at is None:
+                release(self.teacher_id, {self.unit_id: (self.file_size, 1)})
+            super().delete(*args, **kwargs)
+        # Delete the actual file through the storage API (works for remote storages too)
         if self.file:
-            if os.path.isfile(self.file.path):
-                os.remove(self.file.path)
-        super().delete(*args, **kwargs)
-
-class EmailNotification(models.Model):
-    """Model to track email notifications sent to students"""
-    teacher = models.ForeignKey(UserSignup, on_delete=models.CASCADE, related_name='sent_notifications')
-    student = models.ForeignKey(UserSignup, on_delete=models.CASCADE, related_name='received_notifications')
-    unit = models.ForeignKey(CourseUnit, on_delete=models.CASCADE)
-    file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, null=True, blank=True)
-    notification_type = models.CharField(max_length=20, choices=[
+            self.file.delete(save=False)
+
+class StorageUsage(models.Model):
+    """Bytes and files a teacher (no unit) or one of their units holds, kept current by Myapp.quotas"""
+    teacher = models.ForeignKey(UserSignup, on_delete=models.CASCADE, related_name='storage_usage')
+    unit = models.ForeignKey(CourseUnit, on_delete=models.CASCADE, null=True, blank=True, related_name='storage_usage')
+    bytes_used = models.BigIntegerField(default=0)
+    files_used = models.IntegerField(default=0)
+    max_bytes = models.BigIntegerField(null=True, blank=True)  # Overrides the TEACHER_/UNIT_QUOTA_BYTES setting
+    max_files = models.IntegerField(null=True, blank=True)  # Overrides the TEACHER_/UNIT_QUOTA_FILES setting
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['teacher'], condition=models.Q(unit__isnull=True), name='unique_teacher_storage_usage'),
+            models.UniqueConstraint(fields=['unit'], name='unique_unit_storage_usage'),
+        ]
+    
+    def __str__(self):
+        scope = f"unit {self.unit_id}" if self.unit_id else f"teacher {self.teacher_id}"
+        return f"{scope}: {self.bytes_used} bytes in {self.files_used} files"
+
+class NotificationEvent(models.Model):
+    """Broadcast notification shared by all students; one row per (teacher, unit, file, type)"""
+    NOTIFICATION_TYPES = [
         ('unit_created', 'Unit Created'),
         ('file_uploaded', 'File Uploaded'),
         ('file_published', 'File Published'),
-    ])
-    sent_at = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
+    ]
+
+    teacher = models.ForeignKey(UserSignup, on_delete=models.CASCADE, related_name='notification_events')
+    unit = models.ForeignKey(CourseUnit, on_delete=models.CASCADE)
+    file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, null=True, blank=True)
+    notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
     
     class Meta:
-        ordering = ['-sent_at']
+        # Ids grow with time, so the feed is a descending range scan on the primary key
+        ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(fields=['teacher', 'unit', 'file', 'notification_type'], name='unique_notification_event'),
+        ]
+        indexes = [
+            # A student's feed: the newest events of each teacher they are enrolled with
+            models.Index(fields=['teacher', '-id'], name='notification_teacher_feed'),
+        ]
     
     def __str__(self):
-        return f"Notification to {self.student.full_name} about {self.unit.name}"
+        return f"{self.get_notification_type_display()}: {self.unit.name}"
+
+class Enrollment(models.Model):
+    """A student taking a teacher's course: they see the teacher's units and get the teacher's notifications"""
+    # The two composite indexes below serve each side; single-column FK indexes would be redundant
+    student = models.ForeignKey(UserSignup, on_delete=models.CASCADE, related_name='enrollments', db_index=False)
+    teacher = models.ForeignKey(UserSignup, on_delete=models.CASCADE, related_name='course_enrollments', db_index=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'teacher'], name='unique_enrollment'),
+        ]
+        indexes = [
+            models.Index(fields=['teacher', 'student'], name='enrollment_teacher_student'),
+        ]
+
+    def __str__(self):
+        return f"student {self.student_id} in course of teacher {self.teacher_id}"
+
+class NotificationCursor(models.Model):
+    """Id of the newest broadcast notification a student has read"""
+    student = models.OneToOneField(UserSignup, on_delete=models.CASCADE, primary_key=True, related_name='notification_cursor')
+    last_seen_event_id = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.student_id} read up to {self.last_seen_event_id}"
+
+class LiveEvent(models.Model):
+    """Dashboard event shared between workers when the live events DB bridge is enabled"""
+    event_id = models.BigIntegerField(db_index=True)  # The id sent to clients (events.EventHub.next_id)
+    event_type = models.CharField(max_length=30)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.event_type} #{self.id}"
+
+class DownloadEvent(models.Model):
+    """A student downloading or previewing a file, written in batches by ``Myapp.downloads``"""
+    KIND_CHOICES = [
+        ('download', 'Download'),
+        ('preview', 'Preview'),
+    ]
+
+    # No database constraint or cascade: events are appended in bulk, possibly after the
+    # file was purged, and purging a file must not have to delete its history row by row
+    file = models.ForeignKey(UploadedFile, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    student_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.kind} of file {self.file_id} by {self.student_id}"
+
+class UsageRollup(models.Model):
+    """Download/preview totals of one hour or day, per file, per unit (file empty) or per teacher (unit empty).
+
+    Maintained by ``Myapp.analytics.rollup``; analytics pages read only these rows, never ``DownloadEvent``.
+    Unique students are counted per row, so they can't be summed across periods or files.
+    """
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start = models.DateTimeField()
+    teacher = models.ForeignKey(UserSignup, on_delete=models.CASCADE, related_name='usage_rollups')
+    unit = models.ForeignKey(CourseUnit, on_delete=models.CASCADE, null=True, blank=True, related_name='usage_rollups')
+    file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, null=True, blank=True, related_name='usage_rollups')
+    downloads = models.IntegerField(default=0)
+    previews = models.IntegerField(default=0)
+    unique_students = models.IntegerField(default=0)
+    bytes_served = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Every analytics query is one teacher's rows of one period type over a time range
+            models.Index(fields=['teacher', 'period', 'period_start'], name='usage_rollup_teacher_period'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'file'], condition=models.Q(file__isnull=False),
+                name='unique_file_usage_rollup',
+            ),
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'unit'], condition=models.Q(unit__isnull=False, file__isnull=True),
+                name='unique_unit_usage_rollup',
+            ),
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'teacher'], condition=models.Q(unit__isnull=True),
+                name='unique_teacher_usage_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.period_start:%Y-%m-%d %H:00} teacher {self.teacher_id} unit {self.unit_id} file {self.file_id}"
+
+class RollupWatermark(models.Model):
+    """Id of the newest download event a background job (usage rollups, trending) has processed"""
+    name = models.CharField(max_length=50, primary_key=True)
+    last_event_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} up to {self.last_event_id}"
+
+class TrendingScore(models.Model):
+    """Time-decayed popularity of a file, kept by ``Myapp.trending`` from download and preview events.
+
+    Stored as log2 of the score relative to a fixed epoch, so every row decays
+    at the same rate without being rewritten and ordering by ``log_score`` is
+    ordering by current popularity.
+    """
+    file = models.OneToOneField(UploadedFile, on_delete=models.CASCADE, primary_key=True, related_name='trending_score')
+    log_score = models.FloatField(db_index=True)
+
+    def __str__(self):
+        return f"file {self.file_id}: {self.log_score:.2f}"
+
+class TrendingSnapshot(models.Model):
+    """Top trending materials of one teacher's course (``course:<teacher id>``), merged per student by the trending endpoint"""
+    name = models.CharField(max_length=50, primary_key=True)
+    data = models.JSONField(default=dict)
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} at {self.computed_at}"
+
+class DocumentText(models.Model):
+    """Extracted text of an uploaded file, zlib-compressed, pages separated by form feeds.
+
+    Written by ``Myapp.search.index_file``, which also keeps the full-text
+    index in step with it. A file without a row has not been indexed yet.
+    """
+    STATUS_CHOICES = [
+        ('done', 'Done'),
+        ('truncated', 'Truncated'),  # Stopped at the size, page or time budget; the pages read are indexed
+        ('failed', 'Failed'),
+    ]
+
+    file = models.OneToOneField(UploadedFile, on_delete=models.CASCADE, primary_key=True, related_name='document_text')
+    content_hash = models.CharField(max_length=64, db_index=True)  # SHA-256 of the stored blob
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    text = models.BinaryField(default=b'')
+    pages = models.IntegerField(default=0)
+    error = models.CharField(max_length=200, blank=True, default='')
+    extracted_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"text of file {self.file_id} ({self.status})"
@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from . import enrollments
+from .models import NotificationEvent, NotificationCursor
+
+FEED_PAGE_SIZE = 20
+MAX_FEED_PAGE_SIZE = 100
+# Badges show "99+" past this, so counting further is wasted work
+UNREAD_COUNT_CAP = 99
+
+
+class InvalidCursor(ValueError):
+    """Raised when a feed cursor cannot be decoded"""
+
+
+def decode_cursor(cursor):
+    """Feed cursors are the id of the last event on the previous page"""
+    try:
+        return int(cursor)
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(str(cursor)) from e
+
+
+def record_event(teacher, unit, notification_type, file=None):
+    """Record one notification for the teacher's course; write cost does not depend on how many students are enrolled"""
+    event, _ = NotificationEvent.objects.get_or_create(
+        teacher=teacher,
+        unit=unit,
+        file=file,
+        notification_type=notification_type,
+    )
+    return event
+
+
+def record_file_events(notification_type, files):
+    """Record one broadcast notification per file in a single INSERT"""
+    NotificationEvent.objects.bulk_create(
+        [
+            NotificationEvent(teacher_id=f.teacher_id, unit_id=f.unit_id, file_id=f.id, notification_type=notification_type)
+            for f in files
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def retract_file_events(notification_type, file_ids):
+    """Delete the files' notifications of one type, e.g. announcements of files that were unpublished"""
+    NotificationEvent.objects.filter(file_id__in=file_ids, notification_type=notification_type).delete()
+
+
+def start_cursors(student_ids):
+    """Give students without a read position one at the newest event.
+
+    Called when students sign up, are imported or enrolled, so a new account
+    doesn't open with every enrolled teacher's history unread.
+    """
+    latest = _latest_event_id()
+    NotificationCursor.objects.bulk_create(
+        [NotificationCursor(student_id=student_id, last_seen_event_id=latest) for student_id in student_ids],
+        batch_size=1000, ignore_conflicts=True,
+    )
+    return latest
+
+
+def get_last_seen(student_id):
+    cursor = NotificationCursor.objects.filter(student_id=student_id).values_list('last_seen_event_id', flat=True)
+    last_seen = cursor.first()
+    if last_seen is None:
+        # Accounts created before cursors started at sign-up start at their first read
+        start_cursors([student_id])
+        last_seen = cursor.get()
+    return last_seen
+
+
+def _visible_events(student_id):
+    """Events of the student's teachers, hiding those about units and files that have since been trashed"""
+    return NotificationEvent.objects.filter(
+        teacher_id__in=enrollments.teacher_ids(student_id), unit__deleted_at__isnull=True,
+    ).exclude(file__deleted_at__isnull=False)
+
+
+def get_unread_count(student_id, last_seen=None):
+    """Count the feed's events past the student's cursor, capped at UNREAD_COUNT_CAP"""
+    if last_seen is None:
+        last_seen = get_last_seen(student_id)
+    events = _visible_events(student_id).filter(id__gt=last_seen)
+    return events.order_by()[:UNREAD_COUNT_CAP].count()
+
+
+def get_feed(student_id, cursor=None, limit=FEED_PAGE_SIZE):
+    """Return one page of the feed, the next-page cursor and the student's read position.
+
+    Only events of the teachers the student is enrolled with are included.
+    The feed is a descending range scan on the (teacher, id) index starting
+    just below the cursor, so every page costs the same.
+    """
+    limit = max(1, min(limit, MAX_FEED_PAGE_SIZE))
+    events = _visible_events(student_id)
+    if cursor:
+        events = events.filter(id__lt=decode_cursor(cursor))
+    page = list(events.select_related('teacher', 'unit', 'file').order_by('-id')[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = str(page[-1].id)
+    return page, next_cursor, get_last_seen(student_id)
+
+
+def _latest_event_id():
+    return NotificationEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def mark_read(student_id, up_to_event_id):
+    """Move the student's cursor forward to up_to_event_id (never backwards)"""
+    # A cursor past the newest event would silently swallow future notifications
+    _advance_cursor(student_id, min(up_to_event_id, _latest_event_id()))
+
+
+def _advance_cursor(student_id, up_to_event_id):
+    with transaction.atomic():
+        cursor, created = NotificationCursor.objects.get_or_create(
+            student_id=student_id, defaults={'last_seen_event_id': up_to_event_id}
+        )
+        if not created:
+            NotificationCursor.objects.filter(student_id=student_id).update(
+                last_seen_event_id=Greatest(F('last_seen_event_id'), up_to_event_id)
+            )
+
+
+def mark_all_read(student_id):
+    """Move the student's cursor to the newest event"""
+    _advance_cursor(student_id, _latest_event_id())
@@ -0,0 +1,216 @@
+"""Per-teacher and per-unit storage quotas.
+
+Usage lives in ``StorageUsage`` counters, one row per teacher and one per
+unit, that the upload, trash, restore and move paths adjust in the same
+transaction as the files they change. Checking a quota is therefore a
+conditional UPDATE of a single row, never a ``SUM`` over ``UploadedFile``.
+Only live files count: trashing a file frees its quota, restoring it charges
+it again. ``reconcile_storage_usage`` rebuilds the counters from the files
+if they ever drift.
+"""
+import logging
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import CourseUnit, StorageUsage, UploadedFile
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(ValueError):
+    """Raised when a change would take a teacher or unit over its quota"""
+
+
+def _defaults(unit_id):
+    if unit_id is None:
+        return settings.TEACHER_QUOTA_BYTES, settings.TEACHER_QUOTA_FILES
+    return settings.UNIT_QUOTA_BYTES, settings.UNIT_QUOTA_FILES
+
+
+def _within(used_field, limit_field, default, delta):
+    """Rows where adding ``delta`` keeps ``used_field`` within the row's limit or the default"""
+    if delta <= 0:
+        return Q()
+    override = Q(**{f'{limit_field}__isnull': False, f'{used_field}__lte': F(limit_field) - delta})
+    if default is None:
+        return override | Q(**{f'{limit_field}__isnull': True})
+    return override | Q(**{f'{limit_field}__isnull': True, f'{used_field}__lte': default - delta})
+
+
+def _adjust(teacher_id, unit_id, size, count, enforce):
+    rows = StorageUsage.objects.filter(teacher_id=teacher_id, unit_id=unit_id)
+    change = {'bytes_used': F('bytes_used') + size, 'files_used': F('files_used') + count}
+    if not enforce:
+        # A missing counter is rebuilt by reconcile_storage_usage, not guessed here
+        rows.update(**change)
+        return
+    max_bytes, max_files = _defaults(unit_id)
+    allowed = rows.filter(
+        _within('bytes_used', 'max_bytes', max_bytes, size), _within('files_used', 'max_files', max_files, count)
+    )
+    if allowed.update(**change):
+        return
+    # Either over the limit or the first file of this teacher or unit: make sure the counter exists and retry
+    StorageUsage.objects.bulk_create([StorageUsage(teacher_id=teacher_id, unit_id=unit_id)], ignore_conflicts=True)
+    if not allowed.update(**change):
+        scope = 'this unit' if unit_id is not None else 'your account'
+        raise QuotaExceeded(f'Storage quota exceeded for {scope}')
+
+
+def charge(teacher_id, unit_deltas, enforce=True):
+    """Add ``{unit_id: (bytes, files)}`` to the unit counters and their sum to the teacher's.
+
+    Negative deltas release usage. With ``enforce``, raises ``QuotaExceeded``
+    if any counter that grows would go over its limit. Call inside the
+    transaction that changes the files, so a failure rolls back both.
+    """
+    total_bytes = sum(size for size, _ in unit_deltas.values())
+    total_files = sum(count for _, count in unit_deltas.values())
+    # Teacher row first, then units by id, so concurrent charges lock in the same order
+    if total_bytes or total_files:
+        _adjust(teacher_id, None, total_bytes, total_files, enforce)
+    for unit_id in sorted(unit_deltas):
+        size, count = unit_deltas[unit_id]
+        if size or count:
+            _adjust(teacher_id, unit_id, size, count, enforce)
+
+
+def release(teacher_id, unit_deltas):
+    """Subtract ``{unit_id: (bytes, files)}``; never fails on limits"""
+    charge(teacher_id, {unit_id: (-size, -count) for unit_id, (size, count) in unit_deltas.items()}, enforce=False)
+
+
+def by_unit(rows):
+    """``{unit_id: (bytes, files)}`` from (unit_id, file_size) pairs"""
+    deltas = {}
+    for unit_id, file_size in rows:
+        size, count = deltas.get(unit_id, (0, 0))
+        deltas[unit_id] = (size + file_size, count + 1)
+    return deltas
+
+
+def _limits(row, unit_id):
+    max_bytes, max_files = _defaults(unit_id)
+    if row is not None:
+        max_bytes = row.max_bytes if row.max_bytes is not None else max_bytes
+        max_files = row.max_files if row.max_files is not None else max_files
+    return max_bytes, max_files
+
+
+def _usage(row, unit_id):
+    max_bytes, max_files = _limits(row, unit_id)
+    return {
+        'bytes_used': row.bytes_used if row else 0,
+        'files_used': row.files_used if row else 0,
+        'max_bytes': max_bytes,
+        'max_files': max_files,
+    }
+
+
+def remaining(teacher_id, unit_id=None):
+    """(bytes, files) the teacher can still upload, into ``unit_id`` if given; None means unlimited"""
+    scopes = Q(unit__isnull=True) if unit_id is None else Q(unit__isnull=True) | Q(unit_id=unit_id)
+    rows = {row.unit_id: row for row in StorageUsage.objects.filter(scopes, teacher_id=teacher_id)}
+    left_bytes = left_files = None
+    for scope in {None, unit_id}:
+        usage = _usage(rows.get(scope), scope)
+        if usage['max_bytes'] is not None:
+            left = max(usage['max_bytes'] - usage['bytes_used'], 0)
+            left_bytes = left if left_bytes is None else min(left_bytes, left)
+        if usage['max_files'] is not None:
+            left = max(usage['max_files'] - usage['files_used'], 0)
+            left_files = left if left_files is None else min(left_files, left)
+    return left_bytes, left_files
+
+
+def account_usage(teacher_id):
+    """The teacher's overall usage and limits"""
+    return _usage(StorageUsage.objects.filter(teacher_id=teacher_id, unit__isnull=True).first(), None)
+
+
+def usage(teacher_id):
+    """The teacher's usage and limits, overall and per live unit"""
+    rows = {row.unit_id: row for row in StorageUsage.objects.filter(teacher_id=teacher_id)}
+    units = CourseUnit.objects.filter(teacher_id=teacher_id).values_list('id', 'name')
+    return {
+        **_usage(rows.get(None), None),
+        'units': [{'id': unit_id, 'name': name, **_usage(rows.get(unit_id), unit_id)} for unit_id, name in units],
+    }
+
+
+def reconcile():
+    """Rebuild every counter from the live files; returns the number of counters corrected"""
+    with transaction.atomic():
+        # Lock the counters first: uploads charging now wait, and their files land
+        # either in the totals below or after this transaction, on top of them
+        existing = {(row.teacher_id, row.unit_id): row for row in StorageUsage.objects.select_for_update()}
+        totals = {}
+        per_unit = UploadedFile.objects.values('teacher_id', 'unit_id').annotate(size=Sum('file_size'), count=Count('id'))
+        for row in per_unit.order_by():
+            for key in ((row['teacher_id'], row['unit_id']), (row['teacher_id'], None)):
+                size, count = totals.get(key, (0, 0))
+                totals[key] = (size + row['size'], count + row['count'])
+
+        changed, created = [], []
+        for key in existing.keys() | totals.keys():
+            size, count = totals.get(key, (0, 0))
+            row = existing.get(key)
+            if row is None:
+                created.append(StorageUsage(teacher_id=key[0], unit_id=key[1], bytes_used=size, files_used=count))
+            elif (row.bytes_used, row.files_used) != (size, count):
+                logger.warning(
+                    "Storage usage of teacher %s unit %s drifted: %d bytes/%d files, actual %d/%d",
+                    key[0], key[1], row.bytes_used, row.files_used, size, count,
+                )
+                row.bytes_used, row.files_used = size, count
+                changed.append(row)
+        StorageUsage.objects.bulk_update(changed, ['bytes_used', 'files_used'], batch_size=500)
+        StorageUsage.objects.bulk_create(created, batch_size=500)
+    return len(changed) + len(created)
+
+
+class QuotaUploadHandler(FileUploadHandler):
+    """Stop reading an upload as soon as its files exceed the remaining quota.
+
+    Install first in ``request.upload_handlers`` before the body is read. Once
+    the limit is passed the rest of the body is discarded unparsed, so nothing
+    more is spooled to disk; the view checks ``exceeded`` and rejects the request.
+    """
+
+    def __init__(self, remaining_bytes, remaining_files, request=None):
+        super().__init__(request)
+        self.remaining_bytes = remaining_bytes
+        self.remaining_files = remaining_files
+        self.exceeded = False
+
+    def _stop(self):
+        self.exceeded = True
+        # Drain instead of resetting the connection, so the client still receives the JSON error
+        raise StopUpload(connection_reset=False)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        if self.remaining_files is not None:
+            self.remaining_files -= 1
+            if self.remaining_files < 0:
+                self._stop()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.remaining_bytes is not None:
+            self.remaining_bytes -= len(raw_data)
+            if self.remaining_bytes < 0:
+                self._stop()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def guard_upload(request, teacher_id, unit_id=None):
+    """Install a ``QuotaUploadHandler`` for the teacher (and unit) on a request whose body is unread"""
+    handler = QuotaUploadHandler(*remaining(teacher_id, unit_id), request=request)
+    request.upload_handlers.insert(0, handler)
+    return handler
@@ -0,0 +1,200 @@
+"""Bulk import of student accounts from a CSV roster.
+
+The CSV is read row by row and handled in batches: each batch is validated,
+checked against existing emails with one query, hashed across a process pool
+and written with one ``bulk_create`` inside a transaction. Rows that cannot
+be imported are collected in a per-row error report instead of aborting the
+import.
+
+Expected columns: ``full_name``, ``email`` and optionally ``password`` and
+``subject``. Rows without a password use the default password given to
+:func:`import_roster`, if any. Given a teacher, the new accounts are
+enrolled in that teacher's course in the same transaction.
+
+Hashing is the slow part (PBKDF2, about half a second per row), so web
+requests import at most ``ROSTER_API_MAX_ROWS`` rows in-process; the process
+pool is only for the ``import_roster`` management command, never forked
+from a web worker.
+"""
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from . import notifications
+from .models import Enrollment, UserSignup
+
+BATCH_SIZE = 1000
+REQUIRED_COLUMNS = ('full_name', 'email')
+# Below this many passwords a batch is hashed in-process; starting workers costs more
+MIN_PARALLEL_HASHES = 32
+# Inserts of a batch before its remaining rows are reported: each retry drops emails taken meanwhile
+INSERT_ATTEMPTS = 3
+
+
+class RosterError(ValueError):
+    """Raised when the roster as a whole cannot be read (e.g. missing columns)"""
+
+
+@dataclass
+class RosterResult:
+    created: int = 0
+    errors: list = field(default_factory=list)  # (line number, email, message)
+
+    def add_error(self, line, email, message):
+        self.errors.append((line, email, message))
+
+
+def _validate(row, default_password):
+    """Cleaned (full_name, email, password, subject) for a row, or raise ValidationError"""
+    full_name = (row.get('full_name') or '').strip()
+    email = (row.get('email') or '').strip()
+    password = row.get('password') or default_password
+    subject = (row.get('subject') or '').strip() or None
+    if not full_name:
+        raise ValidationError('full_name is required')
+    if len(full_name) > UserSignup._meta.get_field('full_name').max_length:
+        raise ValidationError('full_name is too long')
+    if not email:
+        raise ValidationError('email is required')
+    validate_email(email)
+    if not password:
+        raise ValidationError('password is required')
+    return full_name, email, password, subject
+
+
+def _hash_all(passwords, pool, workers):
+    if pool is None or len(passwords) < MIN_PARALLEL_HASHES:
+        return [make_password(p) for p in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def _create(users, teacher_id):
+    with transaction.atomic():
+        UserSignup.objects.bulk_create(users)
+        student_ids = [user.id for user in users]
+        notifications.start_cursors(student_ids)
+        if teacher_id is not None:
+            Enrollment.objects.bulk_create([Enrollment(teacher_id=teacher_id, student_id=i) for i in student_ids])
+
+
+def _insert(pending, result, teacher_id):
+    """Create the batch's accounts; rows that lost a race with a concurrent signup or import are reported"""
+    rows = [
+        (line, UserSignup(full_name=full_name, email=email, password=hashed, subject=subject, role='student'))
+        for line, full_name, email, hashed, subject in pending
+    ]
+    for _ in range(INSERT_ATTEMPTS):
+        try:
+            _create([user for _, user in rows], teacher_id)
+            result.created += len(rows)
+            return
+        except IntegrityError:
+            pass
+        # Someone signed up with some of these emails after our duplicate check: drop those rows and retry
+        taken = set(UserSignup.objects.filter(email__in=[user.email for _, user in rows]).values_list('email', flat=True))
+        remaining = []
+        for line, user in rows:
+            if user.email in taken:
+                result.add_error(line, user.email, 'An account with this email already exists')
+            else:
+                user.pk = None  # assigned by the insert that rolled back
+                remaining.append((line, user))
+        if not remaining:
+            return
+        if len(remaining) == len(rows):
+            break  # The conflict was not a taken email, so retrying would fail the same way
+        rows = remaining
+    for line, user in rows:
+        result.add_error(line, user.email, 'Could not be created while another import was running; import it again')
+
+
+def _import_batch(batch, pool, workers, default_password, teacher_id, seen, result):
+    valid = []
+    for line, row in batch:
+        try:
+            full_name, email, password, subject = _validate(row, default_password)
+        except ValidationError as e:
+            result.add_error(line, (row.get('email') or '').strip(), '; '.join(e.messages))
+            continue
+        if email.lower() in seen:
+            result.add_error(line, email, 'Duplicate email in roster')
+            continue
+        seen.add(email.lower())
+        valid.append((line, full_name, email, password, subject))
+    if not valid:
+        return
+
+    existing = set(
+        UserSignup.objects.filter(email__in=[email for _, _, email, _, _ in valid]).values_list('email', flat=True)
+    )
+    pending = []
+    for row in valid:
+        if row[2] in existing:
+            result.add_error(row[0], row[2], 'An account with this email already exists')
+        else:
+            pending.append(row)
+    if not pending:
+        return
+
+    hashes = _hash_all([password for _, _, _, password, _ in pending], pool, workers)
+    _insert(
+        [(line, full_name, email, hashed, subject) for (line, full_name, email, _, subject), hashed in zip(pending, hashes)],
+        result,
+        teacher_id,
+    )
+
+
+def default_workers():
+    """Hashing processes for the management command: ROSTER_HASH_WORKERS, or one per CPU"""
+    return settings.ROSTER_HASH_WORKERS or os.cpu_count() or 1
+
+
+def import_roster(fileobj, default_password=None, batch_size=BATCH_SIZE, workers=1, max_rows=None, teacher_id=None):
+    """Import student accounts from a text-mode CSV file object; returns a RosterResult.
+
+    ``workers`` > 1 hashes on a process pool. With ``max_rows``, a longer
+    roster raises RosterError before anything is imported. With
+    ``teacher_id``, new students are enrolled in that teacher's course.
+    """
+    reader = csv.DictReader(fileobj)
+    columns = [c.strip() for c in reader.fieldnames or []]
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise RosterError(f'Missing column(s): {", ".join(missing)}')
+    reader.fieldnames = columns
+    # Line numbers as a spreadsheet shows them: the header is line 1
+    rows = ((reader.line_num, row) for row in reader)
+    if max_rows is not None:
+        # Small enough to hold: read it all, so a roster over the limit imports nothing
+        rows = list(itertools.islice(rows, max_rows + 1))
+        if len(rows) > max_rows:
+            raise RosterError(f'At most {max_rows} rows per upload; import larger rosters with manage.py import_roster')
+
+    # Spawned workers need Django set up before they can unpickle anything from the project
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=django.setup) if workers > 1 else None
+    result = RosterResult()
+    seen = set()
+    try:
+        batch = []
+        for line, row in rows:
+            batch.append((line, row))
+            if len(batch) >= batch_size:
+                _import_batch(batch, pool, workers, default_password, teacher_id, seen, result)
+                batch = []
+        if batch:
+            _import_batch(batch, pool, workers, default_password, teacher_id, seen, result)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    result.errors.sort(key=lambda error: error[0])
+    return result
@@ -0,0 +1,76 @@
+"""Scheduled publish/unpublish of uploaded files.
+
+Only rows with ``publish_at``/``unpublish_at`` set are in the partial due
+indexes, so finding the next due time is one ``ORDER BY ... LIMIT 1`` index
+probe and each release is a batched UPDATE by primary key.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadedFile
+from .services import files_published, files_unpublished
+
+BATCH_SIZE = 1000
+
+
+def next_due_at():
+    """Earliest pending publish_at/unpublish_at, or None when nothing is scheduled"""
+    candidates = [
+        UploadedFile.objects.filter(publish_at__isnull=False).order_by('publish_at').values_list('publish_at', flat=True).first(),
+        UploadedFile.objects.filter(unpublish_at__isnull=False).order_by('unpublish_at').values_list('unpublish_at', flat=True).first(),
+    ]
+    candidates = [c for c in candidates if c is not None]
+    return min(candidates) if candidates else None
+
+
+def _release_batch(now):
+    """Publish one batch of due files; returns (rows handled, files that were not published before)"""
+    with transaction.atomic():
+        due = list(
+            UploadedFile.objects.filter(publish_at__lte=now)
+            .order_by('publish_at')
+            .select_for_update()
+            .values_list('id', 'teacher_id', 'unit_id', 'is_published')[:BATCH_SIZE]
+        )
+        if not due:
+            return 0, 0
+        UploadedFile.objects.filter(id__in=[row[0] for row in due]).update(is_published=True, publish_at=None)
+        # Already-published rows only have their schedule cleared
+        released = [(file_id, teacher_id, unit_id) for file_id, teacher_id, unit_id, was_published in due if not was_published]
+        files_published(released)
+    return len(due), len(released)
+
+
+def _withdraw_batch(now):
+    """Unpublish one batch of due files; returns (rows handled, files that were published before)"""
+    with transaction.atomic():
+        due = list(
+            UploadedFile.objects.filter(unpublish_at__lte=now)
+            .order_by('unpublish_at')
+            .select_for_update()
+            .values_list('id', 'teacher_id', 'unit_id', 'is_published')[:BATCH_SIZE]
+        )
+        if not due:
+            return 0, 0
+        UploadedFile.objects.filter(id__in=[row[0] for row in due]).update(is_published=False, unpublish_at=None)
+        # Drafts only have their schedule cleared
+        withdrawn = [(file_id, teacher_id, unit_id) for file_id, teacher_id, unit_id, was_published in due if was_published]
+        files_unpublished(withdrawn)
+    return len(due), len(withdrawn)
+
+
+def run_due(now=None):
+    """Apply every schedule that is due; returns how many files changed (published, unpublished)"""
+    now = now or timezone.now()
+    published = unpublished = 0
+    while True:
+        handled, count = _release_batch(now)
+        published += count
+        if handled < BATCH_SIZE:
+            break
+    while True:
+        handled, count = _withdraw_batch(now)
+        unpublished += count
+        if handled < BATCH_SIZE:
+            break
+    return published, unpublished
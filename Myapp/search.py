@@ -0,0 +1,320 @@
+"""Full-text search over the content of uploaded documents.
+
+``index_pending()`` (the ``index_documents`` command) extracts the text of
+files that have none yet, page by page within the ``SEARCH_EXTRACT_*``
+budgets, stores it zlib-compressed in ``DocumentText`` and writes one index
+row per page: an FTS5 table on SQLite, a ``tsvector`` table with a GIN index
+on PostgreSQL. A file is re-extracted only when the SHA-256 of its blob
+changes, and a blob already extracted for another file reuses that text.
+
+``search()`` supports words (stemmed), ``"quoted phrases"`` and ``prefix*``
+terms, all of which must match on the same page. It runs one index query
+for the ranked file ids and one for the files, then builds a highlighted
+snippet from the stored text of those few files only.
+"""
+import codecs
+import hashlib
+import logging
+import re
+import tempfile
+import time
+import zlib
+from dataclasses import dataclass
+from html import escape
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from . import extraction
+from .models import DocumentText, Enrollment, UploadedFile
+
+logger = logging.getLogger(__name__)
+
+SQLITE_TABLE = 'Myapp_search_index'
+POSTGRES_TABLE = 'Myapp_search_page'
+POSTGRES_CONFIG = 'english'
+# SQLite index rows are keyed by file id and page number packed into the rowid
+PAGE_BITS = 16
+MAX_PAGES = (1 << PAGE_BITS) - 1
+SPOOL_MEMORY = 4 * 1024 * 1024  # Blobs larger than this are spooled to a temporary file while extracted
+MAX_CLAUSES = 8
+TOKEN = re.compile(r'[^\W_]+')
+
+
+@dataclass
+class IndexResult:
+    indexed: int = 0
+    unchanged: int = 0
+    failed: int = 0
+
+
+def _clean(text):
+    # Form feeds separate pages in the stored text; NULs can't be indexed
+    return re.sub(r'[\s\x00]+', ' ', text).strip()
+
+
+def iter_pages(blob):
+    """Pages of a compressed ``DocumentText.text``, decompressed a chunk at a time"""
+    blob = bytes(blob)
+    if not blob:
+        return
+    decompressor = zlib.decompressobj()
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    for start in range(0, len(blob), 64 * 1024):
+        pending += decoder.decode(decompressor.decompress(blob[start:start + 64 * 1024]))
+        *done, pending = pending.split('\f')
+        yield from done
+    pending += decoder.decode(decompressor.flush(), final=True)
+    yield from pending.split('\f')
+
+
+def _extract(file_kind, stream):
+    """(compressed text, pages, status, error) of a document, within the extraction budgets"""
+    compressor = zlib.compressobj()
+    parts, count, chars = [], 0, 0
+    status, error = 'done', ''
+    deadline = time.monotonic() + settings.SEARCH_EXTRACT_SECONDS
+    try:
+        for text in extraction.pages(file_kind, stream):
+            text = _clean(text)[:settings.SEARCH_EXTRACT_MAX_CHARS - chars]
+            parts.append(compressor.compress((('\f' if count else '') + text).encode('utf-8')))
+            count += 1
+            chars += len(text)
+            if chars >= settings.SEARCH_EXTRACT_MAX_CHARS or count >= MAX_PAGES:
+                status, error = 'truncated', f'Stopped at {count} pages, {chars} characters'
+                break
+            if time.monotonic() > deadline:
+                status, error = 'truncated', f'Stopped after {settings.SEARCH_EXTRACT_SECONDS}s at page {count}'
+                break
+    except Exception as e:
+        # Broken documents raise all sorts of parser errors; keep whatever pages were read
+        if not isinstance(e, extraction.UnsupportedDocument):
+            logger.warning("Text extraction failed after %d pages", count, exc_info=True)
+        status, error = ('truncated' if count else 'failed'), str(e)[:200]
+    if not count:
+        return b'', 0, status, error
+    parts.append(compressor.flush())
+    return b''.join(parts), count, status, error
+
+
+def _read_blob(file_record):
+    """SHA-256 of the stored blob and a seekable copy of it"""
+    digest = hashlib.sha256()
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY)
+    with file_record.file.open('rb') as fh:
+        for chunk in fh.chunks():
+            digest.update(chunk)
+            spool.write(chunk)
+    spool.seek(0)
+    return digest.hexdigest(), spool
+
+
+def _write_index(connection, file_id, pages, delete=False):
+    """Add (or, with ``delete``, remove exactly) the index rows of one file's pages"""
+    table = connection.ops.quote_name(SQLITE_TABLE if connection.vendor == 'sqlite' else POSTGRES_TABLE)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            if delete:
+                cursor.execute(f"DELETE FROM {table} WHERE file_id = %s", [file_id])
+            else:
+                cursor.executemany(
+                    f"INSERT INTO {table} (file_id, page, vector) VALUES (%s, %s, to_tsvector('{POSTGRES_CONFIG}', %s))",
+                    [(file_id, page, text) for page, text in enumerate(pages)],
+                )
+        elif connection.vendor == 'sqlite':
+            # A contentless FTS5 table forgets the text, so a delete must replay exactly what was indexed
+            command = f"INSERT INTO {table} ({table}, rowid, body) VALUES ('delete', %s, %s)" if delete else \
+                f"INSERT INTO {table} (rowid, body) VALUES (%s, %s)"
+            cursor.executemany(command, [((file_id << PAGE_BITS) | page, text) for page, text in enumerate(pages)])
+
+
+def index_file(file_record, recheck=False):
+    """Extract and index the text of a file; returns True if it was (re-)extracted.
+
+    With ``recheck``, a file that already has text is read again and
+    re-extracted only if its content hash changed.
+    """
+    current = DocumentText.objects.filter(file=file_record).first()
+    if current is not None and not recheck:
+        return False
+    digest, blob, pages, status, error = '', b'', 0, 'failed', ''
+    if file_record.file_kind not in extraction.EXTRACTORS:
+        error = f'No text extractor for {file_record.file_kind} files'
+    elif file_record.file_size > settings.SEARCH_EXTRACT_MAX_BYTES:
+        error = f'Larger than {settings.SEARCH_EXTRACT_MAX_BYTES} bytes'
+    else:
+        digest, spool = _read_blob(file_record)
+        with spool:
+            if current is not None and current.content_hash == digest:
+                return False
+            same = DocumentText.objects.filter(content_hash=digest).exclude(status='failed').first()
+            if same is not None:
+                blob, pages, status, error = bytes(same.text), same.pages, same.status, same.error
+            else:
+                blob, pages, status, error = _extract(file_record.file_kind, spool)
+    if current is not None and (current.content_hash, current.status) == (digest, status):
+        return False
+
+    connection = connections[router.db_for_write(DocumentText)]
+    with transaction.atomic(using=connection.alias):
+        if current is not None:
+            _write_index(connection, file_record.id, iter_pages(current.text), delete=True)
+        _write_index(connection, file_record.id, iter_pages(blob))
+        DocumentText.objects.update_or_create(file=file_record, defaults={
+            'content_hash': digest, 'status': status, 'text': blob, 'pages': pages, 'error': error,
+            'extracted_at': timezone.now(),
+        })
+    return True
+
+
+def index_pending(batch_size=50, recheck=False):
+    """Index live files without extracted text (with ``recheck``, every live file whose content changed)"""
+    result = IndexResult()
+    files = UploadedFile.objects.order_by('id')
+    if not recheck:
+        files = files.filter(document_text__isnull=True)
+    last_id = 0
+    while True:
+        batch = list(files.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return result
+        last_id = batch[-1].id
+        for file_record in batch:
+            try:
+                extracted = index_file(file_record, recheck=recheck)
+            except Exception as e:
+                # Storage errors and the like: record them so the file isn't retried on every run
+                logger.exception("Indexing file %s failed", file_record.id)
+                DocumentText.objects.get_or_create(
+                    file=file_record, defaults={'content_hash': '', 'status': 'failed', 'error': str(e)[:200]},
+                )
+                result.failed += 1
+                continue
+            if extracted:
+                result.indexed += 1
+            else:
+                result.unchanged += 1
+
+
+def unindex(file_ids):
+    """Drop files from the index; call before deleting their rows, while their text still exists"""
+    connection = connections[router.db_for_write(DocumentText)]
+    with transaction.atomic(using=connection.alias):
+        for file_id, blob in DocumentText.objects.filter(file_id__in=file_ids).values_list('file_id', 'text'):
+            _write_index(connection, file_id, iter_pages(blob), delete=True)
+
+
+def parse(query):
+    """(tokens, prefix) clauses of a query: words, "quoted phrases" and prefix* terms"""
+    clauses = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        tokens = tuple(token.lower() for token in TOKEN.findall(phrase or word))
+        if tokens:
+            clauses.append((tokens, word.endswith('*')))
+    return clauses[:MAX_CLAUSES]
+
+
+def _match_expression(vendor, clauses):
+    if vendor == 'postgresql':
+        return ' & '.join(' <-> '.join(tokens) + (':*' if prefix else '') for tokens, prefix in clauses)
+    # Tokens are letters and digits only, so quoting them is all the escaping FTS5 needs
+    return ' AND '.join('"' + ' '.join(tokens) + '"' + ('*' if prefix else '') for tokens, prefix in clauses)
+
+
+def _matching_file_ids(connection, clauses, teacher_id, student_id, limit):
+    files = connection.ops.quote_name(UploadedFile._meta.db_table)
+    expression = _match_expression(connection.vendor, clauses)
+    # Teachers search their own files, students the published files of the courses they are enrolled in
+    if teacher_id is not None:
+        visible, visible_params = 'u.teacher_id = %s', [teacher_id]
+    else:
+        enrollments = connection.ops.quote_name(Enrollment._meta.db_table)
+        visible = f'u.is_published = %s AND u.teacher_id IN (SELECT e.teacher_id FROM {enrollments} e WHERE e.student_id = %s)'
+        visible_params = [True, student_id]
+    if connection.vendor == 'postgresql':
+        table = connection.ops.quote_name(POSTGRES_TABLE)
+        sql = f"""
+            SELECT p.file_id FROM {table} p JOIN {files} u ON u.id = p.file_id
+            WHERE p.vector @@ to_tsquery('{POSTGRES_CONFIG}', %s) AND u.deleted_at IS NULL AND {visible}
+            GROUP BY p.file_id ORDER BY MAX(ts_rank(p.vector, to_tsquery('{POSTGRES_CONFIG}', %s))) DESC LIMIT %s
+        """
+        params = [expression, *visible_params, expression, limit]
+    elif connection.vendor == 'sqlite':
+        table = connection.ops.quote_name(SQLITE_TABLE)
+        sql = f"""
+            SELECT m.file_id FROM (
+                SELECT rowid >> {PAGE_BITS} AS file_id, rank FROM {table} WHERE {table} MATCH %s
+            ) m JOIN {files} u ON u.id = m.file_id
+            WHERE u.deleted_at IS NULL AND {visible}
+            GROUP BY m.file_id ORDER BY MIN(m.rank) LIMIT %s
+        """
+        params = [expression, *visible_params, limit]
+    else:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _highlighter(clauses):
+    # Stemmed matches ("laws" for "law") end in extra letters, so every term may run on
+    terms = [r'\W+'.join(map(re.escape, tokens)) + r'\w*' for tokens, _ in clauses]
+    return re.compile(r'\b(?:' + '|'.join(terms) + ')', re.IGNORECASE)
+
+
+def snippet(blob, pattern, width=200):
+    """(page number, HTML snippet with <mark>ed matches) of the first page that matches"""
+    first = None
+    for number, text in enumerate(iter_pages(blob), 1):
+        match = pattern.search(text)
+        if match is None:
+            if first is None:
+                first = (number, escape(text[:width]) + ('…' if len(text) > width else ''))
+            continue
+        start = max(match.start() - width // 4, 0)
+        end = min(start + width, len(text))
+        window, parts, last = text[start:end], [], 0
+        for m in pattern.finditer(window):
+            parts += [escape(window[last:m.start()]), f'<mark>{escape(m.group())}</mark>']
+            last = m.end()
+        parts.append(escape(window[last:]))
+        return number, ('…' if start else '') + ''.join(parts) + ('…' if end < len(text) else '')
+    # Matched through stemming the highlighter can't follow: show the start of the document
+    return first or (1, '')
+
+
+def search(query, teacher_id=None, student_id=None, limit=20):
+    """Files whose text matches ``query``, best first, each with a page number and snippet.
+
+    Searches the files of ``teacher_id``, or else the published files of
+    the courses ``student_id`` is enrolled in.
+    """
+    clauses = parse(query)
+    if not clauses:
+        return []
+    connection = connections[router.db_for_read(DocumentText)]
+    ids = _matching_file_ids(connection, clauses, teacher_id, student_id, limit)
+    files = UploadedFile.objects.select_related('unit', 'teacher', 'document_text').in_bulk(ids)
+    pattern = _highlighter(clauses)
+    results = []
+    for file_id in ids:
+        file_record = files.get(file_id)
+        if file_record is None:
+            continue
+        page, text = snippet(file_record.document_text.text, pattern)
+        results.append({
+            'id': file_id,
+            'name': file_record.original_name,
+            'file_kind': file_record.file_kind,
+            'unit_id': file_record.unit_id,
+            'unit_name': file_record.unit.name,
+            'teacher_name': file_record.teacher.full_name,
+            'page': page,
+            'snippet': text,
+            'download_url': reverse('download_file', args=[file_id]),
+            'preview_url': reverse('preview_file', args=[file_id]),
+        })
+    return results
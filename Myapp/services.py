@@ -0,0 +1,275 @@
+"""Set-based file operations shared by the legacy views and the v1 API.
+
+Every operation is scoped to the teacher's own rows in the UPDATE's WHERE
+clause, so ownership is checked by the same statement that does the work.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .events import publish_event
+from .models import CourseUnit, UploadedFile
+from . import notifications, quotas
+
+BULK_ACTIONS = ('publish', 'unpublish', 'set_tag', 'move', 'schedule')
+TAG_VALUES = {value for value, _ in UploadedFile.TAG_CHOICES}
+
+
+class BulkActionError(ValueError):
+    """Raised when a bulk request is malformed or targets something the teacher does not own"""
+
+
+def select_files(teacher, file_ids=None, unit_id=None, tag=None):
+    """Teacher-scoped queryset from a list of ids and/or a unit/tag selector"""
+    if not file_ids and unit_id is None and tag is None:
+        raise BulkActionError('Provide file_ids or a unit_id/filter_tag selector')
+    files = UploadedFile.objects.filter(teacher=teacher)
+    if file_ids:
+        files = files.filter(id__in=file_ids)
+    if unit_id is not None:
+        files = files.filter(unit_id=unit_id)
+    if tag is not None:
+        files = files.filter(tag=tag)
+    return files
+
+
+def files_published(rows):
+    """Hooks for files that just became visible: notifications and live events.
+
+    ``rows`` are (id, teacher_id, unit_id) tuples; call inside the transaction
+    that published them so both commit together.
+    """
+    if not rows:
+        return
+    notifications.record_file_events(
+        'file_published',
+        [UploadedFile(id=file_id, teacher_id=teacher_id, unit_id=unit_id) for file_id, teacher_id, unit_id in rows],
+    )
+    grouped = {}
+    for file_id, teacher_id, unit_id in rows:
+        grouped.setdefault((teacher_id, unit_id), []).append(file_id)
+    for (teacher_id, unit_id), file_ids in grouped.items():
+        publish_event('file_published', teacher_id=teacher_id, unit_id=unit_id, file_ids=file_ids)
+
+
+def files_unpublished(rows):
+    """Hooks for files that were just hidden from students: retract their notifications and send live events.
+
+    ``rows`` are (id, teacher_id, unit_id) tuples; call inside the transaction
+    that unpublished them. With the old notification gone, publishing a file
+    again notifies its students again.
+    """
+    if not rows:
+        return
+    notifications.retract_file_events('file_published', [row[0] for row in rows])
+    grouped = {}
+    for file_id, teacher_id, unit_id in rows:
+        grouped.setdefault((teacher_id, unit_id), []).append(file_id)
+    for (teacher_id, unit_id), file_ids in grouped.items():
+        publish_event('file_unpublished', teacher_id=teacher_id, unit_id=unit_id, file_ids=file_ids)
+
+
+def _owned(queryset, teacher):
+    """Scope to the teacher's rows; ``teacher=None`` (admin actions) leaves every teacher's rows in"""
+    return queryset if teacher is None else queryset.filter(teacher=teacher)
+
+
+def set_published(teacher, files, is_published=True):
+    """Publish or unpublish the selected files with one UPDATE; returns the number changed"""
+    with transaction.atomic():
+        # Lock and remember the rows that will actually flip, for notifications and events
+        changed = list(
+            files.filter(is_published=not is_published)
+            .select_for_update()
+            .values_list('id', 'teacher_id', 'unit_id')
+        )
+        if not changed:
+            return 0
+        updated = _owned(UploadedFile.objects.filter(id__in=[row[0] for row in changed]), teacher).update(
+            is_published=is_published
+        )
+        (files_published if is_published else files_unpublished)(changed)
+    return updated
+
+
+def set_schedule(teacher, files, publish_at=None, unpublish_at=None):
+    """Set (or clear, with None) the scheduled publish/unpublish times with one UPDATE"""
+    if publish_at and unpublish_at and unpublish_at <= publish_at:
+        raise BulkActionError('unpublish_at must be after publish_at')
+    with transaction.atomic():
+        return files.filter(teacher=teacher).update(publish_at=publish_at, unpublish_at=unpublish_at)
+
+
+def set_tag(teacher, files, tag):
+    """Retag the selected files with one UPDATE"""
+    if tag not in TAG_VALUES:
+        raise BulkActionError(f'Unknown tag: {tag}')
+    with transaction.atomic():
+        return files.filter(teacher=teacher).exclude(tag=tag).update(tag=tag)
+
+
+def move_to_unit(teacher, files, target_unit_id):
+    """Move the selected files into another of the teacher's units with one UPDATE"""
+    with transaction.atomic():
+        if not CourseUnit.objects.filter(id=target_unit_id, teacher=teacher).exists():
+            raise BulkActionError('Target unit not found')
+        moving = list(
+            files.filter(teacher=teacher).exclude(unit_id=target_unit_id)
+            .select_for_update().values_list('id', 'unit_id', 'file_size')
+        )
+        if not moving:
+            return 0
+        deltas = {unit_id: (-size, -count) for unit_id, (size, count) in quotas.by_unit(row[1:] for row in moving).items()}
+        deltas[target_unit_id] = (sum(row[2] for row in moving), len(moving))
+        _charge(teacher, deltas)
+        return UploadedFile.objects.filter(teacher=teacher, id__in=[row[0] for row in moving]).update(unit_id=target_unit_id)
+
+
+def trash_files(teacher, files):
+    """Tombstone the selected files with one UPDATE; blobs are purged later by the trash collector"""
+    with transaction.atomic():
+        trashed = list(
+            _owned(files, teacher).select_for_update().values_list('id', 'teacher_id', 'unit_id', 'file_size')
+        )
+        if not trashed:
+            return 0
+        count = _owned(UploadedFile.objects.filter(id__in=[row[0] for row in trashed]), teacher).update(
+            deleted_at=timezone.now()
+        )
+        _release_quota(trashed)
+        by_unit = {}
+        for file_id, teacher_id, unit_id, _ in trashed:
+            by_unit.setdefault((teacher_id, unit_id), []).append(file_id)
+        for (teacher_id, unit_id), file_ids in by_unit.items():
+            publish_event('file_deleted', teacher_id=teacher_id, unit_id=unit_id, file_ids=file_ids)
+    return count
+
+
+def _release_quota(rows):
+    """Give back the quota of trashed (id, teacher_id, unit_id, file_size) rows"""
+    by_teacher = {}
+    for _, teacher_id, unit_id, file_size in rows:
+        by_teacher.setdefault(teacher_id, []).append((unit_id, file_size))
+    for teacher_id, sizes in by_teacher.items():
+        quotas.release(teacher_id, quotas.by_unit(sizes))
+
+
+def trash_unit(teacher, unit):
+    """Tombstone a unit and its live files with the same timestamp, so a restore brings back exactly those files"""
+    now = timezone.now()
+    with transaction.atomic():
+        files = list(UploadedFile.objects.filter(unit=unit).select_for_update().values_list('id', 'file_size'))
+        file_ids = [file_id for file_id, _ in files]
+        CourseUnit.objects.filter(id=unit.id, teacher=teacher).update(deleted_at=now)
+        UploadedFile.objects.filter(unit=unit, teacher=teacher).update(deleted_at=now)
+        quotas.release(teacher.id, quotas.by_unit((unit.id, size) for _, size in files))
+        publish_event('file_deleted', teacher_id=teacher.id, unit_id=unit.id, file_ids=file_ids)
+    return len(file_ids)
+
+
+def trash_units(units):
+    """Tombstone many units of any teacher (admin actions) like ``trash_unit``, with set-based UPDATEs"""
+    now = timezone.now()
+    with transaction.atomic():
+        trashed = dict(units.filter(deleted_at__isnull=True).values_list('id', 'teacher_id'))
+        files = list(
+            UploadedFile.objects.filter(unit_id__in=trashed)
+            .select_for_update().values_list('id', 'teacher_id', 'unit_id', 'file_size')
+        )
+        count = CourseUnit.objects.filter(id__in=trashed).update(deleted_at=now)
+        UploadedFile.objects.filter(unit_id__in=trashed).update(deleted_at=now)
+        _release_quota(files)
+        file_ids = {}
+        for file_id, _, unit_id, _ in files:
+            file_ids.setdefault(unit_id, []).append(file_id)
+        for unit_id, teacher_id in trashed.items():
+            publish_event('file_deleted', teacher_id=teacher_id, unit_id=unit_id, file_ids=file_ids.get(unit_id, []))
+    return count
+
+
+def trash_cutoff():
+    """Oldest deleted_at that can still be restored"""
+    return timezone.now() - timedelta(days=settings.TRASH_RETENTION_DAYS)
+
+
+def restore_files(teacher, file_ids):
+    """Restore trashed files whose unit is still live; returns the number restored"""
+    with transaction.atomic():
+        restoring = list(
+            UploadedFile.all_objects.filter(
+                teacher=teacher,
+                id__in=file_ids,
+                deleted_at__gte=trash_cutoff(),
+                unit__deleted_at__isnull=True,
+            ).select_for_update().values_list('id', 'unit_id', 'file_size')
+        )
+        _charge(teacher, quotas.by_unit(row[1:] for row in restoring))
+        return UploadedFile.all_objects.filter(id__in=[row[0] for row in restoring]).update(deleted_at=None)
+
+
+def restore_unit(teacher, unit_id):
+    """Restore a trashed unit and the files trashed along with it; returns the number of files restored"""
+    with transaction.atomic():
+        unit = CourseUnit.all_objects.filter(
+            id=unit_id, teacher=teacher, deleted_at__gte=trash_cutoff()
+        ).first()
+        if unit is None:
+            raise BulkActionError('Unit not found in trash')
+        try:
+            with transaction.atomic():
+                CourseUnit.all_objects.filter(id=unit.id).update(deleted_at=None)
+        except IntegrityError:
+            raise BulkActionError(f'A unit named "{unit.name}" already exists')
+        restoring = UploadedFile.all_objects.filter(unit=unit, deleted_at=unit.deleted_at)
+        _charge(teacher, quotas.by_unit(restoring.values_list('unit_id', 'file_size')))
+        return restoring.update(deleted_at=None)
+
+
+def _charge(teacher, deltas):
+    """Charge quota usage, reporting an exceeded quota as a bulk action error"""
+    try:
+        quotas.charge(teacher.id, deltas)
+    except quotas.QuotaExceeded as e:
+        raise BulkActionError(str(e))
+
+
+def store_upload(teacher, unit, uploaded_file, tag='study_material'):
+    """Store an uploaded file as a draft in ``unit`` and charge it to the quotas; raises ``quotas.QuotaExceeded``"""
+    file_record = UploadedFile(
+        teacher=teacher,
+        unit=unit,
+        original_name=uploaded_file.name,
+        file_size=uploaded_file.size,
+        file_type=uploaded_file.content_type,
+        tag=tag,
+        is_published=False,  # Files start as drafts
+    )
+    # Write the blob before the transaction, so the database isn't held while it uploads
+    file_record.file.save(uploaded_file.name, uploaded_file, save=False)
+    try:
+        with transaction.atomic():
+            quotas.charge(teacher.id, {unit.id: (file_record.file_size, 1)})
+            file_record.save()
+    except Exception:
+        file_record.file.delete(save=False)
+        raise
+    return file_record
+
+
+def run_bulk_action(teacher, action, files, tag=None, target_unit_id=None, publish_at=None, unpublish_at=None):
+    """Dispatch a bulk action by name; returns the number of rows changed"""
+    if action == 'publish':
+        return set_published(teacher, files, True)
+    if action == 'unpublish':
+        return set_published(teacher, files, False)
+    if action == 'set_tag':
+        return set_tag(teacher, files, tag)
+    if action == 'move':
+        if target_unit_id is None:
+            raise BulkActionError('target_unit_id required')
+        return move_to_unit(teacher, files, target_unit_id)
+    if action == 'schedule':
+        return set_schedule(teacher, files, publish_at, unpublish_at)
+    raise BulkActionError(f'Unknown action: {action}. Expected one of {", ".join(BULK_ACTIONS)}')
@@ -0,0 +1,137 @@
+"""SQLite backend for running production traffic on a single SQLite file.
+
+Selected by ``SQLITE_PRODUCTION`` in settings, which also sets the pragmas
+(WAL, ``synchronous=NORMAL``, ``busy_timeout``, ``mmap_size``,
+``cache_size``) through ``OPTIONS['init_command']`` and makes transactions
+start with ``BEGIN IMMEDIATE``. On top of Django's SQLite backend:
+
+- Write transactions take turns on an in-process lock (threads of one
+  worker) and then on an advisory file lock next to the database (worker
+  processes) before asking SQLite for its write lock, so writers wait for
+  the one writer ahead of them instead of all hammering SQLite's busy
+  handler. Both waits give up after the connection's ``timeout`` option
+  with ``OperationalError('database is locked')``, like SQLite itself. The
+  file lock is skipped where ``fcntl`` is unavailable (Windows).
+- ``BEGIN IMMEDIATE`` is retried with backoff when SQLite still reports the
+  database as locked (another process held it for longer than
+  ``busy_timeout``). Nothing has run yet at that point, so retrying is safe.
+
+Only transactions (``atomic()`` blocks, including the ones Django opens for
+multi-table saves and cascading deletes) take these turns. A single
+statement run in autocommit mode outside ``atomic()``, such as a plain
+``save()`` or ``QuerySet.update()``, is its own transaction and waits on
+SQLite's ``busy_timeout`` alone; wrap writes in ``atomic()`` to queue them.
+
+With WAL, readers never wait for these writers.
+"""
+import os
+import random
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process serialization only
+    fcntl = None
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+_write_locks = {}  # database file -> (thread lock, lock file descriptor) of this process
+_write_locks_guard = threading.Lock()
+
+
+def _write_lock(name):
+    name = str(name)
+    key = (os.getpid(), name)  # a forked worker needs its own descriptor; flock is per open file
+    with _write_locks_guard:
+        if key not in _write_locks:
+            fd = os.open(f'{name}-writelock', os.O_RDWR | os.O_CREAT, 0o644) if fcntl else None
+            _write_locks[key] = (threading.Lock(), fd)
+        return _write_locks[key]
+
+
+def _is_locked_error(exc):
+    return 'database is locked' in str(exc) or 'database table is locked' in str(exc)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._holds_write_lock = False
+
+    def _lock_timeout(self):
+        # Wait for other threads about as long as SQLite waits for other processes
+        return self.settings_dict['OPTIONS'].get('timeout', 5)
+
+    def _start_transaction_under_autocommit(self):
+        if self.is_in_memory_db():
+            return super()._start_transaction_under_autocommit()
+        lock, fd = _write_lock(self.settings_dict['NAME'])
+        deadline = time.monotonic() + self._lock_timeout()
+        if not lock.acquire(timeout=self._lock_timeout()):
+            raise OperationalError('database is locked (waiting for another thread of this process)')
+        if fd is not None:
+            try:
+                self._flock(fd, deadline)
+            except BaseException:
+                lock.release()
+                raise
+        self._holds_write_lock = True
+        try:
+            self._begin_with_retry()
+        except BaseException:
+            self._release_write_lock()
+            raise
+
+    def _flock(self, fd, deadline):
+        # Non-blocking attempts so a writer stuck in another process cannot hang this one past the timeout;
+        # the kernel drops the lock if that process dies
+        delay = 0.001
+        while True:
+            try:
+                return fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise OperationalError('database is locked (waiting for another worker process)') from None
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 0.05)
+
+    def _begin_with_retry(self):
+        retries = settings.SQLITE_WRITE_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                return super()._start_transaction_under_autocommit()
+            except OperationalError as exc:
+                if attempt == retries or not _is_locked_error(exc):
+                    raise
+                # Exponential backoff with jitter so competing processes do not retry in lockstep
+                time.sleep(settings.SQLITE_RETRY_BACKOFF * (2 ** attempt) * (0.5 + random.random()))
+
+    def _release_write_lock(self):
+        if self._holds_write_lock:
+            self._holds_write_lock = False
+            lock, fd = _write_lock(self.settings_dict['NAME'])
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            lock.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_write_lock()
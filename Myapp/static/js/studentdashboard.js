@@ -0,0 +1,516 @@
+// Page data rendered by the template (dashboard-data block)
+const dashboardData = JSON.parse(document.getElementById('dashboard-data').textContent);
+
+// Store currently expanded teacher
+let currentlyExpanded = null;
+
+function toggleDropdown() {
+  const menu = document.getElementById("dropdownMenu");
+  menu.style.display = (menu.style.display === "flex") ? "none" : "flex";
+}
+
+document.addEventListener("click", function(event) {
+  const dropdown = document.getElementById("dropdownMenu");
+  const icon = document.querySelector(".user-icon");
+  if (!dropdown.contains(event.target) && !icon.contains(event.target)) {
+    dropdown.style.display = "none";
+  }
+});
+
+function togglePDF(pdfId) {
+  const pdfViewer = document.getElementById(pdfId);
+  const allPDFs = document.querySelectorAll('.pdf-viewer');
+  
+  // Hide all other PDFs
+  allPDFs.forEach(pdf => {
+    if (pdf !== pdfViewer) {
+      pdf.style.display = 'none';
+    }
+  });
+  
+  // Toggle current PDF
+  if (pdfViewer) {
+    pdfViewer.style.display = pdfViewer.style.display === 'block' ? 'none' : 'block';
+  }
+}
+
+function expandCourse(element, teacherId) {
+  const card = element.closest('.card');
+  const allCards = document.querySelectorAll('.card');
+  
+  // If clicking on the same card that's already expanded, collapse it
+  if (currentlyExpanded === teacherId) {
+    card.classList.remove("expanded");
+    currentlyExpanded = null;
+    
+    // Hide all PDFs when collapsing
+    const allPDFs = document.querySelectorAll('.pdf-viewer');
+    allPDFs.forEach(pdf => pdf.style.display = 'none');
+    
+    return;
+  }
+  
+  // Collapse all other cards
+  allCards.forEach(c => {
+    c.classList.remove("expanded");
+  });
+  
+  // Hide all PDFs from other teachers
+  const allPDFs = document.querySelectorAll('.pdf-viewer');
+  allPDFs.forEach(pdf => pdf.style.display = 'none');
+  
+  // Expand current card
+  card.classList.add("expanded");
+  currentlyExpanded = teacherId;
+  
+  // Show success message
+  const teacherName = card.querySelector('.teacher-name').textContent;
+  const teacherSubject = card.querySelector('.teacher-subject').textContent;
+  showMessage(`Viewing courses by ${teacherName} - ${teacherSubject}`, 'success');
+}
+
+function downloadFileStudent(fileId, fileName) {
+    // Create a temporary link element for download
+    const link = document.createElement('a');
+    link.href = `/api/download-file/${fileId}/`;
+    link.download = fileName;
+    link.target = '_blank';
+    
+    // Append to body, click, and remove
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    
+    showMessage(`Downloading "${fileName}"...`, 'success');
+}
+
+function downloadFile(fileId) {
+    const link = document.createElement('a');
+    link.href = `/api/download-file/${fileId}/`;
+    link.target = '_blank';
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    showMessage('Download started!', 'success');
+}
+
+function showMessage(message, type = 'info') {
+  // Remove existing messages
+  const existingMessages = document.querySelectorAll('.toast-message');
+  existingMessages.forEach(msg => msg.remove());
+  
+  const messageDiv = document.createElement('div');
+  messageDiv.className = 'toast-message';
+  messageDiv.style.cssText = `
+    position: fixed;
+    top: 20px;
+    right: 20px;
+    padding: 15px 20px;
+    border-radius: 8px;
+    color: white;
+    font-weight: 500;
+    z-index: 1000;
+    animation: slideIn 0.3s ease;
+    max-width: 300px;
+    box-shadow: 0 4px 12px rgba(0,0,0,0.15);
+  `;
+  
+  // Set background color based on type
+  const colors = {
+    success: '#28a745',
+    info: '#17a2b8',
+    warning: '#ffc107',
+    error: '#dc3545'
+  };
+  
+  messageDiv.style.background = colors[type] || colors.info;
+  
+  const icons = {
+    success: 'fa-check-circle',
+    info: 'fa-info-circle',
+    warning: 'fa-exclamation-triangle',
+    error: 'fa-times-circle'
+  };
+  
+  messageDiv.innerHTML = `
+    <i class="fas ${icons[type] || icons.info}" style="margin-right: 8px;"></i>
+    ${message}
+  `;
+  
+  document.body.appendChild(messageDiv);
+  
+  // Auto remove after 4 seconds
+  setTimeout(() => {
+    messageDiv.style.opacity = '0';
+    messageDiv.style.transform = 'translateX(100%)';
+    setTimeout(() => messageDiv.remove(), 300);
+  }, 4000);
+}
+
+// Initialize page
+document.addEventListener('DOMContentLoaded', function() {
+  const teacherCount = dashboardData.teacherCount;
+  if (teacherCount > 0) {
+    showMessage(`Found ${teacherCount} teacher${teacherCount !== 1 ? 's' : ''} with available courses`, 'info');
+  }
+  
+  // Show recent notifications
+  const notificationCount = dashboardData.notificationCount;
+  if (notificationCount > 0) {
+    setTimeout(() => {
+      showMessage(`You have ${notificationCount} recent notification${notificationCount !== 1 ? 's' : ''}`, 'info');
+    }, 2000);
+  }
+});
+
+function toggleUnitFiles(unitId) {
+    const unitFiles = document.getElementById(unitId);
+    const allUnitFiles = document.querySelectorAll('.unit-files');
+    
+    // Hide all other unit files
+    allUnitFiles.forEach(unit => {
+        if (unit !== unitFiles) {
+            unit.style.display = 'none';
+        }
+    });
+    
+    // Toggle current unit files
+    if (unitFiles) {
+        const isVisible = unitFiles.style.display === 'block';
+        unitFiles.style.display = isVisible ? 'none' : 'block';
+        
+        if (!isVisible) {
+            // Show message when opening unit
+            const unitElement = document.querySelector(`[onclick*="toggleUnitFiles('${unitId}')"]`);
+            if (unitElement) {
+                const unitName = unitElement.textContent.trim().split('\n')[0].replace('📁', '').trim();
+                showMessage(`Viewing files in: ${unitName}`, 'info');
+            }
+        }
+    }
+}
+
+function previewFileStudent(fileId, fileName) {
+    // Create modal for file preview
+    const modal = document.createElement('div');
+    modal.className = 'preview-modal';
+    modal.style.cssText = `
+        position: fixed;
+        top: 0;
+        left: 0;
+        width: 100%;
+        height: 100%;
+        background: rgba(0, 0, 0, 0.8);
+        display: flex;
+        align-items: center;
+        justify-content: center;
+        z-index: 2000;
+    `;
+    
+    modal.innerHTML = `
+        <div class="preview-modal-content" style="
+            background: white;
+            border-radius: 10px;
+            width: 90%;
+            max-width: 1000px;
+            height: 90%;
+            max-height: 800px;
+            display: flex;
+            flex-direction: column;
+            overflow: hidden;
+        ">
+            <div class="preview-header" style="
+                display: flex;
+                justify-content: space-between;
+                align-items: center;
+                padding: 15px 20px;
+                background: #f8f9fa;
+                border-bottom: 1px solid #dee2e6;
+            ">
+                <h3 style="margin: 0; color: #333; font-size: 18px;">
+                    <i class="fas fa-eye"></i> Preview: ${fileName}
+                </h3>
+                <button onclick="closePreviewStudent()" style="
+                    background: none;
+                    border: none;
+                    font-size: 24px;
+                    cursor: pointer;
+                    color: #6c757d;
+                    padding: 0;
+                    width: 30px;
+                    height: 30px;
+                ">&times;</button>
+            </div>
+            <div class="preview-body" style="flex: 1; padding: 0; overflow: hidden;">
+                <iframe src="/api/preview-file/${fileId}/" width="100%" height="100%" frameborder="0">
+                    <p>Your browser does not support iframes. <a href="/api/download-file/${fileId}/" target="_blank">Download the file</a> instead.</p>
+                </iframe>
+            </div>
+            <div class="preview-footer" style="
+                padding: 15px 20px;
+                background: #f8f9fa;
+                border-top: 1px solid #dee2e6;
+                display: flex;
+                gap: 10px;
+                justify-content: flex-end;
+            ">
+                <button onclick="downloadFile(${fileId})" style="
+                    background: #28a745;
+                    color: white;
+                    border: none;
+                    padding: 8px 16px;
+                    border-radius: 5px;
+                    cursor: pointer;
+                ">
+                    <i class="fas fa-download"></i> Download File
+                </button>
+                <button onclick="closePreviewStudent()" style="
+                    background: #6c757d;
+                    color: white;
+                    border: none;
+                    padding: 8px 16px;
+                    border-radius: 5px;
+                    cursor: pointer;
+                ">
+                    <i class="fas fa-times"></i> Close Preview
+                </button>
+            </div>
+        </div>
+    `;
+    
+    document.body.appendChild(modal);
+    showMessage(`Opening preview for ${fileName}`, 'info');
+}
+
+function closePreviewStudent() {
+    const modal = document.querySelector('.preview-modal');
+    if (modal) {
+        modal.remove();
+    }
+}
+
+// Close preview when clicking outside
+document.addEventListener('click', function(event) {
+    if (event.target.classList.contains('preview-modal')) {
+        closePreviewStudent();
+    }
+});
+
+// Close preview with Escape key
+document.addEventListener('keydown', function(event) {
+    if (event.key === 'Escape') {
+        closePreviewStudent();
+    }
+});
+
+// ===== FILTERING FUNCTIONALITY =====
+
+// Global variables for filtering
+let allTeachers = [];
+let filteredTeachers = [];
+
+// Initialize filtering on page load
+document.addEventListener('DOMContentLoaded', function() {
+    // Store original teacher data
+    const teacherCards = document.querySelectorAll('.card');
+    allTeachers = Array.from(teacherCards);
+    filteredTeachers = [...allTeachers];
+
+    // Set up filter event listeners
+    setupFilterListeners();
+
+    // Initialize filter state
+    updateFilterSummary();
+});
+
+// Set up event listeners for all filter controls
+function setupFilterListeners() {
+    // Teacher search input
+    const teacherSearch = document.getElementById('teacherSearch');
+    if (teacherSearch) {
+        teacherSearch.addEventListener('input', applyFilters);
+    }
+
+    // Subject filter
+    const subjectFilter = document.getElementById('subjectFilter');
+    if (subjectFilter) {
+        subjectFilter.addEventListener('change', applyFilters);
+    }
+
+    // Tag filter
+    const tagFilter = document.getElementById('tagFilter');
+    if (tagFilter) {
+        tagFilter.addEventListener('change', applyFilters);
+    }
+
+    // Unit filter
+    const unitFilter = document.getElementById('unitFilter');
+    if (unitFilter) {
+        unitFilter.addEventListener('change', applyFilters);
+    }
+
+    // Clear filters button
+    const clearFilters = document.getElementById('clearFilters');
+    if (clearFilters) {
+        clearFilters.addEventListener('click', clearAllFilters);
+    }
+}
+
+// Apply all active filters
+function applyFilters() {
+    const teacherSearchValue = document.getElementById('teacherSearch').value.toLowerCase().trim();
+    const subjectFilterValue = document.getElementById('subjectFilter').value;
+    const tagFilterValue = document.getElementById('tagFilter').value;
+    const unitFilterValue = document.getElementById('unitFilter').value;
+
+    filteredTeachers = allTeachers.filter(teacherCard => {
+        // Get teacher data
+        const teacherName = teacherCard.querySelector('.teacher-name').textContent.toLowerCase();
+        const teacherSubject = teacherCard.querySelector('.teacher-subject').textContent;
+
+        // Filter by teacher name
+        if (teacherSearchValue && !teacherName.includes(teacherSearchValue)) {
+            return false;
+        }
+
+        // Filter by subject
+        if (subjectFilterValue && teacherSubject !== subjectFilterValue) {
+            return false;
+        }
+
+        // Filter by tag
+        if (tagFilterValue) {
+            const hasMatchingFiles = checkTeacherHasTag(teacherCard, tagFilterValue);
+            if (!hasMatchingFiles) {
+                return false;
+            }
+        }
+
+        // Filter by unit
+        if (unitFilterValue) {
+            const hasMatchingUnit = checkTeacherHasUnit(teacherCard, unitFilterValue);
+            if (!hasMatchingUnit) {
+                return false;
+            }
+        }
+
+        return true;
+    });
+
+    // Update UI with filtered results
+    updateFilteredDisplay();
+    updateFilterSummary();
+}
+
+function checkTeacherHasTag(teacherCard, tag) {
+    const fileItems = teacherCard.querySelectorAll('.file-item');
+    return Array.from(fileItems).some(fileItem => {
+        const tagText = fileItem.querySelector('.file-tag')?.textContent.trim();
+        return tagText === tag;
+    });
+}
+
+// Check if teacher has specific unit
+function checkTeacherHasUnit(teacherCard, unitName) {
+    const units = teacherCard.querySelectorAll('.unit');
+    return Array.from(units).some(unit => {
+        const unitText = unit.textContent.trim();
+        return unitText.includes(unitName);
+    });
+}
+
+// Update the display with filtered results
+function updateFilteredDisplay() {
+    const cardsContainer = document.querySelector('.cards');
+
+    // Hide all teachers first
+    allTeachers.forEach(teacher => {
+        teacher.style.display = 'none';
+    });
+
+    // Show only filtered teachers
+    filteredTeachers.forEach(teacher => {
+        teacher.style.display = 'block';
+    });
+
+    // Show "no results" message if no teachers match
+    updateNoResultsMessage();
+}
+
+// Update the filter summary
+function updateFilterSummary() {
+    const summaryDiv = document.getElementById('filterSummary');
+    const summaryText = document.getElementById('filterSummaryText');
+
+    const teacherSearchValue = document.getElementById('teacherSearch').value.trim();
+    const subjectFilterValue = document.getElementById('subjectFilter').value;
+    const tagFilterValue = document.getElementById('tagFilter').value;
+    const unitFilterValue = document.getElementById('unitFilter').value;
+
+    const activeFilters = [];
+    if (teacherSearchValue) activeFilters.push(`Teacher: "${teacherSearchValue}"`);
+    if (subjectFilterValue) activeFilters.push(`Subject: ${subjectFilterValue}`);
+    if (tagFilterValue) activeFilters.push(`Tag: ${tagFilterValue}`);
+    if (unitFilterValue) activeFilters.push(`Unit: ${unitFilterValue}`);
+
+    if (activeFilters.length > 0) {
+        summaryText.textContent = `Showing ${filteredTeachers.length} of ${allTeachers.length} teachers • Filters: ${activeFilters.join(', ')}`;
+        summaryDiv.style.display = 'block';
+    } else {
+        summaryDiv.style.display = 'none';
+    }
+}
+
+// Clear all filters
+function clearAllFilters() {
+    document.getElementById('teacherSearch').value = '';
+    document.getElementById('subjectFilter').value = '';
+    document.getElementById('tagFilter').value = '';
+    document.getElementById('unitFilter').value = '';
+
+    filteredTeachers = [...allTeachers];
+    updateFilteredDisplay();
+    updateFilterSummary();
+
+    showMessage('All filters cleared', 'info');
+}
+
+// Update no results message
+function updateNoResultsMessage() {
+    const existingNoResults = document.querySelector('.no-filter-results');
+    if (existingNoResults) {
+        existingNoResults.remove();
+    }
+
+    if (filteredTeachers.length === 0 && allTeachers.length > 0) {
+        const cardsContainer = document.querySelector('.cards');
+        const noResultsDiv = document.createElement('div');
+        noResultsDiv.className = 'no-filter-results';
+        noResultsDiv.style.cssText = `
+            text-align: center;
+            padding: 60px 20px;
+            color: #666;
+            background: #f8f9fa;
+            border-radius: 10px;
+            margin-top: 20px;
+        `;
+        noResultsDiv.innerHTML = `
+            <i class="fas fa-search" style="font-size: 48px; color: #ddd; margin-bottom: 20px;"></i>
+            <h3 style="color: #333; margin-bottom: 10px;">No Results Found</h3>
+            <p>No teachers match your current filter criteria.<br>Try adjusting your filters or clearing them to see all available courses.</p>
+            <button onclick="clearAllFilters()" style="
+                background: #7f65f3;
+                color: white;
+                border: none;
+                padding: 10px 20px;
+                border-radius: 6px;
+                cursor: pointer;
+                margin-top: 15px;
+            ">
+                <i class="fas fa-times" style="margin-right: 5px;"></i>Clear All Filters
+            </button>
+        `;
+        cardsContainer.appendChild(noResultsDiv);
+    }
+}
+
@@ -0,0 +1,618 @@
+let selectedUnit = null;
+let currentViewingUnit = null;
+let currentUnitId = null;
+
+// Teacher info and unit files from the page's dashboard-data block
+const dashboardData = JSON.parse(document.getElementById('dashboard-data').textContent);
+const teacherName = dashboardData.teacherName;
+const teacherEmail = dashboardData.teacherEmail;
+const teacherSubject = dashboardData.teacherSubject;
+
+// Get CSRF token
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+// Set up CSRF token for all AJAX requests
+const csrftoken = getCookie('csrftoken');
+
+// Initialize page
+document.addEventListener('DOMContentLoaded', function() {
+    updateEmptyState();
+    
+    // Set up CSRF token for all fetch requests
+    const originalFetch = window.fetch;
+    window.fetch = function(url, options = {}) {
+        if (!options.headers) {
+            options.headers = {};
+        }
+        
+        // Add CSRF token for POST, PUT, DELETE requests
+        if (['POST', 'PUT', 'DELETE'].includes(options.method)) {
+            options.headers['X-CSRFToken'] = csrftoken;
+        }
+        
+        return originalFetch(url, options);
+    };
+});
+
+function updateEmptyState() {
+    const container = document.getElementById("courseContainer");
+    const emptyState = document.getElementById("emptyState");
+    const createBtn = document.getElementById("createFolderBtn");
+    
+    if (container.children.length === 0) {
+        emptyState.style.display = "block";
+        createBtn.style.display = "none";
+    } else {
+        emptyState.style.display = "none";
+        createBtn.style.display = "block";
+    }
+}
+
+// Same units as Django's filesizeformat, which renders the initial value
+function formatBytes(bytes) {
+    const units = ['bytes', 'KB', 'MB', 'GB', 'TB'];
+    let i = 0;
+    while (bytes >= 1024 && i < units.length - 1) {
+        bytes /= 1024;
+        i++;
+    }
+    return i === 0 ? `${bytes} bytes` : `${bytes.toFixed(1)} ${units[i]}`;
+}
+
+async function refreshStorageUsage() {
+    try {
+        const response = await fetch('/api/v1/storage/');
+        const data = await response.json();
+        if (!data.success) {
+            return;
+        }
+        const usage = data.usage;
+        const limit = usage.max_bytes ? ` of ${formatBytes(usage.max_bytes)}` : '';
+        document.getElementById('storageUsage').textContent =
+            `${formatBytes(usage.bytes_used)}${limit} used · ${usage.files_used} file${usage.files_used === 1 ? '' : 's'}`;
+    } catch (error) {
+        console.error('Error loading storage usage:', error);
+    }
+}
+
+function toggleDropdown() {
+    const menu = document.getElementById("dropdownMenu");
+    menu.style.display = (menu.style.display === "flex") ? "none" : "flex";
+}
+
+function createFolder() {
+    document.getElementById("folderModal").style.display = "flex";
+    document.getElementById("folderInput").value = "";
+    document.getElementById("folderInput").focus();
+}
+
+async function submitFolderName() {
+    const name = document.getElementById("folderInput").value.trim();
+    if (!name) {
+        alert("Please enter a unit name.");
+        return;
+    }
+    
+    try {
+        console.log("Creating unit with name:", name);
+        
+        const response = await fetch('/api/create-unit/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrftoken
+            },
+            body: JSON.stringify({ name: name })
+        });
+        
+        console.log("Response status:", response.status);
+        const data = await response.json();
+        console.log("Response data:", data);
+        
+        if (data.success) {
+            const container = document.getElementById("courseContainer");
+            const card = document.createElement("div");
+            card.className = "course-card";
+            card.onclick = () => openUnit(name, data.unit.id);
+            
+            const unitDiv = document.createElement("div");
+            unitDiv.className = "unit";
+            unitDiv.textContent = name;
+            
+            const deleteBtn = document.createElement("button");
+            deleteBtn.className = "delete-btn";
+            deleteBtn.innerHTML = '<i class="fas fa-times"></i>';
+            deleteBtn.title = "Delete unit";
+            deleteBtn.onclick = (e) => {
+                e.stopPropagation();
+                deleteFolder(e, deleteBtn, data.unit.id);
+            };
+            
+            card.appendChild(unitDiv);
+            card.appendChild(deleteBtn);
+            container.appendChild(card);
+            
+            updateEmptyState();
+            document.getElementById("folderModal").style.display = "none";
+            showSuccessMessage(`Unit "${name}" created successfully! Email notifications sent to all students.`);
+        } else {
+            alert(data.error || 'Failed to create unit');
+        }
+    } catch (error) {
+        console.error('Error creating unit:', error);
+        alert('Failed to create unit. Please try again.');
+    }
+}
+
+function closeModal() {
+    document.getElementById("folderModal").style.display = "none";
+}
+
+function openUnit(unitName, unitId) {
+    currentViewingUnit = unitName;
+    currentUnitId = unitId;
+    
+    // Hide home section and show unit view
+    document.querySelector(".home-section").style.display = "none";
+    document.getElementById("unitView").style.display = "block";
+    
+    // Update unit name in header
+    document.getElementById("currentUnitName").textContent = unitName;
+    
+    // Load unit files
+    loadUnitFiles(unitId);
+}
+
+async function loadUnitFiles(unitId) {
+    try {
+        const unitFilesList = document.getElementById("unitFilesList");
+        unitFilesList.innerHTML = '<div class="no-files">Loading files...</div>';
+        
+        // Find the unit data from the dashboard data
+        const files = dashboardData.unitFiles[unitId];
+        if (files) {
+            updateUnitFilesList(files);
+            return;
+        }
+        
+        // If no files found
+        updateUnitFilesList([]);
+        
+    } catch (error) {
+        console.error('Error loading unit files:', error);
+        document.getElementById("unitFilesList").innerHTML = '<div class="no-files">Error loading files.</div>';
+    }
+}
+
+function updateUnitFilesList(files) {
+    const unitFilesList = document.getElementById("unitFilesList");
+    
+    if (files.length === 0) {
+        unitFilesList.innerHTML = '<div class="no-files">No files uploaded to this unit yet.</div>';
+        return;
+    }
+    
+    unitFilesList.innerHTML = '';
+    
+    files.forEach(file => {
+        const fileItem = document.createElement("div");
+        fileItem.className = "file-item";
+        
+        const statusBadge = file.is_published ? 
+            '<span style="background: #28a745; color: white; padding: 2px 6px; border-radius: 3px; font-size: 10px;">PUBLISHED</span>' :
+            '<span style="background: #ffc107; color: #333; padding: 2px 6px; border-radius: 3px; font-size: 10px;">DRAFT</span>';
+        
+        // Icon and color come precomputed from the file's kind
+        const fileIcon = file.icon;
+        const fileColor = file.color;
+        
+        // Create preview button if file can be previewed
+        const previewButton = file.can_preview ? 
+            `<button class="file-preview-btn" onclick="previewFile(${file.id}, '${file.name}')" title="Preview file">
+                <i class="fas fa-eye"></i> Preview
+            </button>` : '';
+        
+        fileItem.innerHTML = `
+            <div class="file-info">
+                <i class="fas ${fileIcon} file-icon" style="color: ${fileColor};"></i>
+                <div class="file-details">
+                    <h4>${file.name} ${statusBadge}</h4>
+                    <p>Size: ${file.size} | Uploaded: ${file.uploaded_at} | By: ${teacherName}</p>
+                </div>
+            </div>
+            <div class="file-actions">
+                ${previewButton}
+                <button class="file-download-btn" onclick="downloadFile(${file.id})" title="Download file">
+                    <i class="fas fa-download"></i> Download
+                </button>
+                <button class="file-delete-btn" onclick="deleteFile(${file.id}, '${file.name}')" title="Delete file">
+                    <i class="fas fa-trash"></i> Delete
+                </button>
+            </div>
+        `;
+        
+        unitFilesList.appendChild(fileItem);
+    });
+}
+
+function previewFile(fileId, fileName) {
+    // Create modal for file preview
+    const modal = document.createElement('div');
+    modal.className = 'preview-modal';
+    modal.innerHTML = `
+        <div class="preview-modal-content">
+            <div class="preview-header">
+                <h3><i class="fas fa-eye"></i> Preview: ${fileName}</h3>
+                <button class="close-preview" onclick="closePreview()">&times;</button>
+            </div>
+            <div class="preview-body">
+                <iframe src="/api/preview-file/${fileId}/" width="100%" height="600px" frameborder="0">
+                    <p>Your browser does not support iframes. <a href="/api/download-file/${fileId}/" target="_blank">Download the file</a> instead.</p>
+                </iframe>
+            </div>
+            <div class="preview-footer">
+                <button onclick="downloadFile(${fileId})" class="download-from-preview">
+                    <i class="fas fa-download"></i> Download File
+                </button>
+                <button onclick="closePreview()" class="close-from-preview">
+                    <i class="fas fa-times"></i> Close Preview
+                </button>
+            </div>
+        </div>
+    `;
+    
+    document.body.appendChild(modal);
+    modal.style.display = 'flex';
+}
+
+function closePreview() {
+    const modal = document.querySelector('.preview-modal');
+    if (modal) {
+        modal.remove();
+    }
+}
+async function handleFileSelect(event) {
+    const files = event.target.files;
+    if (files.length > 0 && currentUnitId) {
+        console.log("Uploading files:", Array.from(files).map(f => f.name));
+        console.log("Unit ID:", currentUnitId);
+
+        const formData = new FormData();
+        formData.append('unit_id', currentUnitId);
+
+        // Get selected tag
+        const tagSelect = document.getElementById('fileTag');
+        const selectedTag = tagSelect ? tagSelect.value : 'study_material';
+        formData.append('tag', selectedTag);
+
+        for (let file of files) {
+            formData.append('files', file);
+        }
+
+        try {
+            const response = await fetch('/api/upload-file/', {
+                method: 'POST',
+                headers: {
+                    'X-CSRFToken': csrftoken
+                },
+                body: formData
+            });
+
+            console.log("Upload response status:", response.status);
+            const data = await response.json();
+            console.log("Upload response data:", data);
+
+            if (data.success) {
+                showSuccessMessage(`${data.message}! Email notifications sent to all students.`);
+                loadUnitFiles(currentUnitId);
+                refreshStorageUsage();
+                event.target.value = '';
+            } else {
+                alert(data.error || 'Failed to upload files');
+            }
+        } catch (error) {
+            console.error('Error uploading files:', error);
+            alert('Failed to upload files. Please try again.');
+        }
+    }
+}
+
+async function publishFiles() {
+    if (!currentUnitId) {
+        alert("Please select a unit first.");
+        return;
+    }
+    
+    try {
+        const response = await fetch('/api/publish-files/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrftoken
+            },
+            body: JSON.stringify({ unit_id: currentUnitId })
+        });
+        
+        const data = await response.json();
+        
+        if (data.success) {
+            showSuccessMessage(`${data.message}! Email notifications sent to all students.`);
+            loadUnitFiles(currentUnitId);
+            refreshStorageUsage();
+        } else {
+            alert(data.error || 'Failed to publish files');
+        }
+    } catch (error) {
+        console.error('Error publishing files:', error);
+        alert('Failed to publish files. Please try again.');
+    }
+}
+
+function saveDraft() {
+    showSuccessMessage(`Files saved as draft for ${teacherSubject}!`);
+}
+
+async function deleteFolder(event, deleteBtn, unitId) {
+    event.stopPropagation();
+    const card = deleteBtn.closest('.course-card');
+    const folderName = card.querySelector('.unit').textContent;
+    
+    if (confirm(`Are you sure you want to delete "${folderName}"? This will also delete all files in this unit.`)) {
+        try {
+            const response = await fetch(`/api/delete-unit/${unitId}/`, {
+                method: 'DELETE',
+                headers: {
+                    'X-CSRFToken': csrftoken
+                }
+            });
+            
+            const data = await response.json();
+            
+            if (data.success) {
+                card.remove();
+                
+                if (currentUnitId === unitId) {
+                    backToHome();
+                }
+                
+                updateEmptyState();
+                showSuccessMessage(data.message);
+                refreshStorageUsage();
+            } else {
+                alert(data.error || 'Failed to delete unit');
+            }
+        } catch (error) {
+            console.error('Error deleting unit:', error);
+            alert('Failed to delete unit. Please try again.');
+        }
+    }
+}
+
+function showSuccessMessage(message) {
+    const successDiv = document.createElement('div');
+    successDiv.style.cssText = `
+        position: fixed;
+        top: 20px;
+        right: 20px;
+        background: #28a745;
+        color: white;
+        padding: 15px 20px;
+        border-radius: 5px;
+        z-index: 1001;
+        box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+        animation: slideIn 0.3s ease;
+        max-width: 400px;
+    `;
+    successDiv.innerHTML = `<i class="fas fa-check-circle" style="margin-right: 8px;"></i>${message}`;
+    
+    document.body.appendChild(successDiv);
+    
+    setTimeout(() => {
+        successDiv.remove();
+    }, 5000);
+}
+
+function closeConfirmModal() {
+  document.getElementById("confirmModal").style.display = "none";
+}
+
+// Close modals when clicking outside
+window.onclick = function(event) {
+    const folderModal = document.getElementById("folderModal");
+    const confirmModal = document.getElementById("confirmModal");
+    
+    if (event.target === folderModal) {
+        folderModal.style.display = "none";
+    }
+    if (event.target === confirmModal) {
+        closeConfirmModal();
+    }
+}
+
+// Close modals with Escape key
+document.addEventListener('keydown', function(event) {
+  if (event.key === 'Escape') {
+    const folderModal = document.getElementById("folderModal");
+    const confirmModal = document.getElementById("confirmModal");
+    
+    if (folderModal.style.display === "flex") {
+      folderModal.style.display = "none";
+    }
+    if (confirmModal.style.display === "flex") {
+      closeConfirmModal();
+    }
+    
+    if (currentViewingUnit) {
+      backToHome();
+    }
+  }
+});
+
+// Add drag and drop functionality
+document.addEventListener('DOMContentLoaded', function() {
+  const uploadBox = document.querySelector('.upload-box');
+  
+  if (uploadBox) {
+    ['dragenter', 'dragover', 'dragleave', 'drop'].forEach(eventName => {
+      uploadBox.addEventListener(eventName, preventDefaults, false);
+    });
+
+    function preventDefaults(e) {
+      e.preventDefault();
+      e.stopPropagation();
+    }
+
+    ['dragenter', 'dragover'].forEach(eventName => {
+      uploadBox.addEventListener(eventName, highlight, false);
+    });
+
+    ['dragleave', 'drop'].forEach(eventName => {
+      uploadBox.addEventListener(eventName, unhighlight, false);
+    });
+
+    function highlight(e) {
+      uploadBox.classList.add('dragover');
+    }
+
+    function unhighlight(e) {
+      uploadBox.classList.remove('dragover');
+    }
+
+    uploadBox.addEventListener('drop', handleDrop, false);
+
+    async function handleDrop(e) {
+      const dt = e.dataTransfer;
+      const files = dt.files;
+
+      if (files.length > 0 && currentUnitId) {
+        console.log("Uploading files:", Array.from(files).map(f => f.name));
+        console.log("Unit ID:", currentUnitId);
+
+        const formData = new FormData();
+        formData.append('unit_id', currentUnitId);
+
+        // Get selected tag
+        const tagSelect = document.getElementById('fileTag');
+        const selectedTag = tagSelect ? tagSelect.value : 'study_material';
+        formData.append('tag', selectedTag);
+
+        for (let file of files) {
+          formData.append('files', file);
+        }
+
+        try {
+          const response = await fetch('/api/upload-file/', {
+            method: 'POST',
+            headers: {
+              'X-CSRFToken': csrftoken
+            },
+            body: formData
+          });
+
+          console.log("Upload response status:", response.status);
+          const data = await response.json();
+          console.log("Upload response data:", data);
+
+          if (data.success) {
+            showSuccessMessage(`${data.message}! Email notifications sent to all students.`);
+            loadUnitFiles(currentUnitId);
+            refreshStorageUsage();
+          } else {
+            alert(data.error || 'Failed to upload files');
+          }
+        } catch (error) {
+          console.error('Error uploading files:', error);
+          alert('Failed to upload files. Please try again.');
+        }
+      } else if (!currentUnitId) {
+        alert("Please select a unit first!");
+      }
+    }
+  }
+});
+
+function backToHome() {
+    currentViewingUnit = null;
+    currentUnitId = null;
+    
+    // Show home section and hide unit view
+    document.querySelector(".home-section").style.display = "block";
+    document.getElementById("unitView").style.display = "none";
+    
+    // Update navigation
+    const navItems = document.querySelectorAll('.nav-item');
+    navItems.forEach(item => item.classList.remove('active'));
+    navItems[0].classList.add('active'); // Make Home active
+}
+
+function showHome() {
+    // Show home section, hide others
+    document.querySelector(".home-section").style.display = "block";
+    document.getElementById("unitView").style.display = "none";
+    document.querySelector(".files-section-container").style.display = "none";
+    
+    // Update navigation
+    const navItems = document.querySelectorAll('.nav-item');
+    navItems.forEach(item => item.classList.remove('active'));
+    navItems[0].classList.add('active');
+    
+    // Reset unit view state
+    currentViewingUnit = null;
+    currentUnitId = null;
+}
+
+function triggerFileInput() {
+    if (!currentUnitId) {
+        alert("Please select a unit first.");
+        return;
+    }
+    document.getElementById("fileInput").click();
+}
+
+async function deleteFile(fileId, fileName) {
+    if (confirm(`Are you sure you want to delete "${fileName}"?`)) {
+        try {
+            const response = await fetch(`/api/delete-file/${fileId}/`, {
+                method: 'DELETE',
+                headers: {
+                    'X-CSRFToken': csrftoken
+                }
+            });
+            
+            const data = await response.json();
+            
+            if (data.success) {
+                showSuccessMessage(data.message);
+                loadUnitFiles(currentUnitId);
+                refreshStorageUsage();
+            } else {
+                alert(data.error || 'Failed to delete file');
+            }
+        } catch (error) {
+            console.error('Error deleting file:', error);
+            alert('Failed to delete file. Please try again.');
+        }
+    }
+}
+
+function downloadFile(fileId) {
+    window.open(`/api/download-file/${fileId}/`, '_blank');
+    showSuccessMessage('Download started!');
+}
+function previewPDF(pdfPath) {
+    // Opens the PDF in a new browser tab
+    window.open(pdfPath, '_blank');
+}
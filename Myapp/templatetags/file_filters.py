@@ -2,12 +2,15 @@ from django import template
 
 register = template.Library()
 
+# Both filters work on the related objects already loaded by
+# prefetch_related('files'), so using them in a loop adds no queries.
+
 @register.filter
 def published_count(files):
-    """Count published files in a queryset"""
-    return files.filter(is_published=True).count()
+    """Count published files in a queryset or related manager"""
+    return sum(1 for f in files.all() if f.is_published)
 
 @register.filter
 def has_published_files(unit):
     """Check if unit has any published files"""
-    return unit.files.filter(is_published=True).exists()
+    return any(f.is_published for f in unit.files.all())
@@ -1,3 +1,2469 @@
-from django.test import TestCase
+"""Tests for Myapp: query-count budgets, the feature modules and read-replica routing.
 
-# Create your tests here.
+Query budgets: each legacy view and /api/v1/ endpoint is requested twice:
+against a small data set and again after the data set has grown. The second
+request must stay within the endpoint's budget and must not issue more
+queries than the first, so an N+1 fails here rather than in production.
+Failures list every query with the project stack frames that issued it.
+
+Feature tests, one class per module or endpoint family: notification feed,
+cursors and migrations, async view parity, live events, the scheduler, the
+trash, the principal cache, login throttling, roster import, seeded
+benchmark data, metrics, queued logging, static file storage, the SQLite
+write lock, bulk file actions, admin trash actions, file kinds, storage
+quotas, download events, usage rollups, trending, document search and
+enrollments.
+
+The replica tests use a second SQLite file as the replica.
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from importlib import import_module
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import admin as django_admin
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.backends.sqlite3 import base as django_sqlite_base
+from django.db.models import F, Q
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from . import analytics, bench, db_router, downloads, enrollments, events, log, login_guard, metrics, notifications, quotas, roster, scheduler, search, services, trash, trending
+from .admin import EstimatedCountPaginator, UploadedFileAdmin
+from .middleware import get_principal
+from .sqlite_backend import base as sqlite_base
+from .api import stream
+from .api.serializers import CourseUnitSerializer, NotificationSerializer, UserSerializer
+from .models import (
+    FILE_KIND_COLORS, FILE_KIND_ICONS, FILE_KIND_RULES, CourseUnit, DocumentText, DownloadEvent, Enrollment, LiveEvent, NotificationCursor, NotificationEvent, RollupWatermark, StorageUsage, TrendingScore, TrendingSnapshot, UploadedFile, UsageRollup,
+    UserSignup, file_kind_for,
+)
+from .utils import send_notification_email
+
+MANAGE_PY = os.path.join(settings.BASE_DIR, 'manage.py')
+PASSWORD = 'budget-password'
+PASSWORD_HASH = make_password(PASSWORD)
+
+# Queries allowed per (url name, method). Session and principal lookups are
+# included: the cache is cleared before each measured request.
+BUDGETS = {
+    ('login', 'GET'): 0,
+    ('login', 'POST'): 5,
+    ('signup', 'GET'): 0,
+    ('signup', 'POST'): 5,
+    ('student_dashboard', 'GET'): 7,
+    ('teacher_dashboard', 'GET'): 5,
+    ('logout', 'GET'): 2,
+    ('metrics', 'GET'): 0,
+    ('create_unit', 'POST'): 8,
+    ('upload_file', 'POST'): 9,
+    ('publish_files', 'POST'): 8,
+    ('download_file', 'GET'): 3,
+    ('preview_file', 'GET'): 3,
+    ('delete_file', 'DELETE'): 9,
+    ('delete_unit', 'DELETE'): 10,
+    ('api_signup', 'POST'): 4,
+    ('api_csrf', 'GET'): 0,
+    ('api_login', 'POST'): 5,
+    ('api_logout', 'POST'): 3,
+    ('api_me', 'GET'): 2,
+    ('api_teachers', 'GET'): 4,  # Session load when a student is logged in
+    ('api_create_unit', 'POST'): 9,
+    ('api_unit_upload', 'POST'): 9,
+    ('api_delete_unit', 'DELETE'): 10,
+    ('api_publish_file', 'POST'): 8,
+    ('api_bulk_files', 'POST'): 7,
+    ('api_delete_file', 'DELETE'): 9,
+    ('api_storage_usage', 'GET'): 3,
+    ('api_enrollments', 'POST'): 6,
+    ('api_analytics', 'GET'): 4,
+    ('api_trending_materials', 'GET'): 3,
+    ('api_search', 'GET'): 3,
+    ('api_trash', 'GET'): 3,
+    ('api_trash_restore', 'POST'): 12,
+    ('api_roster_import', 'POST'): 8,
+    ('api_notifications', 'GET'): 4,
+    ('api_notifications_unread_count', 'GET'): 3,
+    ('api_notifications_mark_read', 'POST'): 10,
+    # Admin changelists (not part of the completeness check)
+    ('admin:Myapp_usersignup_changelist', 'GET'): 5,
+    ('admin:Myapp_courseunit_changelist', 'GET'): 7,
+    ('admin:Myapp_uploadedfile_changelist', 'GET'): 7,
+    ('admin:Myapp_notificationevent_changelist', 'GET'): 7,
+    ('admin:Myapp_storageusage_changelist', 'GET'): 5,
+    ('admin:Myapp_enrollment_changelist', 'GET'): 5,
+}
+
+# Routes that cannot be measured as a single request/response
+EXEMPT = {
+    'api_events': 'Server-Sent Events stream; the response never completes',
+}
+
+
+class QueryRecorder:
+    """Records each query's SQL and the project frames that issued it"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        stack = [
+            frame for frame in traceback.extract_stack()[:-1]
+            if frame.filename.startswith(str(settings.BASE_DIR)) and frame.filename not in (__file__, MANAGE_PY)
+        ]
+        self.queries.append((sql, stack))
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def report(self):
+        lines = []
+        for i, (sql, stack) in enumerate(self.queries, 1):
+            lines.append(f'{i}. {sql}')
+            lines.extend(f'     {os.path.relpath(f.filename, settings.BASE_DIR)}:{f.lineno} in {f.name}' for f in stack)
+        return '\n'.join(lines)
+
+
+def url_names(patterns, namespace_excluded=('admin',)):
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace not in namespace_excluded:
+                names |= url_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='clouded-tests-')
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        # Budgets count queries on the primary connection, so replicas (if configured) are left out.
+        # Download events are written by a background thread, never by the request (see DownloadEventTests)
+        media = override_settings(
+            MEDIA_ROOT=cls.media_root, METRICS_TOKEN='budget-token', METRICS_DIR=cls.media_root, DATABASE_REPLICAS=[],
+            DOWNLOAD_EVENTS_ENABLED=False,
+        )
+        media.enable()
+        cls.addClassCleanup(media.disable)
+        super().setUpClass()
+
+    def setUp(self):
+        self.teacher = self.make_user('owner-teacher@example.com', 'teacher')
+        self.student = self.make_user('owner-student@example.com', 'student')
+        Enrollment.objects.create(student=self.student, teacher=self.teacher)
+        NotificationCursor.objects.create(student=self.student)
+        self.serial = 0
+
+    def make_user(self, email, role):
+        user = UserSignup.objects.bulk_create([
+            UserSignup(full_name=email.split('@')[0], email=email, password=PASSWORD_HASH, role=role)
+        ])[0]
+        if role == 'teacher':
+            StorageUsage.objects.create(teacher=user)
+        return user
+
+    def make_unit(self, teacher, files=0):
+        self.serial += 1
+        unit = CourseUnit.objects.create(teacher=teacher, name=f'Unit {self.serial}')
+        created = UploadedFile.objects.bulk_create([
+            UploadedFile(
+                teacher=teacher, unit=unit, original_name=f'file-{i}.pdf', file=f'course_files/test/{self.serial}-{i}.pdf',
+                file_size=1024, file_type='application/pdf', is_published=i % 2 == 0,
+            )
+            for i in range(files)
+        ])
+        # Usage counters as the upload path would have left them
+        StorageUsage.objects.create(teacher=teacher, unit=unit, bytes_used=1024 * files, files_used=files)
+        StorageUsage.objects.filter(teacher=teacher, unit__isnull=True).update(
+            bytes_used=F('bytes_used') + 1024 * files, files_used=F('files_used') + files
+        )
+        NotificationEvent.objects.create(teacher=teacher, unit=unit, notification_type='unit_created')
+        NotificationEvent.objects.bulk_create([
+            NotificationEvent(teacher=teacher, unit=unit, file=f, notification_type='file_published')
+            for f in created if f.is_published
+        ])
+        return unit
+
+    def grow(self, n):
+        """Add n teachers with n units of n files each, n units to the owner teacher, and n students.
+
+        The owner student enrolls with each new teacher; each new student enrolls with the owner teacher.
+        """
+        for _ in range(n):
+            self.serial += 1
+            teacher = self.make_user(f'teacher-{self.serial}@example.com', 'teacher')
+            for _ in range(n):
+                self.make_unit(teacher, files=n)
+            self.make_unit(self.teacher, files=n)
+            student = self.make_user(f'student-{self.serial}@example.com', 'student')
+            Enrollment.objects.bulk_create([
+                Enrollment(student=self.student, teacher=teacher), Enrollment(student=student, teacher=self.teacher),
+            ])
+
+    def login(self, user):
+        # A fresh session each time: after a logout the client still holds the flushed cookie
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = user.id
+        session['user_role'] = user.role
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def assertQueryBudget(self, name, method, request, as_user=None, prepare=None, status=None):
+        """Run ``request(*prepare())`` at two data sizes and check it against the budget for (name, method)"""
+        budget = BUDGETS[(name, method)]
+        counts = []
+        for size in (1, 3):
+            self.grow(size)
+            if as_user is not None:
+                self.login(as_user)
+            args = prepare() if prepare else ()
+            cache.clear()
+            with QueryRecorder() as recorder:
+                response = request(*args)
+            if status is not None:
+                self.assertEqual(response.status_code, status, getattr(response, 'content', b'')[:500])
+            self.assertLess(response.status_code, 500)
+            if len(recorder) > budget:
+                self.fail(f'{method} {name}: {len(recorder)} queries, budget is {budget}\n{recorder.report()}')
+            if counts and len(recorder) > counts[0]:
+                self.fail(
+                    f'{method} {name}: query count grows with data size ({counts[0]} -> {len(recorder)})\n'
+                    f'{recorder.report()}'
+                )
+            counts.append(len(recorder))
+
+    def test_admin_changelists(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', PASSWORD))
+        for model in ('usersignup', 'courseunit', 'uploadedfile', 'notificationevent', 'storageusage', 'enrollment'):
+            with self.subTest(model=model):
+                name = f'admin:Myapp_{model}_changelist'
+                self.assertQueryBudget(name, 'GET', lambda: self.client.get(reverse(name)), status=200)
+
+    def test_admin_estimated_count(self):
+        self.grow(2)
+        with mock.patch.object(EstimatedCountPaginator, 'exact_below', 1), QueryRecorder() as recorder:
+            count = EstimatedCountPaginator(UploadedFile.all_objects.order_by('-id'), 50).count
+        self.assertEqual(count, UploadedFile.all_objects.order_by('-id').values_list('id', flat=True)[0])
+        self.assertNotIn('COUNT(', recorder.report())
+
+    def test_every_route_has_a_budget(self):
+        budgeted = {name for name, _ in BUDGETS}
+        missing = url_names(get_resolver().url_patterns) - budgeted - set(EXEMPT)
+        self.assertFalse(missing, f'Routes without a query budget: {sorted(missing)}')
+
+    # Legacy views
+
+    def test_login_page(self):
+        self.assertQueryBudget('login', 'GET', lambda: self.client.get('/login/'), status=200)
+
+    def test_login_submit(self):
+        self.assertQueryBudget(
+            'login', 'POST',
+            lambda: self.client.post('/login/', {'email': self.student.email, 'password': PASSWORD, 'role': 'student'}),
+            status=302,
+        )
+
+    def test_signup_page(self):
+        self.assertQueryBudget('signup', 'GET', lambda: self.client.get('/signup/'), status=200)
+
+    def test_signup_submit(self):
+        def signup():
+            self.serial += 1
+            return self.client.post('/signup/', {
+                'full_name': 'New Student', 'email': f'new-{self.serial}@example.com', 'password': PASSWORD,
+                'confirm_password': PASSWORD, 'role': 'student', 'agreed': 'on',
+            })
+        self.assertQueryBudget('signup', 'POST', signup)
+
+    def test_student_dashboard(self):
+        self.assertQueryBudget(
+            'student_dashboard', 'GET', lambda: self.client.get('/student-dashboard/'), as_user=self.student, status=200
+        )
+
+    def test_teacher_dashboard(self):
+        self.assertQueryBudget(
+            'teacher_dashboard', 'GET', lambda: self.client.get('/teacher-dashboard/'), as_user=self.teacher, status=200
+        )
+
+    def test_logout(self):
+        self.assertQueryBudget('logout', 'GET', lambda: self.client.get('/logout/'), as_user=self.student, status=302)
+
+    def test_metrics(self):
+        self.assertQueryBudget(
+            'metrics', 'GET', lambda: self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer budget-token'), status=200
+        )
+
+    def test_create_unit(self):
+        def create():
+            self.serial += 1
+            return self.client.post('/api/create-unit/', {'name': f'New unit {self.serial}'}, content_type='application/json')
+        self.assertQueryBudget('create_unit', 'POST', create, as_user=self.teacher, status=200)
+
+    def test_upload_file(self):
+        self.assertQueryBudget(
+            'upload_file', 'POST',
+            lambda unit: self.client.post('/api/upload-file/', {
+                'unit_id': unit.id, 'files': [SimpleUploadedFile('notes.txt', b'notes', 'text/plain')],
+            }),
+            as_user=self.teacher, prepare=lambda: (self.make_unit(self.teacher),), status=200,
+        )
+
+    def test_publish_files(self):
+        self.assertQueryBudget(
+            'publish_files', 'POST',
+            lambda unit: self.client.post('/api/publish-files/', {'unit_id': unit.id}),
+            as_user=self.teacher, prepare=lambda: (self.make_unit(self.teacher, files=4),), status=200,
+        )
+
+    def test_download_file(self):
+        self.assertQueryBudget(
+            'download_file', 'GET',
+            lambda f: self.client.get(f'/api/download-file/{f.id}/'),
+            as_user=self.student, prepare=lambda: (UploadedFile.objects.filter(is_published=True).last(),), status=302,
+        )
+
+    def test_preview_file(self):
+        self.assertQueryBudget(
+            'preview_file', 'GET',
+            lambda f: self.client.get(f'/api/preview-file/{f.id}/'),
+            as_user=self.teacher, prepare=lambda: (UploadedFile.objects.filter(teacher=self.teacher).last(),), status=302,
+        )
+
+    def test_delete_file(self):
+        self.assertQueryBudget(
+            'delete_file', 'DELETE',
+            lambda f: self.client.delete(f'/api/delete-file/{f.id}/'),
+            as_user=self.teacher, prepare=lambda: (UploadedFile.objects.filter(teacher=self.teacher).last(),), status=200,
+        )
+
+    def test_delete_unit(self):
+        self.assertQueryBudget(
+            'delete_unit', 'DELETE',
+            lambda unit: self.client.delete(f'/api/delete-unit/{unit.id}/'),
+            as_user=self.teacher, prepare=lambda: (self.make_unit(self.teacher, files=4),), status=200,
+        )
+
+    # /api/v1/
+
+    def test_api_signup(self):
+        def signup():
+            self.serial += 1
+            return self.client.post('/api/v1/auth/signup/', {
+                'full_name': 'New Student', 'email': f'new-{self.serial}@example.com', 'password': PASSWORD,
+                'role': 'student', 'agreed': True,
+            }, content_type='application/json')
+        self.assertQueryBudget('api_signup', 'POST', signup, status=201)
+
+    def test_api_csrf(self):
+        self.assertQueryBudget('api_csrf', 'GET', lambda: self.client.get('/api/v1/auth/csrf/'), status=200)
+
+    def test_api_login(self):
+        self.assertQueryBudget(
+            'api_login', 'POST',
+            lambda: self.client.post('/api/v1/auth/login/', {
+                'email': self.student.email, 'password': PASSWORD, 'role': 'student',
+            }, content_type='application/json'),
+            status=200,
+        )
+
+    def test_api_logout(self):
+        self.assertQueryBudget(
+            'api_logout', 'POST', lambda: self.client.post('/api/v1/auth/logout/'), as_user=self.student, status=200
+        )
+
+    def test_api_me(self):
+        self.assertQueryBudget('api_me', 'GET', lambda: self.client.get('/api/v1/auth/me/'), as_user=self.student, status=200)
+
+    def test_api_teachers(self):
+        self.assertQueryBudget('api_teachers', 'GET', lambda: self.client.get('/api/v1/teachers/'), status=200)
+
+    def test_api_teachers_by_kind(self):
+        self.assertQueryBudget('api_teachers', 'GET', lambda: self.client.get('/api/v1/teachers/?kind=pdf'), status=200)
+
+    def test_api_create_unit(self):
+        def create():
+            self.serial += 1
+            return self.client.post('/api/v1/units/create/', {'name': f'New unit {self.serial}'}, content_type='application/json')
+        self.assertQueryBudget('api_create_unit', 'POST', create, as_user=self.teacher, status=200)
+
+    def test_api_unit_upload(self):
+        self.assertQueryBudget(
+            'api_unit_upload', 'POST',
+            lambda unit: self.client.post(f'/api/v1/units/{unit.id}/upload/', {
+                'files': [SimpleUploadedFile('notes.txt', b'notes', 'text/plain')],
+            }),
+            as_user=self.teacher, prepare=lambda: (self.make_unit(self.teacher),), status=200,
+        )
+
+    def test_api_delete_unit(self):
+        self.assertQueryBudget(
+            'api_delete_unit', 'DELETE',
+            lambda unit: self.client.delete(f'/api/v1/units/{unit.id}/'),
+            as_user=self.teacher, prepare=lambda: (self.make_unit(self.teacher, files=4),), status=200,
+        )
+
+    def test_api_publish_file(self):
+        self.assertQueryBudget(
+            'api_publish_file', 'POST',
+            lambda f: self.client.post('/api/v1/files/publish/', {'file_id': f.id, 'is_published': True}, content_type='application/json'),
+            as_user=self.teacher,
+            prepare=lambda: (UploadedFile.objects.filter(unit=self.make_unit(self.teacher, files=2), is_published=False).get(),),
+            status=200,
+        )
+
+    def test_api_bulk_files(self):
+        self.assertQueryBudget(
+            'api_bulk_files', 'POST',
+            lambda unit: self.client.post('/api/v1/files/bulk/', {'action': 'publish', 'unit_id': unit.id}, content_type='application/json'),
+            as_user=self.teacher, prepare=lambda: (self.make_unit(self.teacher, files=4),), status=200,
+        )
+
+    def test_api_delete_file(self):
+        self.assertQueryBudget(
+            'api_delete_file', 'DELETE',
+            lambda f: self.client.delete(f'/api/v1/files/{f.id}/'),
+            as_user=self.teacher, prepare=lambda: (UploadedFile.objects.filter(teacher=self.teacher).last(),), status=200,
+        )
+
+    def test_api_teachers_for_student(self):
+        self.assertQueryBudget(
+            'api_teachers', 'GET', lambda: self.client.get('/api/v1/teachers/'), as_user=self.student, status=200
+        )
+
+    def test_api_enrollments(self):
+        def new_students():
+            self.serial += 1
+            students = [self.make_user(f'enroll-{self.serial}-{i}@example.com', 'student') for i in range(3)]
+            return ([s.email for s in students],)
+
+        self.assertQueryBudget(
+            'api_enrollments', 'POST',
+            lambda emails: self.client.post(
+                '/api/v1/enrollments/', {'action': 'enroll', 'emails': emails}, content_type='application/json',
+            ),
+            as_user=self.teacher, prepare=new_students, status=200,
+        )
+
+    def test_api_storage_usage(self):
+        self.assertQueryBudget(
+            'api_storage_usage', 'GET', lambda: self.client.get('/api/v1/storage/'), as_user=self.teacher, status=200
+        )
+
+    def test_api_analytics(self):
+        def record_downloads():
+            now = timezone.now()
+            DownloadEvent.objects.bulk_create([
+                DownloadEvent(file=f, student_id=self.student.id, kind=kind, created_at=now - timedelta(hours=i))
+                for i, f in enumerate(UploadedFile.objects.filter(teacher=self.teacher))
+                for kind in ('download', 'preview')
+            ])
+            analytics.rollup()
+            return ()
+
+        self.assertQueryBudget(
+            'api_analytics', 'GET', lambda: self.client.get('/api/v1/analytics/?period=hour'),
+            as_user=self.teacher, prepare=record_downloads, status=200,
+        )
+
+    def test_api_trending_materials(self):
+        def record_downloads():
+            DownloadEvent.objects.bulk_create([
+                DownloadEvent(file=f, student_id=self.student.id, kind='download', created_at=timezone.now())
+                for f in UploadedFile.objects.filter(is_published=True)
+            ])
+            trending.refresh()
+            return ()
+
+        self.assertQueryBudget(
+            'api_trending_materials', 'GET', lambda: self.client.get('/api/v1/materials/trending/'),
+            as_user=self.student, prepare=record_downloads, status=200,
+        )
+
+    def test_api_search(self):
+        def index_document():
+            self.serial += 1
+            content = f'Document {self.serial} on Kirchhoff circuits'.encode()
+            unit = CourseUnit.objects.create(teacher=self.teacher, name=f'Search unit {self.serial}')
+            for i in range(3):
+                search.index_file(UploadedFile.objects.create(
+                    teacher=self.teacher, unit=unit, original_name=f'doc-{i}.txt', file_size=len(content),
+                    file=SimpleUploadedFile(f'doc-{i}.txt', content, 'text/plain'), file_type='text/plain', is_published=True,
+                ))
+            return ()
+
+        self.assertQueryBudget(
+            'api_search', 'GET', lambda: self.client.get('/api/v1/search/?q=kirchhoff'),
+            as_user=self.student, prepare=index_document, status=200,
+        )
+
+    def test_api_trash(self):
+        def trash_some():
+            unit = self.make_unit(self.teacher, files=2)
+            self.client.delete(f'/api/v1/units/{unit.id}/')
+            return ()
+        self.assertQueryBudget(
+            'api_trash', 'GET', lambda: self.client.get('/api/v1/trash/'), as_user=self.teacher, prepare=trash_some, status=200
+        )
+
+    def test_api_trash_restore(self):
+        def trashed_unit():
+            unit = self.make_unit(self.teacher, files=2)
+            self.client.delete(f'/api/v1/units/{unit.id}/')
+            return (unit,)
+        self.assertQueryBudget(
+            'api_trash_restore', 'POST',
+            lambda unit: self.client.post('/api/v1/trash/restore/', {'unit_id': unit.id}, content_type='application/json'),
+            as_user=self.teacher, prepare=trashed_unit, status=200,
+        )
+
+    def test_api_roster_import(self):
+        def roster():
+            self.serial += 1
+            rows = ''.join(f'Student {i},roster-{self.serial}-{i}@example.com\n' for i in range(2))
+            return self.client.post('/api/v1/roster/import/', {
+                'file': SimpleUploadedFile('roster.csv', f'full_name,email\n{rows}'.encode(), 'text/csv'),
+                'default_password': PASSWORD,
+            })
+        self.assertQueryBudget('api_roster_import', 'POST', roster, as_user=self.teacher, status=200)
+
+    def test_api_notifications(self):
+        self.assertQueryBudget(
+            'api_notifications', 'GET', lambda: self.client.get('/api/v1/notifications/'), as_user=self.student, status=200
+        )
+
+    def test_api_notifications_unread_count(self):
+        self.assertQueryBudget(
+            'api_notifications_unread_count', 'GET',
+            lambda: self.client.get('/api/v1/notifications/unread-count/'), as_user=self.student, status=200,
+        )
+
+    def test_api_notifications_mark_read(self):
+        self.assertQueryBudget(
+            'api_notifications_mark_read', 'POST',
+            lambda: self.client.post('/api/v1/notifications/read/', {'all': True}, content_type='application/json'),
+            as_user=self.student, status=200,
+        )
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class NotificationFeedTests(TestCase):
+    def setUp(self):
+        self.teacher = UserSignup.objects.create(full_name='Teacher', email='feed-t@example.com', password=PASSWORD_HASH, role='teacher')
+        self.student = UserSignup.objects.create(full_name='Student', email='feed-s@example.com', password=PASSWORD_HASH, role='student')
+        Enrollment.objects.create(student=self.student, teacher=self.teacher)
+        NotificationCursor.objects.create(student=self.student, last_seen_event_id=0)
+        self.events = self.add_events(120)
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = self.student.id
+        session['user_role'] = 'student'
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def add_events(self, n):
+        start = CourseUnit.objects.count()
+        units = CourseUnit.objects.bulk_create([CourseUnit(teacher=self.teacher, name=f'Unit {start + i}') for i in range(n)])
+        NotificationEvent.objects.bulk_create([
+            NotificationEvent(teacher=self.teacher, unit=unit, notification_type='unit_created') for unit in units
+        ])
+        return list(NotificationEvent.objects.filter(unit__in=units).order_by('-id').values_list('id', flat=True))
+
+    def feed(self, **params):
+        response = self.client.get('/api/v1/notifications/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_walk_the_feed_once_while_events_arrive(self):
+        seen, cursor = [], None
+        while True:
+            page = self.feed(limit=50, **({'cursor': cursor} if cursor else {}))
+            seen += [n['id'] for n in page['notifications']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+            # New events go on top of the feed and don't shift the pages after the cursor
+            self.add_events(1)
+        self.assertEqual(seen, self.events)
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(len(self.feed(limit=0)['notifications']), 1)
+        self.assertEqual(len(self.feed(limit=1000)['notifications']), notifications.MAX_FEED_PAGE_SIZE)
+        self.assertEqual(len(self.feed()['notifications']), notifications.FEED_PAGE_SIZE)
+        self.assertEqual(self.client.get('/api/v1/notifications/', {'cursor': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/notifications/', {'limit': 'x'}).status_code, 400)
+
+    def test_unread_count_follows_the_cursor(self):
+        self.assertEqual(self.feed()['unread_count'], notifications.UNREAD_COUNT_CAP)
+        self.client.post('/api/v1/notifications/read/', {'up_to': self.events[10]}, content_type='application/json')
+        response = self.client.get('/api/v1/notifications/unread-count/')
+        self.assertEqual(response.json(), {'unread_count': 10})
+        # The cursor never moves backwards, nor past the newest event
+        notifications.mark_read(self.student.id, self.events[-1])
+        notifications.mark_read(self.student.id, self.events[0] + 1000)
+        self.assertEqual(notifications.get_last_seen(self.student.id), self.events[0])
+        self.assertEqual(notifications.get_unread_count(self.student.id), 0)
+
+    def test_unread_count_skips_events_trashed_after_they_were_raised(self):
+        notifications.mark_read(self.student.id, self.events[0])
+        self.add_events(2)
+        unit, trashed_unit = CourseUnit.objects.order_by('-id')[:2]
+        file = UploadedFile.objects.create(
+            teacher=self.teacher, unit=unit, original_name='notes.pdf', file='course_files/test/feed.pdf',
+            file_size=10, file_type='application/pdf', tag='study_material',
+        )
+        notifications.record_event(self.teacher, unit, 'file_uploaded', file=file)
+        self.assertEqual(notifications.get_unread_count(self.student.id), 3)
+        services.trash_files(self.teacher, UploadedFile.objects.filter(id=file.id))
+        services.trash_unit(self.teacher, trashed_unit)
+        page = self.feed()
+        self.assertEqual(page['unread_count'], 1)
+        self.assertEqual(len([n for n in page['notifications'] if n['id'] > self.events[0]]), 1)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class NotificationCursorTests(TestCase):
+    """New students start at the newest event instead of with the whole history unread"""
+
+    def setUp(self):
+        self.teacher = UserSignup.objects.create(full_name='Teacher', email='cursor-t@example.com', password=PASSWORD_HASH, role='teacher')
+        self.unit = CourseUnit.objects.create(teacher=self.teacher, name='Unit')
+        self.old_event = NotificationEvent.objects.create(teacher=self.teacher, unit=self.unit, notification_type='unit_created')
+
+    def new_event(self):
+        unit = CourseUnit.objects.create(teacher=self.teacher, name=f'Unit {CourseUnit.objects.count()}')
+        return NotificationEvent.objects.create(teacher=self.teacher, unit=unit, notification_type='unit_created')
+
+    def test_signup_and_enrollment_start_the_cursor(self):
+        response = self.client.post('/api/v1/auth/signup/', {
+            'full_name': 'New Student', 'email': 'cursor-s@example.com', 'password': PASSWORD, 'role': 'student',
+        }, content_type='application/json')
+        student_id = response.json()['user']['id']
+        self.assertEqual(notifications.get_last_seen(student_id), self.old_event.id)
+        enrollments.enroll(self.teacher.id, [student_id])
+        self.assertEqual(notifications.get_unread_count(student_id), 0)
+        self.new_event()
+        self.assertEqual(notifications.get_unread_count(student_id), 1)
+
+    def test_first_read_starts_a_missing_cursor(self):
+        student = UserSignup.objects.create(full_name='Legacy', email='legacy@example.com', password=PASSWORD_HASH, role='student')
+        Enrollment.objects.create(student=student, teacher=self.teacher)
+        self.assertFalse(NotificationCursor.objects.filter(student=student).exists())
+        self.assertEqual(notifications.get_unread_count(student.id), 0)
+        event = self.new_event()
+        page, _, last_seen = notifications.get_feed(student.id)
+        self.assertEqual(([e.id for e in page], last_seen), ([event.id, self.old_event.id], self.old_event.id))
+        notifications.mark_all_read(student.id)
+        self.assertEqual(notifications.get_last_seen(student.id), event.id)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class NotificationMigrationTests(TransactionTestCase):
+    """0010 folds per-student EmailNotification rows into events and read cursors"""
+    before = [('Myapp', '0009_liveevent')]
+    after = [('Myapp', '0010_notification_event_log')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_fold_notifications(self):
+        apps = self.migrate(self.before)
+        UserSignup = apps.get_model('Myapp', 'UserSignup')
+        CourseUnit = apps.get_model('Myapp', 'CourseUnit')
+        EmailNotification = apps.get_model('Myapp', 'EmailNotification')
+        teacher = UserSignup.objects.create(full_name='T', email='t@example.com', password='x', role='teacher')
+        caught_up, behind, silent = (
+            UserSignup.objects.create(full_name=name, email=f'{name}@example.com', password='x', role='student')
+            for name in ('caught-up', 'behind', 'silent')
+        )
+        first, second = (CourseUnit.objects.create(teacher=teacher, name=name) for name in ('First', 'Second'))
+        for unit in (first, second):
+            for student in (caught_up, behind):
+                EmailNotification.objects.create(
+                    student=student, teacher=teacher, unit=unit, notification_type='unit_created',
+                    is_read=student == caught_up or unit == first,
+                )
+
+        apps = self.migrate(self.after)
+        NotificationEvent = apps.get_model('Myapp', 'NotificationEvent')
+        NotificationCursor = apps.get_model('Myapp', 'NotificationCursor')
+        # One event per unit, oldest first, whoever received it
+        events = list(NotificationEvent.objects.order_by('id').values_list('unit_id', flat=True))
+        self.assertEqual(events, [first.id, second.id])
+        first_event, second_event = NotificationEvent.objects.order_by('id').values_list('id', flat=True)
+        cursors = dict(NotificationCursor.objects.values_list('student_id', 'last_seen_event_id'))
+        self.assertEqual(cursors, {caught_up.id: second_event, behind.id: first_event})
+
+
+@override_settings(DATABASE_REPLICAS=[], DOWNLOAD_EVENTS_ENABLED=False)
+class AsyncViewParityTests(TestCase):
+    """The async views answer like the sync DRF views and download views they replaced"""
+
+    def setUp(self):
+        self.teacher = UserSignup.objects.create(full_name='Teacher', email='async-t@example.com', password=PASSWORD_HASH, role='teacher')
+        self.other = UserSignup.objects.create(full_name='Other', email='async-o@example.com', password=PASSWORD_HASH, role='teacher')
+        self.student = UserSignup.objects.create(full_name='Student', email='async-s@example.com', password=PASSWORD_HASH, role='student')
+        self.loner = UserSignup.objects.create(full_name='Loner', email='async-l@example.com', password=PASSWORD_HASH, role='student')
+        Enrollment.objects.create(student=self.student, teacher=self.teacher)
+        NotificationCursor.objects.bulk_create([NotificationCursor(student=s, last_seen_event_id=0) for s in (self.student, self.loner)])
+        unit = CourseUnit.objects.create(teacher=self.teacher, name='Unit A')
+        other_unit = CourseUnit.objects.create(teacher=self.other, name='Other unit')
+        self.published, self.draft, self.foreign = (
+            UploadedFile.objects.create(
+                teacher=u.teacher, unit=u, original_name=f'{name}.pdf', file=f'course_files/test/async-{name}.pdf',
+                file_size=10, file_type='application/pdf', is_published=published,
+            )
+            for u, name, published in ((unit, 'published', True), (unit, 'draft', False), (other_unit, 'foreign', True))
+        )
+        notifications.record_event(self.teacher, unit, 'unit_created')
+        notifications.record_event(self.teacher, unit, 'file_published', file=self.published)
+        notifications.record_event(self.other, other_unit, 'unit_created')
+        notifications.mark_read(self.student.id, NotificationEvent.objects.order_by('id').values_list('id', flat=True).first())
+
+    def login(self, user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = user.id
+        session['user_role'] = user.role
+        session.save()
+        for client in (self.client, self.async_client):
+            client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def previous_catalog(self, student=None):
+        """The removed TeachersListView, with the enrollment scoping added since"""
+        teachers = UserSignup.objects.filter(role='teacher')
+        if student is not None:
+            teachers = teachers.filter(course_enrollments__student=student)
+        return {'teachers': [
+            {'teacher': UserSerializer(t).data, 'units': CourseUnitSerializer(t.course_units.all(), many=True).data}
+            for t in teachers.prefetch_related('course_units__files')
+        ]}
+
+    def previous_feed(self, student):
+        """The removed NotificationFeedView"""
+        page, next_cursor, last_seen = notifications.get_feed(student.id)
+        return {
+            'notifications': NotificationSerializer(page, many=True, context={'last_seen': last_seen}).data,
+            'next_cursor': next_cursor,
+            'unread_count': notifications.get_unread_count(student.id, last_seen=last_seen),
+        }
+
+    async def assertAnswers(self, path, status, payload, params=None):
+        """The async client (ASGI) and the test client (WSGI) both get the old view's answer"""
+        expected = json.loads(JSONRenderer().render(payload))
+        for response in (await self.async_client.get(path, params), await sync_to_async(self.client.get)(path, params)):
+            self.assertEqual(response.status_code, status)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(response.json(), expected)
+
+    async def test_logged_out(self):
+        await self.assertAnswers('/api/v1/auth/me/', 200, {'user': None, 'error': 'No user session found'})
+        await self.assertAnswers('/api/v1/teachers/', 200, await sync_to_async(self.previous_catalog)())
+        await self.assertAnswers('/api/v1/notifications/', 403, {'success': False, 'error': 'Unauthorized'})
+        for name in ('download_file', 'preview_file'):
+            self.assertEqual((await self.async_client.get(reverse(name, args=[self.published.id]))).status_code, 404)
+
+    async def test_student_with_no_enrollments(self):
+        await sync_to_async(self.login)(self.loner)
+        await self.assertAnswers('/api/v1/auth/me/', 200, {'user': UserSerializer(self.loner).data})
+        await self.assertAnswers('/api/v1/teachers/', 200, {'teachers': []})
+        await self.assertAnswers('/api/v1/notifications/', 200, {'notifications': [], 'next_cursor': None, 'unread_count': 0})
+        for name in ('download_file', 'preview_file'):
+            self.assertEqual((await self.async_client.get(reverse(name, args=[self.published.id]))).status_code, 404)
+
+    async def test_enrolled_student(self):
+        await sync_to_async(self.login)(self.student)
+        await self.assertAnswers('/api/v1/teachers/', 200, await sync_to_async(self.previous_catalog)(self.student))
+        await self.assertAnswers('/api/v1/notifications/', 200, await sync_to_async(self.previous_feed)(self.student))
+        await self.assertAnswers('/api/v1/notifications/', 400, {'success': False, 'error': 'limit must be an integer'}, {'limit': 'x'})
+        await self.assertAnswers('/api/v1/notifications/', 400, {'success': False, 'error': 'Invalid cursor'}, {'cursor': 'x'})
+        for name in ('download_file', 'preview_file'):
+            response = await self.async_client.get(reverse(name, args=[self.published.id]))
+            self.assertRedirects(response, self.published.file.url, fetch_redirect_response=False)
+            for hidden in (self.draft, self.foreign):
+                self.assertEqual((await self.async_client.get(reverse(name, args=[hidden.id]))).status_code, 404)
+
+    async def test_teacher(self):
+        await sync_to_async(self.login)(self.teacher)
+        await self.assertAnswers('/api/v1/auth/me/', 200, {'user': UserSerializer(self.teacher).data})
+        await self.assertAnswers('/api/v1/teachers/', 200, await sync_to_async(self.previous_catalog)())
+        await self.assertAnswers('/api/v1/teachers/', 200, await sync_to_async(self.previous_catalog)(), {'kind': 'pdf'})
+        await self.assertAnswers('/api/v1/notifications/', 403, {'success': False, 'error': 'Unauthorized'})
+        response = await self.async_client.get(reverse('download_file', args=[self.draft.id]))
+        self.assertRedirects(response, self.draft.file.url, fetch_redirect_response=False)
+        self.assertEqual((await self.async_client.get(reverse('download_file', args=[self.foreign.id]))).status_code, 404)
+
+    async def test_session_user_that_no_longer_exists(self):
+        await sync_to_async(self.login)(self.student)
+        await self.student.adelete()
+        await self.assertAnswers('/api/v1/auth/me/', 200, {'user': None, 'error': 'Error retrieving user: User not found'})
+        self.assertEqual((await self.async_client.get(reverse('download_file', args=[self.published.id]))).status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=[], LIVE_EVENTS_DB_BRIDGE=False, LIVE_EVENTS_HEARTBEAT=0.01)
+class LiveEventTests(TestCase):
+    def setUp(self):
+        self.user = UserSignup.objects.create(full_name='Student', email='live@example.com', password=PASSWORD_HASH, role='student')
+        # A hub of its own, so tests don't see each other's history
+        self.hub = events.EventHub()
+        for module in (events, stream):
+            patcher = mock.patch.object(module, 'hub', self.hub)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def event(self, event_type='unit_created', **data):
+        return {'id': self.hub.next_id(), 'type': event_type, 'data': data}
+
+    def test_refused_under_wsgi(self):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = self.user.id
+        session['user_role'] = self.user.role
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        self.assertEqual(self.client.get('/api/v1/events/').status_code, 503)
+
+    async def test_fan_out_and_heartbeat(self):
+        loop = asyncio.get_running_loop()
+        streams = [stream._event_stream(self.hub.subscribe(loop), None) for _ in range(2)]
+        for frames in streams:
+            self.assertEqual(await anext(frames), f'retry: {settings.LIVE_EVENTS_RETRY_MS}\n\n')
+        event = self.event(unit_id=1)
+        self.hub.dispatch(event)
+        for frames in streams:
+            self.assertEqual(await anext(frames), events.format_sse(event))
+        # Nothing more to send: the idle stream gets keepalive comments
+        self.assertEqual(await anext(streams[0]), ': keepalive\n\n')
+        for frames in streams:
+            await frames.aclose()
+        self.assertEqual(self.hub.subscriber_count, 0)
+
+    async def test_resume_after_last_event_id(self):
+        subscription = self.hub.subscribe(asyncio.get_running_loop())
+        sent = [self.event(file_id=i) for i in range(3)]
+        for event in sent:
+            self.hub.dispatch(event)
+        frames = stream._event_stream(subscription, sent[0]['id'])
+        await anext(frames)
+        # Missed events come from the history; the queued copies of them, and of the event the
+        # client already had, are not sent again
+        self.assertEqual([await anext(frames) for _ in range(2)], [events.format_sse(e) for e in sent[1:]])
+        self.assertEqual(await anext(frames), ': keepalive\n\n')
+        await frames.aclose()
+
+    @override_settings(LIVE_EVENTS_DB_BRIDGE=True)
+    def test_bridge_dispatches_rows_with_resumable_ids(self):
+        bridge = events.DatabaseBridge(self.hub)
+        with self.captureOnCommitCallbacks(execute=True):
+            events.publish_event('file_published', file_id=1)
+            events.publish_event('file_deleted', file_id=2)
+        bridge.poll()
+        dispatched = self.hub.replay_since(0)
+        self.assertEqual([e['data'] for e in dispatched], [{'file_id': 1}, {'file_id': 2}])
+        self.assertEqual([e['id'] for e in dispatched], list(LiveEvent.objects.values_list('event_id', flat=True)))
+        # Another worker resumes from the same id
+        self.assertEqual(events.events_since(dispatched[0]['id']), dispatched[1:])
+        bridge.poll()
+        self.assertEqual(len(self.hub.replay_since(0)), 2)
+
+    async def test_streams_carry_only_the_users_courses(self):
+        teachers = [
+            await UserSignup.objects.acreate(full_name=f'T{i}', email=f'live-t{i}@example.com', password=PASSWORD_HASH, role='teacher')
+            for i in range(2)
+        ]
+        await Enrollment.objects.acreate(teacher=teachers[0], student=self.user)
+        loop = asyncio.get_running_loop()
+        student = self.hub.subscribe(loop, await sync_to_async(stream._audience)(self.user.id, 'student'))
+        teacher = self.hub.subscribe(loop, await sync_to_async(stream._audience)(teachers[1].id, 'teacher'))
+        frames = {name: stream._event_stream(subscription, None) for name, subscription in (('student', student), ('teacher', teacher))}
+        for stream_frames in frames.values():
+            await anext(stream_frames)
+        enrolled, other = (self.event(teacher_id=t.id, unit_id=t.id, unit_name='Secret') for t in teachers)
+        self.hub.dispatch(enrolled)
+        self.hub.dispatch(other)
+        self.assertEqual(await anext(frames['student']), events.format_sse(enrolled))
+        self.assertEqual(await anext(frames['student']), ': keepalive\n\n')
+        self.assertEqual(await anext(frames['teacher']), events.format_sse(other))
+        for stream_frames in frames.values():
+            await stream_frames.aclose()
+
+    def test_ids_increase_within_a_worker(self):
+        ids = [self.hub.next_id() for _ in range(100)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual({i % (1 << events.ID_SLOT_BITS) for i in ids}, {os.getpid() % (1 << events.ID_SLOT_BITS)})
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class SchedulerTests(TestCase):
+    def setUp(self):
+        self.teacher = UserSignup.objects.create(full_name='Teacher', email='sched@example.com', password=PASSWORD_HASH, role='teacher')
+        self.unit = CourseUnit.objects.create(teacher=self.teacher, name='Unit')
+        self.now = timezone.now()
+
+    def add_files(self, n, **fields):
+        start = UploadedFile.objects.count()
+        return UploadedFile.objects.bulk_create([
+            UploadedFile(
+                teacher=self.teacher, unit=self.unit, original_name=f'{start + i}.pdf', file=f'course_files/test/{start + i}.pdf',
+                file_size=100, file_type='application/pdf', **fields,
+            )
+            for i in range(n)
+        ])
+
+    def run_due(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return scheduler.run_due(self.now)
+
+    def test_only_due_schedules_are_applied(self):
+        [due] = self.add_files(1, publish_at=self.now - timedelta(minutes=1))
+        [later] = self.add_files(1, publish_at=self.now + timedelta(hours=1))
+        [withdrawn] = self.add_files(1, is_published=True, unpublish_at=self.now)
+        [kept] = self.add_files(1, is_published=True, unpublish_at=self.now + timedelta(minutes=5))
+        self.assertEqual(scheduler.next_due_at(), due.publish_at)
+
+        self.assertEqual(self.run_due(), (1, 1))
+        rows = {f.id: (f.is_published, f.publish_at, f.unpublish_at) for f in UploadedFile.objects.all()}
+        self.assertEqual(rows[due.id], (True, None, None))
+        self.assertEqual(rows[later.id], (False, later.publish_at, None))
+        self.assertEqual(rows[withdrawn.id], (False, None, None))
+        self.assertEqual(rows[kept.id], (True, None, kept.unpublish_at))
+        self.assertEqual(scheduler.next_due_at(), kept.unpublish_at)
+        self.assertEqual(self.run_due(), (0, 0))
+
+    def test_batches_count_and_notify_only_files_that_changed(self):
+        fresh = self.add_files(3, publish_at=self.now)
+        self.add_files(2, is_published=True, publish_at=self.now)
+        self.add_files(2, unpublish_at=self.now)
+        with mock.patch.object(scheduler, 'BATCH_SIZE', 2), mock.patch('Myapp.services.publish_event') as publish_event:
+            self.assertEqual(self.run_due(), (3, 0))
+        self.assertFalse(UploadedFile.objects.filter(Q(publish_at__isnull=False) | Q(unpublish_at__isnull=False)).exists())
+        notified = NotificationEvent.objects.filter(notification_type='file_published').values_list('file_id', flat=True)
+        self.assertEqual(sorted(notified), [f.id for f in fresh])
+        self.assertEqual(sorted(i for call in publish_event.call_args_list for i in call.kwargs['file_ids']), [f.id for f in fresh])
+
+    def test_withdrawals_run_the_same_hooks_as_unpublishing_by_hand(self):
+        manual, scheduled = self.add_files(2)
+        [draft] = self.add_files(1, unpublish_at=self.now)
+        services.set_published(self.teacher, UploadedFile.objects.all(), True)
+        UploadedFile.objects.filter(id=draft.id).update(is_published=False)
+        UploadedFile.objects.filter(id=scheduled.id).update(unpublish_at=self.now)
+        announced = NotificationEvent.objects.filter(notification_type='file_published')
+        self.assertEqual(announced.count(), 3)
+
+        hooks = []
+        with mock.patch('Myapp.services.publish_event', lambda event_type, **data: hooks.append((event_type, data))):
+            services.set_published(self.teacher, UploadedFile.objects.filter(id=manual.id), False)
+            self.assertEqual(self.run_due(), (0, 1))
+        self.assertEqual(hooks, [
+            ('file_unpublished', {'teacher_id': self.teacher.id, 'unit_id': self.unit.id, 'file_ids': [manual.id]}),
+            ('file_unpublished', {'teacher_id': self.teacher.id, 'unit_id': self.unit.id, 'file_ids': [scheduled.id]}),
+        ])
+        # The draft was already hidden, so the scheduler only cleared its schedule
+        self.assertEqual(list(announced.values_list('file_id', flat=True)), [draft.id])
+
+        # Releasing a withdrawn file announces it again
+        UploadedFile.objects.filter(id=scheduled.id).update(publish_at=self.now)
+        self.assertEqual(self.run_due(), (1, 0))
+        self.assertEqual(sorted(announced.values_list('file_id', flat=True)), sorted([draft.id, scheduled.id]))
+
+
+@override_settings(DATABASE_REPLICAS=[], TRASH_RETENTION_DAYS=7)
+class TrashTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='clouded-tests-')
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=cls.media_root)
+        media.enable()
+        cls.addClassCleanup(media.disable)
+        super().setUpClass()
+
+    def setUp(self):
+        self.teacher = UserSignup.objects.create(full_name='Teacher', email='trash@example.com', password=PASSWORD_HASH, role='teacher')
+        self.unit = CourseUnit.objects.create(teacher=self.teacher, name='Unit')
+        self.files = [self.add_file(f'{name}.pdf') for name in ('a', 'b')]
+        patcher = mock.patch.object(trash.time, 'sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_file(self, name):
+        stored = default_storage.save(f'course_files/test/{name}', ContentFile(b'%PDF-1.4'))
+        return UploadedFile.objects.create(
+            teacher=self.teacher, unit=self.unit, original_name=name, file=stored, file_size=8, file_type='application/pdf',
+        )
+
+    def age(self, days):
+        """Move everything in the trash ``days`` into the past"""
+        then = timezone.now() - timedelta(days=days)
+        UploadedFile.all_objects.filter(deleted_at__isnull=False).update(deleted_at=then)
+        CourseUnit.all_objects.filter(deleted_at__isnull=False).update(deleted_at=then)
+
+    def test_restore_within_the_window(self):
+        services.trash_unit(self.teacher, self.unit)
+        self.assertFalse(UploadedFile.objects.exists())
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = self.teacher.id
+        session['user_role'] = 'teacher'
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        response = self.client.post('/api/v1/trash/restore/', {'unit_id': self.unit.id}, content_type='application/json')
+        self.assertEqual(response.json(), {'success': True, 'restored_files': 2})
+        self.assertEqual(UploadedFile.objects.count(), 2)
+
+        services.trash_files(self.teacher, UploadedFile.objects.filter(id=self.files[0].id))
+        self.age(8)
+        self.assertEqual(services.restore_files(self.teacher, [self.files[0].id]), 0)
+
+    def test_purge_after_the_window(self):
+        services.trash_unit(self.teacher, self.unit)
+        self.age(6)
+        self.assertEqual(trash.purge_expired(), trash.PurgeResult())
+        self.age(8)
+        self.assertEqual(trash.purge_expired(), trash.PurgeResult(files_purged=2, units_purged=1))
+        self.assertFalse(UploadedFile.all_objects.exists())
+        self.assertFalse(any(default_storage.exists(f.file.name) for f in self.files))
+
+    def test_retry_then_give_up_and_report(self):
+        services.trash_unit(self.teacher, self.unit)
+        self.age(8)
+        storage = self.files[0].file.storage
+        real_delete = storage.delete
+
+        def flaky_delete(name):
+            if name == self.files[0].file.name:
+                raise OSError('storage unavailable')
+            real_delete(name)
+
+        with mock.patch.object(storage, 'delete', side_effect=flaky_delete), self.assertLogs('Myapp.trash', 'WARNING'):
+            self.assertEqual(trash.purge_expired(), trash.PurgeResult(files_purged=1, files_failed=1))
+            for _ in range(trash.MAX_PURGE_ATTEMPTS - 1):
+                trash.purge_expired()
+        self.assertEqual(UploadedFile.all_objects.get().purge_attempts, trash.MAX_PURGE_ATTEMPTS)
+
+        # No longer retried, but reported, and the unit waits for it
+        with self.assertLogs('Myapp.trash', 'ERROR') as logs:
+            self.assertEqual(trash.purge_expired(), trash.PurgeResult(files_stuck=1))
+        self.assertIn(self.files[0].file.name, logs.output[0])
+        self.assertTrue(CourseUnit.all_objects.filter(id=self.unit.id).exists())
+
+        self.assertEqual(trash.retry_stuck(), 1)
+        self.assertEqual(trash.purge_expired(), trash.PurgeResult(files_purged=1, units_purged=1))
+
+
+@override_settings(DATABASE_REPLICAS=[], PRINCIPAL_CACHE_TIMEOUT=60)
+class PrincipalCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserSignup.objects.create(full_name='Student', email='principal@example.com', password=PASSWORD_HASH, role='student')
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = self.user.id
+        session['user_role'] = self.user.role
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def me(self):
+        return self.client.get('/api/v1/auth/me/').json()['user']
+
+    def test_profile_and_role_changes_show_on_the_next_request(self):
+        self.assertEqual(self.me()['role'], 'student')
+        user = UserSignup.objects.get(id=self.user.id)
+        user.full_name, user.role = 'Renamed', 'teacher'
+        user.save()
+        self.assertEqual((self.me()['full_name'], self.me()['role']), ('Renamed', 'teacher'))
+
+    def test_only_the_public_profile_is_cached(self):
+        self.me()
+        cached = cache.get(UserSignup.principal_cache_key(self.user.id))
+        self.assertEqual(set(cached), {'id', 'full_name', 'email', 'role', 'subject'})
+        # A principal from the cache loads the rest on access, and saving it keeps the password
+        principal = get_principal(self.user.id)
+        self.assertEqual(principal.password, PASSWORD_HASH)
+        principal = get_principal(self.user.id)
+        principal.subject = 'Maths'
+        principal.save()
+        self.assertEqual(UserSignup.objects.get(id=self.user.id).password, PASSWORD_HASH)
+        self.assertEqual(self.me()['subject'], 'Maths')
+
+    @override_settings(PRINCIPAL_CACHE_TIMEOUT=0)
+    def test_not_cached_without_a_timeout(self):
+        self.me()
+        self.assertIsNone(cache.get(UserSignup.principal_cache_key(self.user.id)))
+
+
+@override_settings(DATABASE_REPLICAS=[], LOGIN_THROTTLE_EMAIL_BURST=3, LOGIN_THROTTLE_EMAIL_PER_MINUTE=3,
+                   LOGIN_THROTTLE_IP_BURST=5, LOGIN_THROTTLE_IP_PER_MINUTE=5)
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserSignup.objects.create(full_name='Student', email='throttle@example.com', password=PASSWORD_HASH, role='student')
+
+    def login(self, password='wrong', ip='10.0.0.1', email='throttle@example.com'):
+        return self.client.post(
+            '/api/v1/auth/login/', {'email': email, 'password': password, 'role': 'student'},
+            content_type='application/json', REMOTE_ADDR=ip,
+        )
+
+    def test_token_bucket_refills(self):
+        bucket = login_guard.TokenBucket('test', capacity=2, per_minute=60)
+        self.assertEqual([bucket.consume('k', now=100) for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(bucket.consume('k', now=100), 1.0)
+        self.assertEqual(bucket.consume('k', now=101.5), 0)
+
+    def test_guessing_locks_out_the_guesser_not_the_owner(self):
+        self.assertEqual([self.login().status_code for _ in range(3)], [401] * 3)
+        response = self.login(password=PASSWORD)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        # The owner, from another address, still gets in
+        self.assertEqual(self.login(password=PASSWORD, ip='10.0.0.2').status_code, 200)
+
+    def test_throttled_ip_keeps_its_email_tokens(self):
+        for i in range(5):
+            self.login(email=f'other-{i}@example.com')
+        self.assertEqual(self.login(password=PASSWORD).status_code, 429)
+        cache.delete('throttle:login-ip:10.0.0.1')
+        self.assertEqual(self.login(password=PASSWORD).status_code, 200)
+
+    def test_saturated_hashing_pool_answers_503(self):
+        with mock.patch.object(login_guard, '_slots', threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            response = self.login(password=PASSWORD)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+@override_settings(DATABASE_REPLICAS=[], PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], ROSTER_API_MAX_ROWS=3)
+class RosterImportTests(TestCase):
+    def setUp(self):
+        UserSignup.objects.create(full_name='Existing', email='taken@example.com', password=PASSWORD_HASH, role='student')
+
+    def run_import(self, text, **kwargs):
+        return roster.import_roster(io.StringIO(text), default_password='changeme', **kwargs)
+
+    def test_dedupe_and_per_row_errors(self):
+        result = self.run_import(
+            'full_name,email,password\n'
+            'Ada,ada@example.com,\n'
+            'Taken,taken@example.com,\n'
+            'Ada Again,ADA@example.com,\n'
+            ',nameless@example.com,\n'
+            'Bad,not-an-email,\n'
+            'Grace,grace@example.com,s3cret\n'
+        )
+        self.assertEqual(result.created, 2)
+        self.assertEqual([(line, email) for line, email, _ in result.errors], [
+            (3, 'taken@example.com'), (4, 'ADA@example.com'), (5, 'nameless@example.com'), (6, 'not-an-email'),
+        ])
+        self.assertEqual(result.errors[0][2], 'An account with this email already exists')
+        self.assertEqual(result.errors[1][2], 'Duplicate email in roster')
+        grace = UserSignup.objects.get(email='grace@example.com')
+        self.assertTrue(grace.check_password('s3cret'))
+        self.assertEqual(grace.role, 'student')
+
+    def test_batches_commit_separately_and_survive_a_signup_race(self):
+        rows = ''.join(f'S{i},s{i}@example.com\n' for i in range(5))
+        real_hash_all = roster._hash_all
+        calls = []
+
+        def hash_then_race(passwords, pool, workers):
+            # Someone signs up with the second batch's email between its duplicate check and its insert
+            calls.append(len(passwords))
+            if len(calls) == 2:
+                UserSignup.objects.create(full_name='Racer', email='s3@example.com', password=PASSWORD_HASH, role='student')
+            return real_hash_all(passwords, pool, workers)
+
+        with mock.patch.object(roster, '_hash_all', side_effect=hash_then_race), \
+                mock.patch.object(UserSignup.objects, 'bulk_create', wraps=UserSignup.objects.bulk_create) as bulk_create:
+            result = self.run_import(f'full_name,email\n{rows}', batch_size=2)
+        self.assertEqual(result.created, 4)
+        self.assertEqual(result.errors, [(5, 's3@example.com', 'An account with this email already exists')])
+        # The racing batch's insert rolls back and is retried without the taken email; the others commit as they are
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [2, 2, 1, 1])
+        self.assertFalse(UserSignup.objects.filter(full_name='S3').exists())
+
+    def test_retries_are_bounded_and_report_rows_instead_of_failing(self):
+        real_create = roster._create
+        racers = iter(['s1@example.com', 's2@example.com', 's3@example.com'])
+
+        def create_after_a_racer(users, teacher_id):
+            # A concurrent import takes one more of the batch's emails before every insert
+            UserSignup.objects.create(full_name='Racer', email=next(racers), password=PASSWORD_HASH, role='student')
+            real_create(users, teacher_id)
+
+        rows = ''.join(f'S{i},s{i}@example.com\n' for i in range(5))
+        with mock.patch.object(roster, '_create', side_effect=create_after_a_racer):
+            result = self.run_import(f'full_name,email\n{rows}')
+        self.assertEqual(result.created, 0)
+        self.assertEqual([(line, message) for line, _, message in result.errors], [
+            (2, 'Could not be created while another import was running; import it again'),
+            (3, 'An account with this email already exists'),
+            (4, 'An account with this email already exists'),
+            (5, 'An account with this email already exists'),
+            (6, 'Could not be created while another import was running; import it again'),
+        ])
+        self.assertFalse(UserSignup.objects.filter(full_name__startswith='S').exists())
+
+        # A conflict that is not a taken email is reported without retrying
+        with mock.patch.object(roster, '_create', side_effect=IntegrityError) as create:
+            result = self.run_import('full_name,email\nAda,ada@example.com\n')
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(result.created, 0)
+        self.assertEqual(result.errors, [(2, 'ada@example.com', 'Could not be created while another import was running; import it again')])
+
+    def test_missing_columns(self):
+        with self.assertRaisesMessage(roster.RosterError, 'Missing column(s): email'):
+            self.run_import('full_name\nAda\n')
+
+    def test_api_refuses_long_rosters_whole(self):
+        teacher = UserSignup.objects.create(full_name='Teacher', email='roster-t@example.com', password=PASSWORD_HASH, role='teacher')
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = teacher.id
+        session['user_role'] = 'teacher'
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+        def upload(n):
+            rows = ''.join(f'S{i},api{n}-{i}@example.com\n' for i in range(n))
+            return self.client.post('/api/v1/roster/import/', {
+                'file': SimpleUploadedFile('roster.csv', f'full_name,email\n{rows}'.encode(), 'text/csv'),
+                'default_password': 'changeme',
+            })
+
+        response = upload(4)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UserSignup.objects.filter(email__startswith='api4-').exists())
+        with mock.patch.object(roster, 'ProcessPoolExecutor') as pool:
+            response = upload(3)
+        self.assertEqual(response.json(), {'success': True, 'created': 3, 'errors': []})
+        pool.assert_not_called()
+        # The new students take the uploading teacher's course
+        self.assertEqual(
+            set(Enrollment.objects.filter(teacher=teacher).values_list('student__email', flat=True)),
+            {f'api3-{i}@example.com' for i in range(3)},
+        )
+
+    def test_command_enrolls_in_the_given_teachers_course(self):
+        teacher = UserSignup.objects.create(full_name='Teacher', email='cmd-t@example.com', password=PASSWORD_HASH, role='teacher')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fh:
+            fh.write('full_name,email\nAda,ada@example.com\nTaken,taken@example.com\n')
+        self.addCleanup(os.remove, fh.name)
+        call_command('import_roster', fh.name, '--default-password', 'changeme', '--teacher', teacher.email, stdout=io.StringIO())
+        self.assertEqual(list(Enrollment.objects.values_list('teacher_id', 'student__email')), [(teacher.id, 'ada@example.com')])
+        with self.assertRaisesMessage(CommandError, 'No teacher with email nobody@example.com'):
+            call_command('import_roster', fh.name, '--teacher', 'nobody@example.com', stdout=io.StringIO())
+
+
+@override_settings(DATABASE_REPLICAS=[], PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SeedDatasetTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = self.settings(MEDIA_ROOT=media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_students_are_enrolled_with_seeded_teachers(self):
+        counts = bench.seed_dataset('enrolled', teachers=4, units=1, files=1, students=5, courses=2, blob_size=16)
+        self.assertEqual(counts['enrollments'], 10)
+        teachers = set(bench.seeded_users('enrolled').filter(role='teacher').values_list('id', flat=True))
+        for student in bench.seeded_users('enrolled').filter(role='student'):
+            courses = set(enrollments.teacher_ids(student.id).values_list('teacher_id', flat=True))
+            self.assertEqual(len(courses), 2)
+            self.assertLessEqual(courses, teachers)
+        # More courses than teachers enrolls everyone with every teacher
+        self.assertEqual(bench.seed_dataset('small', teachers=1, units=1, files=0, students=2, courses=3)['enrollments'], 2)
+
+
+@override_settings(DATABASE_REPLICAS=[], METRICS_TOKEN='metrics-token', METRICS_ENABLED=True)
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir, ignore_errors=True)
+        overrides = self.settings(METRICS_DIR=self.metrics_dir)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # A fresh registry for this "process", so requests from other tests don't count
+        registry = metrics.Registry()
+        for target in ('Myapp.metrics.registry', 'Myapp.middleware.registry'):
+            patcher = mock.patch(target, registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def worker(self, *latencies):
+        registry = metrics.Registry()
+        for latency in latencies:
+            registry.observe('home', latency, db_queries=2, response_bytes=100)
+        registry.flush()
+        return registry
+
+    def test_collect_sums_workers(self):
+        self.worker(0.001, 0.2)
+        self.worker(3.0)
+        totals = metrics.collect()['home']
+        self.assertEqual(totals['count'], 3)
+        self.assertEqual(totals['db_queries'], 6)
+        self.assertEqual(totals['response_bytes'], 300)
+        self.assertEqual(sum(totals['buckets']), 3)
+        self.assertEqual(totals['buckets'][metrics.LATENCY_BUCKETS.index(5.0)], 1)
+        text = metrics.render_prometheus(metrics.collect())
+        self.assertIn('clouded_http_requests_total{view="home"} 3', text)
+        self.assertIn('clouded_http_request_duration_seconds_bucket{view="home",le="+Inf"} 3', text)
+
+    def test_exited_workers_stay_counted_without_their_files(self):
+        self.worker(0.01, 0.01)
+        self.worker(0.01)
+        stale = {name: open(os.path.join(self.metrics_dir, name)).read() for name in os.listdir(self.metrics_dir)}
+        metrics.retire_worker(os.getpid())
+        self.assertEqual(os.listdir(self.metrics_dir), [metrics.RETIRED])
+        self.assertEqual(metrics.collect()['home']['count'], 3)
+
+        # A scrape that still sees a retired worker's file counts it once
+        for name, content in stale.items():
+            with open(os.path.join(self.metrics_dir, name), 'w') as fh:
+                fh.write(content)
+        self.assertEqual(metrics.collect()['home']['count'], 3)
+        for name in stale:
+            os.remove(os.path.join(self.metrics_dir, name))
+
+        # A new worker that reuses the pid starts from zero on top of the retired totals
+        self.worker(0.01)
+        metrics.retire_worker(os.getpid())
+        self.assertEqual(metrics.collect()['home']['count'], 4)
+        metrics.reset()
+        self.assertEqual(os.listdir(self.metrics_dir), [])
+
+    def test_requests_are_recorded(self):
+        self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer metrics-token')
+        self.assertEqual(metrics.registry.snapshot()['metrics']['count'], 1)
+
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer metrics-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE clouded_http_requests_total counter', response.content.decode())
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+
+class QueueHandlerTests(SimpleTestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = log.QueueHandler(maxsize=2, stream=self.stream)
+        self.handler.setFormatter(log.JsonFormatter())
+        self.addCleanup(self.handler.close)
+
+    def emit(self, msg, *args, exc_info=None):
+        self.handler.handle(logging.LogRecord('Myapp.test', logging.WARNING, __file__, 1, msg, args, exc_info))
+
+    def lines(self):
+        self.handler.close()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_arguments_and_traceback_are_captured_when_logged(self):
+        items = ['a']
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            exc_info = sys.exc_info()
+        self.emit('items %s', items, exc_info=exc_info)
+        items.append('b')
+        [line] = self.lines()
+        self.assertEqual(line['msg'], "items ['a']")
+        self.assertIn('ValueError: boom', line['exc'])
+
+    def test_dropped_records_are_reported(self):
+        release = threading.Event()
+        target_emit = self.handler.target.emit
+        self.handler.target.emit = lambda record: (release.wait(5), target_emit(record))
+        self.emit('first')  # held by the listener
+        deadline = time.monotonic() + 5
+        while not self.handler.queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        for msg in ('second', 'third', 'fourth', 'fifth'):
+            self.emit(msg)
+        self.assertEqual(self.handler.dropped, 2)
+        release.set()
+        self.handler.queue.join()
+        self.emit('sixth')
+        self.assertEqual(
+            [line['msg'] for line in self.lines()],
+            ['first', 'second', 'third', 'Log queue full: dropped 2 records', 'sixth'],
+        )
+
+@skipUnless(sqlite_base.fcntl, 'the file lock needs fcntl')
+@override_settings(SQLITE_WRITE_RETRIES=2, SQLITE_RETRY_BACKOFF=0.01)
+class SqliteWriteLockTests(SimpleTestCase):
+    alias = 'sqlite_lock_test'
+    databases = '__all__'  # includes the alias added in setUpClass
+
+    @classmethod
+    def setUpClass(cls):
+        directory = tempfile.mkdtemp(prefix='clouded-tests-')
+        cls.addClassCleanup(shutil.rmtree, directory, ignore_errors=True)
+        cls.name = f'{directory}/db.sqlite3'
+        connections.settings[cls.alias] = {
+            **connections.settings['default'],
+            'ENGINE': 'Myapp.sqlite_backend',
+            'NAME': cls.name,
+            'OPTIONS': {**settings.SQLITE_PRODUCTION_OPTIONS, 'timeout': 0.2},
+        }
+        cls.addClassCleanup(cls.forget_connection)
+        super().setUpClass()
+
+    @classmethod
+    def forget_connection(cls):
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        del connections.settings[cls.alias]
+        _, fd = sqlite_base._write_locks.pop((os.getpid(), cls.name))
+        os.close(fd)
+
+    def setUp(self):
+        self.connection = connections[self.alias]
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS t')
+            cursor.execute('CREATE TABLE t (x integer)')
+        self.lock, _ = sqlite_base._write_lock(self.name)
+        # A second open file stands in for another worker process: flock conflicts between open files
+        self.other_process = os.open(f'{self.name}-writelock', os.O_RDWR)
+        self.addCleanup(os.close, self.other_process)
+
+    def assertLockHeld(self, held):
+        self.assertEqual(self.lock.locked(), held)
+        try:
+            sqlite_base.fcntl.flock(self.other_process, sqlite_base.fcntl.LOCK_EX | sqlite_base.fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.assertTrue(held, 'file lock still held')
+        else:
+            sqlite_base.fcntl.flock(self.other_process, sqlite_base.fcntl.LOCK_UN)
+            self.assertFalse(held, 'file lock not held')
+
+    def test_lock_is_held_for_the_transaction_and_released_on_commit(self):
+        with transaction.atomic(using=self.alias):
+            self.connection.cursor().execute('INSERT INTO t VALUES (1)')
+            self.assertLockHeld(True)
+        self.assertLockHeld(False)
+
+    def test_lock_is_released_on_rollback(self):
+        with self.assertRaises(ZeroDivisionError), transaction.atomic(using=self.alias):
+            self.connection.cursor().execute('INSERT INTO t VALUES (1)')
+            1 / 0
+        self.assertLockHeld(False)
+        self.assertEqual(self.connection.cursor().execute('SELECT count(*) FROM t').fetchone(), (0,))
+
+    def test_lock_is_released_on_close(self):
+        with transaction.atomic(using=self.alias):
+            self.connection.cursor().execute('INSERT INTO t VALUES (1)')
+            self.connection.close()
+            self.assertLockHeld(False)
+
+    def test_waiting_for_another_process_times_out(self):
+        sqlite_base.fcntl.flock(self.other_process, sqlite_base.fcntl.LOCK_EX)
+        started = time.monotonic()
+        with self.assertRaisesMessage(OperationalError, 'database is locked'), transaction.atomic(using=self.alias):
+            pass
+        self.assertLess(time.monotonic() - started, 2)
+        sqlite_base.fcntl.flock(self.other_process, sqlite_base.fcntl.LOCK_UN)
+        self.assertFalse(self.lock.locked())
+        with transaction.atomic(using=self.alias):
+            self.connection.cursor().execute('INSERT INTO t VALUES (1)')
+
+    def test_waiting_for_another_thread_times_out(self):
+        self.lock.acquire()
+        self.addCleanup(self.lock.release)
+        with self.assertRaisesMessage(OperationalError, 'database is locked'), transaction.atomic(using=self.alias):
+            pass
+
+    def test_begin_is_retried_with_backoff_while_sqlite_reports_locked(self):
+        begin = django_sqlite_base.DatabaseWrapper._start_transaction_under_autocommit
+        failures = [OperationalError('database is locked')] * 2
+
+        def flaky_begin(connection):
+            if failures:
+                raise failures.pop()
+            return begin(connection)
+
+        with mock.patch.object(django_sqlite_base.DatabaseWrapper, '_start_transaction_under_autocommit', flaky_begin), \
+                mock.patch.object(sqlite_base.time, 'sleep') as sleep:
+            with transaction.atomic(using=self.alias):
+                self.connection.cursor().execute('INSERT INTO t VALUES (1)')
+        self.assertEqual(sleep.call_count, 2)
+        first, second = (call.args[0] for call in sleep.call_args_list)
+        self.assertTrue(0.005 <= first <= 0.015 and 0.01 <= second <= 0.03, (first, second))
+        self.assertLockHeld(False)
+
+    def test_begin_gives_up_after_the_retries_or_on_other_errors(self):
+        for error, attempts in ((OperationalError('database is locked'), 3), (OperationalError('disk I/O error'), 1)):
+            with self.subTest(error=str(error)):
+                begin = mock.Mock(side_effect=error)
+                with mock.patch.object(django_sqlite_base.DatabaseWrapper, '_start_transaction_under_autocommit', begin), \
+                        mock.patch.object(sqlite_base.time, 'sleep'):
+                    with self.assertRaisesMessage(OperationalError, str(error)), transaction.atomic(using=self.alias):
+                        pass
+                self.assertEqual(begin.call_count, attempts)
+                self.assertLockHeld(False)
+
+
+class StaticStorageTests(SimpleTestCase):
+    def setUp(self):
+        source = tempfile.mkdtemp(prefix='clouded-tests-')
+        self.root = tempfile.mkdtemp(prefix='clouded-tests-')
+        self.addCleanup(shutil.rmtree, source, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        os.makedirs(f'{source}/css')
+        with open(f'{source}/css/app.css', 'w') as fh:
+            # Big enough that WhiteNoise keeps the compressed variants
+            fh.write('/* layout */\n' + ''.join(f'.col-{i} {{\n    width: {i}%;\n}}\n' for i in range(100)))
+        with open(f'{source}/css/vendor.min.css', 'w') as fh:
+            fh.write('a { color: red; }\n')
+        static = override_settings(
+            STATIC_ROOT=self.root,
+            STATICFILES_DIRS=[source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'Myapp.storage.MinifiedCompressedManifestStaticFilesStorage'}},
+        )
+        static.enable()
+        self.addCleanup(static.disable)
+
+    def test_minified_files_keep_their_hashed_name_and_compressed_variants(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        storage = storages['staticfiles']
+        name = storage.stored_name('css/app.css')
+        self.assertRegex(name, r'^css/app\.[0-9a-f]{12}\.css$')
+        with open(f'{self.root}/{name}') as fh:
+            self.assertEqual(fh.read(), ''.join(f'.col-{i}{{width:{i}%}}' for i in range(100)))
+        for suffix in ('.gz', '.br'):
+            self.assertTrue(os.path.exists(f'{self.root}/{name}{suffix}'), suffix)
+        with open(f'{self.root}/{storage.stored_name("css/vendor.min.css")}') as fh:
+            self.assertEqual(fh.read(), 'a { color: red; }\n')
+
+    def test_unhashed_names_are_served_only_in_debug(self):
+        storage = storages['staticfiles']
+        with self.assertRaises(ValueError):
+            storage.stored_name('css/app.css')
+        with override_settings(DEBUG=True):
+            self.assertEqual(storage.stored_name('css/app.css'), 'css/app.css')
+
+
+REPLICA = 'replica_test'
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class BulkFileActionTests(TestCase):
+    def setUp(self):
+        self.teacher = UserSignup.objects.create(full_name='Teacher', email='bulk-t@example.com', password=PASSWORD_HASH, role='teacher')
+        self.other = UserSignup.objects.create(full_name='Other', email='bulk-o@example.com', password=PASSWORD_HASH, role='teacher')
+        self.unit = CourseUnit.objects.create(teacher=self.teacher, name='Unit A')
+        self.target = CourseUnit.objects.create(teacher=self.teacher, name='Unit B')
+        self.other_unit = CourseUnit.objects.create(teacher=self.other, name='Other unit')
+        self.files = [self.add(self.teacher, self.unit, i, size) for i, size in enumerate((10, 20, 30))]
+        self.other_file = self.add(self.other, self.other_unit, 9, 40)
+        quotas.charge(self.teacher.id, {self.unit.id: (60, 3)})
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = self.teacher.id
+        session['user_role'] = 'teacher'
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def add(self, teacher, unit, i, size):
+        return UploadedFile.objects.create(
+            teacher=teacher, unit=unit, original_name=f'file-{i}.pdf', file=f'course_files/test/bulk-{i}.pdf',
+            file_size=size, file_type='application/pdf', tag='study_material',
+        )
+
+    def bulk(self, **data):
+        return self.client.post('/api/v1/files/bulk/', data, content_type='application/json')
+
+    def published(self):
+        return set(UploadedFile.objects.filter(is_published=True).values_list('id', flat=True))
+
+    def usage(self, unit=None):
+        return StorageUsage.objects.filter(teacher=self.teacher, unit=unit).values_list('bytes_used', 'files_used').first()
+
+    def test_publish_and_unpublish_count_changed_files(self):
+        ids = [f.id for f in self.files]
+        self.assertEqual(self.bulk(action='publish', unit_id=self.unit.id).json()['updated'], 3)
+        self.assertEqual(self.published(), set(ids))
+        self.assertEqual(NotificationEvent.objects.filter(notification_type='file_published').count(), 3)
+        # Already published: nothing changes and nothing is announced again
+        self.assertEqual(self.bulk(action='publish', file_ids=ids).json()['updated'], 0)
+        self.assertEqual(NotificationEvent.objects.filter(notification_type='file_published').count(), 3)
+        self.assertEqual(self.bulk(action='unpublish', file_ids=ids[:1]).json()['updated'], 1)
+        self.assertEqual(self.published(), set(ids[1:]))
+
+    def test_other_teachers_files_are_never_selected(self):
+        response = self.bulk(action='publish', file_ids=[self.other_file.id, self.files[0].id])
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual(self.published(), {self.files[0].id})
+        self.assertEqual(self.bulk(action='set_tag', tag='assignment', file_ids=[self.other_file.id]).json()['updated'], 0)
+        response = self.bulk(action='move', file_ids=[self.files[0].id], target_unit_id=self.other_unit.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadedFile.objects.get(id=self.files[0].id).unit_id, self.unit.id)
+
+    def test_set_tag(self):
+        UploadedFile.objects.filter(id=self.files[0].id).update(tag='assignment')
+        self.assertEqual(self.bulk(action='set_tag', tag='assignment', unit_id=self.unit.id).json()['updated'], 2)
+        self.assertEqual(set(UploadedFile.objects.filter(unit=self.unit).values_list('tag', flat=True)), {'assignment'})
+        self.assertEqual(self.bulk(action='set_tag', tag='poster', unit_id=self.unit.id).status_code, 400)
+        # filter_tag narrows the selection
+        self.assertEqual(
+            self.bulk(action='set_tag', tag='question_bank', unit_id=self.unit.id, filter_tag='study_material').json()['updated'], 0,
+        )
+
+    def test_move_shifts_unit_quota_usage(self):
+        moved = [self.files[0].id, self.files[1].id]
+        self.assertEqual(self.bulk(action='move', file_ids=moved, target_unit_id=self.target.id).json()['updated'], 2)
+        self.assertEqual(set(UploadedFile.objects.filter(unit=self.target).values_list('id', flat=True)), set(moved))
+        self.assertEqual(self.usage(self.unit), (30, 1))
+        self.assertEqual(self.usage(self.target), (30, 2))
+        self.assertEqual(self.usage(), (60, 3))
+        # Files already in the target are not moved or charged again
+        self.assertEqual(self.bulk(action='move', file_ids=moved, target_unit_id=self.target.id).json()['updated'], 0)
+        self.assertEqual(self.usage(self.target), (30, 2))
+
+    @override_settings(UNIT_QUOTA_FILES=1)
+    def test_move_over_the_target_quota_is_refused(self):
+        response = self.bulk(action='move', unit_id=self.unit.id, target_unit_id=self.target.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadedFile.objects.filter(unit=self.target).count(), 0)
+        self.assertEqual(self.usage(self.unit), (60, 3))
+
+    def test_malformed_requests(self):
+        self.assertEqual(self.bulk(action='publish').status_code, 400)
+        self.assertEqual(self.bulk(action='explode', unit_id=self.unit.id).status_code, 400)
+        self.assertEqual(self.bulk(action='move', unit_id=self.unit.id).status_code, 400)
+        self.assertEqual(self.bulk(action='publish', file_ids='1,2').status_code, 400)
+        self.assertEqual(self.published(), set())
+
+    def test_single_publish_parses_form_booleans(self):
+        file_id = self.files[0].id
+        UploadedFile.objects.filter(id=file_id).update(is_published=True)
+        response = self.client.post('/api/v1/files/publish/', {'file_id': file_id, 'is_published': 'false'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['file']['is_published'])
+        self.assertEqual(self.published(), set())
+        self.client.post('/api/v1/files/publish/', {'file_id': file_id, 'is_published': '1'})
+        self.assertEqual(self.published(), {file_id})
+        self.client.post('/api/v1/files/publish/', {'file_id': file_id, 'is_published': '0'})
+        self.assertEqual(self.published(), set())
+        response = self.client.post('/api/v1/files/publish/', {'file_id': file_id, 'is_published': 'maybe'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.published(), set())
+
+
+@override_settings(DATABASE_REPLICAS=[], TEACHER_QUOTA_BYTES=100, TEACHER_QUOTA_FILES=None, UNIT_QUOTA_BYTES=None, UNIT_QUOTA_FILES=None)
+class AdminTrashActionTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', PASSWORD))
+        self.teacher = UserSignup.objects.create(full_name='Teacher', email='admin-t@example.com', password=PASSWORD_HASH, role='teacher')
+        self.other = UserSignup.objects.create(full_name='Other', email='admin-o@example.com', password=PASSWORD_HASH, role='teacher')
+        self.unit = CourseUnit.objects.create(teacher=self.teacher, name='Unit A')
+        self.other_unit = CourseUnit.objects.create(teacher=self.other, name='Other unit')
+        self.files = [self.add(self.teacher, self.unit, 0, 30), self.add(self.teacher, self.unit, 1, 20), self.add(self.other, self.other_unit, 2, 40)]
+        quotas.charge(self.teacher.id, {self.unit.id: (50, 2)})
+        quotas.charge(self.other.id, {self.other_unit.id: (40, 1)})
+
+    def add(self, teacher, unit, i, size):
+        return UploadedFile.objects.create(
+            teacher=teacher, unit=unit, original_name=f'file-{i}.pdf', file=f'course_files/test/admin-{i}.pdf',
+            file_size=size, file_type='application/pdf', tag='study_material',
+        )
+
+    def act(self, model, action, objs):
+        return self.client.post(
+            reverse(f'admin:Myapp_{model}_changelist'),
+            {'action': action, '_selected_action': [obj.id for obj in objs]},
+            follow=True,
+        )
+
+    def usage(self, teacher):
+        return StorageUsage.objects.filter(teacher=teacher, unit=None).values_list('bytes_used', 'files_used').first()
+
+    def live_file_ids(self):
+        return set(UploadedFile.objects.values_list('id', flat=True))
+
+    def test_stock_delete_is_offered_only_where_rows_are_not_tombstoned(self):
+        for model, offered in (('usersignup', True), ('enrollment', True), ('courseunit', False), ('uploadedfile', False)):
+            with self.subTest(model=model):
+                response = self.client.get(reverse(f'admin:Myapp_{model}_changelist'))
+                self.assertEqual('delete_selected' in dict(response.context['action_form'].fields['action'].choices), offered)
+
+    def test_files_are_trashed_and_restored_across_teachers(self):
+        self.act('uploadedfile', 'move_to_trash', self.files)
+        self.assertEqual(self.live_file_ids(), set())
+        self.assertEqual((self.usage(self.teacher), self.usage(self.other)), ((0, 0), (0, 0)))
+        response = self.act('uploadedfile', 'restore', self.files)
+        self.assertContains(response, 'Restored 3 file(s).')
+        self.assertEqual(self.live_file_ids(), {f.id for f in self.files})
+        self.assertEqual((self.usage(self.teacher), self.usage(self.other)), ((50, 2), (40, 1)))
+
+    def test_file_restore_over_quota_is_reported(self):
+        self.act('uploadedfile', 'move_to_trash', self.files[:1])
+        self.add(self.teacher, self.unit, 3, 60)
+        quotas.charge(self.teacher.id, {self.unit.id: (60, 1)})
+        response = self.act('uploadedfile', 'restore', self.files)
+        self.assertContains(response, 'Restored 0 file(s).')
+        self.assertContains(response, 'Teacher: ')
+        self.assertNotIn(self.files[0].id, self.live_file_ids())
+        self.assertEqual(self.usage(self.teacher), (80, 2))
+
+    def test_units_are_trashed_and_restored_with_their_files(self):
+        self.act('courseunit', 'move_to_trash', [self.unit])
+        self.assertFalse(CourseUnit.objects.filter(id=self.unit.id).exists())
+        self.assertEqual(self.usage(self.teacher), (0, 0))
+        response = self.act('courseunit', 'restore', [self.unit, self.other_unit])
+        self.assertContains(response, 'Restored 1 unit(s).')
+        self.assertTrue(CourseUnit.objects.filter(id=self.unit.id).exists())
+        self.assertEqual(self.live_file_ids(), {f.id for f in self.files})
+        self.assertEqual(self.usage(self.teacher), (50, 2))
+
+    def test_unit_restore_errors_are_reported(self):
+        self.act('courseunit', 'move_to_trash', [self.unit])
+        CourseUnit.objects.create(teacher=self.teacher, name='Unit A')
+        response = self.act('courseunit', 'restore', [self.unit])
+        self.assertContains(response, 'Restored 0 unit(s).')
+        self.assertContains(response, 'Unit A: A unit named &quot;Unit A&quot; already exists')
+        self.assertFalse(CourseUnit.objects.filter(id=self.unit.id).exists())
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class FileKindTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='clouded-tests-')
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=cls.media_root)
+        media.enable()
+        cls.addClassCleanup(media.disable)
+        super().setUpClass()
+
+    def test_kinds_by_mime_type(self):
+        cases = {
+            'application/pdf': 'pdf',
+            'APPLICATION/PDF': 'pdf',
+            'application/vnd.ms-powerpoint': 'powerpoint',
+            'application/msword': 'word',
+            'text/plain': 'text',
+            'text/markdown': 'text',
+            'image/png': 'other',
+            'application/zip': 'other',
+            '': 'other',
+            None: 'other',
+            # Office and OpenDocument types all contain "document": the earlier rules win
+            'application/vnd.openxmlformats-officedocument.presentationml.presentation': 'powerpoint',
+            'application/vnd.oasis.opendocument.presentation': 'powerpoint',
+            'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'word',
+            'application/vnd.oasis.opendocument.text': 'word',
+        }
+        for file_type, kind in cases.items():
+            with self.subTest(file_type=file_type):
+                self.assertEqual(file_kind_for(file_type), kind)
+        self.assertEqual({kind for kind, _ in FILE_KIND_RULES} | {'other'}, {kind for kind, _ in UploadedFile.KIND_CHOICES})
+        for kind, _ in UploadedFile.KIND_CHOICES:
+            self.assertIn(kind, FILE_KIND_ICONS)
+            self.assertIn(kind, FILE_KIND_COLORS)
+
+    def test_save_fills_the_derived_fields(self):
+        teacher = UserSignup.objects.create(full_name='Teacher', email='kind-t@example.com', password=PASSWORD_HASH, role='teacher')
+        unit = CourseUnit.objects.create(teacher=teacher, name='Unit A')
+        record = UploadedFile(
+            teacher=teacher, unit=unit, original_name='slides.ppt', file=ContentFile(b'x', name='slides.ppt'),
+            file_size=1, file_type='application/vnd.ms-powerpoint',
+        )
+        record.save()
+        record.refresh_from_db()
+        self.assertEqual(record.file_kind, 'powerpoint')
+        self.assertEqual(record.public_url, default_storage.url(record.file.name))
+        self.assertEqual((record.get_file_icon(), record.can_preview()), ('fa-file-powerpoint', False))
+        # A changed MIME type is re-derived on the next save
+        record.file_type = 'application/pdf'
+        record.save()
+        record.refresh_from_db()
+        self.assertEqual(record.file_kind, 'pdf')
+        self.assertTrue(record.can_preview())
+
+
+@override_settings(DATABASE_REPLICAS=[], TEACHER_QUOTA_BYTES=100, TEACHER_QUOTA_FILES=None, UNIT_QUOTA_BYTES=None,
+                   UNIT_QUOTA_FILES=2)
+class StorageQuotaTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='clouded-tests-')
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=cls.media_root)
+        media.enable()
+        cls.addClassCleanup(media.disable)
+        super().setUpClass()
+
+    def setUp(self):
+        self.teacher = UserSignup.objects.create(full_name='Quota Teacher', email='quota@example.com', password=PASSWORD_HASH, role='teacher')
+        self.unit = CourseUnit.objects.create(teacher=self.teacher, name='Unit A')
+        self.other_unit = CourseUnit.objects.create(teacher=self.teacher, name='Unit B')
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = self.teacher.id
+        session['user_role'] = 'teacher'
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def upload(self, unit, *sizes):
+        files = [SimpleUploadedFile(f'notes-{i}.txt', b'x' * size, 'text/plain') for i, size in enumerate(sizes)]
+        return self.client.post(f'/api/v1/units/{unit.id}/upload/', {'files': files})
+
+    def usage(self, unit=None):
+        row = StorageUsage.objects.filter(teacher=self.teacher, unit=unit).first()
+        return (row.bytes_used, row.files_used) if row else (0, 0)
+
+    def test_uploads_are_counted(self):
+        self.assertEqual(self.upload(self.unit, 10, 20).status_code, 200)
+        self.assertEqual(self.usage(), (30, 2))
+        self.assertEqual(self.usage(self.unit), (30, 2))
+        usage = self.client.get('/api/v1/storage/').json()['usage']
+        self.assertEqual((usage['bytes_used'], usage['max_bytes'], usage['files_used']), (30, 100, 2))
+        self.assertEqual([u['files_used'] for u in usage['units']], [2, 0])
+
+    def test_upload_over_quota_is_rejected_while_reading(self):
+        response = self.upload(self.unit, 60, 60)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(UploadedFile.objects.exists())
+        self.assertEqual(self.usage(), (0, 0))
+
+    def test_unit_file_limit(self):
+        self.upload(self.unit, 1, 1)
+        self.assertEqual(self.upload(self.unit, 1).status_code, 413)
+        self.assertEqual(self.upload(self.other_unit, 1).status_code, 200)
+        self.assertEqual(self.usage(), (3, 3))
+
+    def test_row_override_beats_setting(self):
+        self.upload(self.unit, 90)
+        StorageUsage.objects.filter(teacher=self.teacher, unit__isnull=True).update(max_bytes=200)
+        self.assertEqual(self.upload(self.other_unit, 90).status_code, 200)
+
+    def test_trash_restore_and_move(self):
+        self.upload(self.unit, 40)
+        file_record = UploadedFile.objects.get()
+        services.trash_files(self.teacher, UploadedFile.objects.filter(id=file_record.id))
+        self.assertEqual(self.usage(), (0, 0))
+        self.upload(self.other_unit, 70)
+        with self.assertRaises(services.BulkActionError):
+            services.restore_files(self.teacher, [file_record.id])
+        self.assertEqual(self.usage(), (70, 1))
+
+        StorageUsage.objects.filter(teacher=self.teacher, unit__isnull=True).update(max_bytes=1000)
+        services.restore_files(self.teacher, [file_record.id])
+        services.move_to_unit(self.teacher, UploadedFile.objects.filter(id=file_record.id), self.other_unit.id)
+        self.assertEqual(self.usage(), (110, 2))
+        self.assertEqual(self.usage(self.unit), (0, 0))
+        self.assertEqual(self.usage(self.other_unit), (110, 2))
+
+    def test_reconcile(self):
+        self.upload(self.unit, 10)
+        StorageUsage.objects.filter(teacher=self.teacher).update(bytes_used=999, files_used=9)
+        call_command('reconcile_storage_usage', stdout=io.StringIO())
+        self.assertEqual(self.usage(), (10, 1))
+        self.assertEqual(self.usage(self.unit), (10, 1))
+        self.assertEqual(self.usage(self.other_unit), (0, 0))
+
+    def test_deleting_a_file_row_releases_its_quota(self):
+        self.upload(self.unit, 10, 20)
+        live, trashed = UploadedFile.objects.order_by('id')
+        services.trash_files(self.teacher, UploadedFile.objects.filter(id=trashed.id))
+        self.assertEqual(self.usage(), (10, 1))
+        name = live.file.name
+        live.delete()
+        self.assertEqual(self.usage(), (0, 0))
+        self.assertEqual(self.usage(self.unit), (0, 0))
+        self.assertFalse(default_storage.exists(name))
+        # Already released when it was trashed
+        UploadedFile.all_objects.get(id=trashed.id).delete()
+        self.assertEqual(self.usage(), (0, 0))
+
+    def test_admin_cannot_edit_deleted_at(self):
+        file_admin = UploadedFileAdmin(UploadedFile, django_admin.site)
+        self.assertIn('deleted_at', file_admin.get_readonly_fields(None))
+
+
+@override_settings(DATABASE_REPLICAS=[], DOWNLOAD_EVENTS_ENABLED=True)
+class DownloadEventTests(TestCase):
+    def setUp(self):
+        self.teacher = UserSignup.objects.create(full_name='Teacher', email='dl-teacher@example.com', password=PASSWORD_HASH, role='teacher')
+        self.student = UserSignup.objects.create(full_name='Student', email='dl-student@example.com', password=PASSWORD_HASH, role='student')
+        unit = CourseUnit.objects.create(teacher=self.teacher, name='Unit')
+        self.file = UploadedFile.objects.create(
+            teacher=self.teacher, unit=unit, original_name='notes.pdf', file='course_files/test/notes.pdf',
+            file_size=1024, file_type='application/pdf', is_published=True,
+        )
+        Enrollment.objects.create(teacher=self.teacher, student=self.student)
+        # A recorder of its own whose flusher never wakes on its own, so the test decides when rows are written
+        self.recorder = downloads.Recorder(capacity=3, batch_size=100, interval=3600)
+        patcher = mock.patch.object(downloads, 'recorder', self.recorder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = user.id
+        session['user_role'] = user.role
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def test_student_views_are_written_in_one_batch(self):
+        self.login(self.student)
+        self.client.get(f'/api/download-file/{self.file.id}/')
+        self.client.get(f'/api/preview-file/{self.file.id}/')
+        self.assertFalse(DownloadEvent.objects.exists())
+        with self.assertNumQueries(1):
+            self.assertEqual(self.recorder.flush(), 2)
+        events = DownloadEvent.objects.values_list('file_id', 'student_id', 'kind')
+        self.assertEqual(list(events), [(self.file.id, self.student.id, 'download'), (self.file.id, self.student.id, 'preview')])
+
+    def test_files_outside_the_students_courses_are_not_found(self):
+        other = UserSignup.objects.create(full_name='Other', email='dl-other@example.com', password=PASSWORD_HASH, role='student')
+        self.login(other)
+        self.assertEqual(self.client.get(f'/api/download-file/{self.file.id}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/preview-file/{self.file.id}/').status_code, 404)
+        self.assertEqual(self.recorder.flush(), 0)
+
+    def test_teacher_views_are_not_recorded(self):
+        self.login(self.teacher)
+        self.client.get(f'/api/preview-file/{self.file.id}/')
+        self.assertEqual(self.recorder.flush(), 0)
+
+    def test_full_buffer_drops_oldest(self):
+        for student_id in range(5):
+            downloads.record(self.file.id, student_id, 'download')
+        self.assertEqual(self.recorder.dropped, 2)
+        with self.assertLogs('Myapp.downloads', 'WARNING'):
+            self.recorder.flush()
+        self.assertEqual(list(DownloadEvent.objects.values_list('student_id', flat=True)), [2, 3, 4])
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class UsageRollupTests(TestCase):
+    DAY = datetime(2026, 3, 2, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.teacher = UserSignup.objects.create(full_name='Teacher', email='rollup@example.com', password=PASSWORD_HASH, role='teacher')
+        self.unit = CourseUnit.objects.create(teacher=self.teacher, name='Unit')
+        self.files = UploadedFile.objects.bulk_create([
+            UploadedFile(
+                teacher=self.teacher, unit=self.unit, original_name=f'file-{i}.pdf', file=f'course_files/test/r-{i}.pdf',
+                file_size=100 * (i + 1), file_type='application/pdf', is_published=True,
+            )
+            for i in range(2)
+        ])
+
+    def events(self, *specs):
+        """(file index, student id, kind, hours after DAY) per event"""
+        DownloadEvent.objects.bulk_create([
+            DownloadEvent(file=self.files[i], student_id=student, kind=kind, created_at=self.DAY + timedelta(hours=hours))
+            for i, student, kind, hours in specs
+        ])
+
+    def rollup(self, period, unit=False, file=None):
+        rows = UsageRollup.objects.filter(period=period, unit__isnull=not unit, file=file)
+        return list(rows.order_by('period_start').values_list('downloads', 'previews', 'unique_students', 'bytes_served'))
+
+    def test_rollups_per_period_and_scope(self):
+        self.events((0, 1, 'download', 1), (0, 2, 'download', 1), (1, 1, 'preview', 1), (0, 1, 'download', 5))
+        self.assertEqual(analytics.rollup(), 1)
+        self.assertEqual(self.rollup('day'), [(3, 1, 2, 500)])
+        self.assertEqual(self.rollup('day', unit=True), [(3, 1, 2, 500)])
+        self.assertEqual(self.rollup('day', unit=True, file=self.files[0]), [(3, 0, 2, 300)])
+        self.assertEqual(self.rollup('hour'), [(2, 1, 2, 400), (1, 0, 1, 100)])
+
+    def test_rerun_and_late_events(self):
+        self.events((0, 1, 'download', 1))
+        analytics.rollup()
+        self.assertEqual(analytics.rollup(), 0)
+        # A worker flushing late: an older event with a newer id rebuilds its day, not just adds to it
+        self.events((0, 1, 'download', 2), (1, 2, 'preview', 30))
+        self.assertEqual(analytics.rollup(), 2)
+        self.assertEqual(self.rollup('day'), [(2, 0, 1, 200), (0, 1, 1, 200)])
+        UsageRollup.objects.filter(period='day').update(downloads=99)
+        RollupWatermark.objects.update(last_event_id=0)
+        analytics.rollup()
+        self.assertEqual(self.rollup('day'), [(2, 0, 1, 200), (0, 1, 1, 200)])
+
+    def test_api_reads_own_rollups(self):
+        now = timezone.now()
+        DownloadEvent.objects.bulk_create([
+            DownloadEvent(file=self.files[0], student_id=1, kind='download', created_at=now),
+            DownloadEvent(file=self.files[1], student_id=2, kind='preview', created_at=now),
+        ])
+        call_command('rollup_usage', stdout=io.StringIO())
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = self.teacher.id
+        session['user_role'] = 'teacher'
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+        data = self.client.get('/api/v1/analytics/?last=7').json()
+        self.assertEqual(len(data['series']), 1)
+        self.assertEqual(data['series'][0]['unique_students'], 2)
+        self.assertEqual([u['name'] for u in data['units']], ['Unit'])
+        self.assertEqual([(f['file_id'], f['downloads'], f['previews']) for f in data['files']],
+                         [(self.files[0].id, 1, 0), (self.files[1].id, 0, 1)])
+        data = self.client.get(f'/api/v1/analytics/?period=hour&unit={self.unit.id}').json()
+        self.assertEqual((data['series'][0]['downloads'], len(data['files'])), (1, 2))
+        self.assertEqual(self.client.get('/api/v1/analytics/?period=week').status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=[], TRENDING_HALF_LIFE_HOURS=24, TRENDING_TOP_K=2)
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.files = []
+        self.teachers = []
+        for subject in ('Maths', 'Physics'):
+            teacher = UserSignup.objects.create(
+                full_name=subject, email=f'{subject}@example.com', password=PASSWORD_HASH, role='teacher', subject=subject,
+            )
+            self.teachers.append(teacher)
+            unit = CourseUnit.objects.create(teacher=teacher, name=f'{subject} unit')
+            self.files += UploadedFile.objects.bulk_create([
+                UploadedFile(
+                    teacher=teacher, unit=unit, original_name=f'{subject}-{i}.pdf', file=f'course_files/test/{subject}-{i}.pdf',
+                    file_size=100, file_type='application/pdf', is_published=True,
+                )
+                for i in range(3)
+            ])
+        self.maths, self.physics = self.teachers
+
+    def events(self, *specs):
+        """(file index, kind, hours ago) per event"""
+        now = timezone.now()
+        DownloadEvent.objects.bulk_create([
+            DownloadEvent(file=self.files[i], student_id=1, kind=kind, created_at=now - timedelta(hours=hours))
+            for i, kind, hours in specs
+        ])
+
+    def names(self, materials):
+        return [m['name'] for m in materials]
+
+    def login_student(self, *teachers):
+        student = UserSignup.objects.create(full_name='Student', email='trending-s@example.com', password=PASSWORD_HASH, role='student')
+        Enrollment.objects.bulk_create([Enrollment(teacher=teacher, student=student) for teacher in teachers])
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = student.id
+        session['user_role'] = 'student'
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def test_recent_activity_outranks_older(self):
+        # Two downloads two days ago (worth 1.5 now) against one download today (3)
+        self.events((0, 'download', 48), (0, 'download', 48), (1, 'download', 0), (3, 'preview', 0))
+        courses = trending.refresh()
+        self.assertEqual(self.names(courses[self.maths.id]['materials']), ['Maths-1.pdf', 'Maths-0.pdf'])
+        self.assertAlmostEqual(courses[self.maths.id]['materials'][1]['score'], 1.5, places=1)
+        # Merged across courses and cut to TRENDING_TOP_K again
+        _, materials = trending.materials([self.maths.id, self.physics.id])
+        self.assertEqual(self.names(materials), ['Maths-1.pdf', 'Maths-0.pdf'])
+        _, materials = trending.materials([self.physics.id])
+        self.assertEqual(self.names(materials), ['Physics-0.pdf'])
+        _, materials = trending.materials([self.maths.id, self.physics.id], subject='Physics')
+        self.assertEqual(self.names(materials), ['Physics-0.pdf'])
+
+    def test_incremental_scores_match_one_pass(self):
+        self.events((0, 'download', 30), (1, 'preview', 5))
+        trending.refresh()
+        self.events((1, 'download', 1), (1, 'download', 0))
+        trending.refresh()
+        incremental = dict(TrendingScore.objects.values_list('file_id', 'log_score'))
+        # Re-running with no new events changes nothing
+        trending.refresh()
+        self.assertEqual(dict(TrendingScore.objects.values_list('file_id', 'log_score')), incremental)
+
+        TrendingScore.objects.all().delete()
+        RollupWatermark.objects.filter(name=trending.WATERMARK).update(last_event_id=0)
+        trending.refresh()
+        for file_id, log_score in TrendingScore.objects.values_list('file_id', 'log_score'):
+            self.assertAlmostEqual(incremental[file_id], log_score)
+
+    def test_only_published_files_are_listed(self):
+        self.events((0, 'download', 0), (1, 'preview', 0))
+        UploadedFile.objects.filter(id=self.files[0].id).update(is_published=False)
+        trending.refresh()
+        cache.clear()
+        self.login_student(self.maths, self.physics)
+        self.assertEqual(self.names(self.client.get('/api/v1/materials/trending/').json()['materials']), ['Maths-1.pdf'])
+        response = self.client.get('/api/v1/materials/trending/?subject=Physics').json()
+        self.assertEqual(response['materials'], [])
+
+    def test_students_see_their_courses_only(self):
+        self.events((0, 'download', 0), (3, 'download', 0), (4, 'preview', 0))
+        trending.refresh()
+        self.login_student(self.physics)
+        response = self.client.get('/api/v1/materials/trending/').json()
+        self.assertEqual(self.names(response['materials']), ['Physics-0.pdf', 'Physics-1.pdf'])
+        self.assertIsNotNone(response['computed_at'])
+        # A course that stops trending drops out of the cache as well as the database
+        DownloadEvent.objects.filter(file__teacher=self.physics).delete()
+        TrendingScore.objects.filter(file__teacher=self.physics).delete()
+        trending.refresh()
+        self.assertEqual(self.client.get('/api/v1/materials/trending/').json()['materials'], [])
+        self.assertEqual(
+            list(TrendingSnapshot.objects.values_list('name', flat=True)), [trending._snapshot_name(self.maths.id)]
+        )
+
+
+def pdf_bytes(*pages):
+    """A minimal PDF with one line of Helvetica text per page"""
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages)))}] /Count {len(pages)} >>",
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    for i, text in enumerate(pages):
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>'
+        )
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+    out, offsets = b'%PDF-1.4\n', []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n{body}\nendobj\n'.encode()
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    return out + f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+
+
+def office_bytes(parts):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, xml in parts.items():
+            archive.writestr(name, xml)
+    return buffer.getvalue()
+
+
+def docx_bytes(*paragraphs):
+    body = ''.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs)
+    return office_bytes({'word/document.xml': (
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{body}</w:body></w:document>'
+    )})
+
+
+def pptx_bytes(*slides):
+    return office_bytes({
+        f'ppt/slides/slide{i}.xml': (
+            '<p:sld xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+            'xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main">'
+            f'<a:p><a:r><a:t>{text}</a:t></a:r></a:p></p:sld>'
+        )
+        for i, text in enumerate(slides, 1)
+    })
+
+
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PPTX = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class DocumentSearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp(prefix='clouded-tests-')
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=cls.media_root)
+        media.enable()
+        cls.addClassCleanup(media.disable)
+        super().setUpClass()
+
+    def setUp(self):
+        self.teacher = UserSignup.objects.create(full_name='Teacher', email='search-t@example.com', password=PASSWORD_HASH, role='teacher')
+        self.student = UserSignup.objects.create(full_name='Student', email='search-s@example.com', password=PASSWORD_HASH, role='student')
+        self.unit = CourseUnit.objects.create(teacher=self.teacher, name='Physics')
+        Enrollment.objects.create(teacher=self.teacher, student=self.student)
+
+    def add(self, name, file_type, content, published=True):
+        return UploadedFile.objects.create(
+            teacher=self.teacher, unit=self.unit, original_name=name, file=SimpleUploadedFile(name, content, file_type),
+            file_size=len(content), file_type=file_type, is_published=published,
+        )
+
+    def search(self, query, user=None):
+        user = user or self.student
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = user.id
+        session['user_role'] = user.role
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        return self.client.get('/api/v1/search/', {'q': query}).json()['results']
+
+    def names(self, query, user=None):
+        return sorted(result['name'] for result in self.search(query, user))
+
+    def indexed_file_ids(self, word):
+        # Straight from the FTS5 index, to tell removed rows from rows the visibility join hides
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT rowid >> 16 FROM "Myapp_search_index" WHERE "Myapp_search_index" MATCH %s', [word])
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_formats_phrases_and_prefixes(self):
+        self.add('circuits.pdf', 'application/pdf', pdf_bytes('Ohm basics', "Kirchhoff's law of currents"))
+        self.add('notes.docx', DOCX, docx_bytes('The first law of thermodynamics', 'Entropy increases'))
+        self.add('slides.pptx', PPTX, pptx_bytes('Maxwell equations', 'Kirchhoff circuits'))
+        self.add('motion.txt', 'text/plain', b'Newton wrote three laws of motion')
+        self.add('draft.txt', 'text/plain', b'Unpublished Kirchhoff draft', published=False)
+        call_command('index_documents', stdout=io.StringIO())
+
+        results = self.search('"Kirchhoff\'s law"')
+        self.assertEqual([(r['name'], r['page']) for r in results], [('circuits.pdf', 2)])
+        self.assertIn('<mark>Kirchhoff&#x27;s law</mark>', results[0]['snippet'])
+        self.assertEqual(self.names('kirch*'), ['circuits.pdf', 'slides.pptx'])
+        self.assertEqual(self.names('laws'), ['circuits.pdf', 'motion.txt', 'notes.docx'])
+        self.assertEqual(self.names('entropy law'), ['notes.docx'])
+        self.assertEqual(self.names('kirchhoff', user=self.teacher), ['circuits.pdf', 'draft.txt', 'slides.pptx'])
+
+    def test_students_search_their_courses_only(self):
+        self.add('circuits.txt', 'text/plain', b'Kirchhoff circuits')
+        other = UserSignup.objects.create(full_name='Other', email='search-o@example.com', password=PASSWORD_HASH, role='teacher')
+        UploadedFile.objects.create(
+            teacher=other, unit=CourseUnit.objects.create(teacher=other, name='Circuits'), original_name='other.txt',
+            file=SimpleUploadedFile('other.txt', b'Kirchhoff again', 'text/plain'), file_size=15, file_type='text/plain',
+            is_published=True,
+        )
+        search.index_pending()
+        self.assertEqual(self.names('kirchhoff'), ['circuits.txt'])
+        self.assertEqual(self.names('kirchhoff', user=other), ['other.txt'])
+        Enrollment.objects.filter(student=self.student).delete()
+        self.assertEqual(self.names('kirchhoff'), [])
+
+    def test_reextracted_only_when_content_changes(self):
+        first = self.add('a.txt', 'text/plain', b'alpha particles')
+        search.index_pending()
+        with mock.patch.object(search, '_extract', wraps=search._extract) as extract:
+            self.assertEqual(search.index_pending(recheck=True).unchanged, 1)
+            self.assertFalse(extract.called)
+            with open(first.file.path, 'wb') as fh:
+                fh.write(b'beta decay')
+            self.assertEqual(search.index_pending(recheck=True).indexed, 1)
+            self.assertEqual(extract.call_count, 1)
+            # Same content uploaded again: the stored text is reused
+            self.add('copy.txt', 'text/plain', b'beta decay')
+            search.index_pending()
+            self.assertEqual(extract.call_count, 1)
+        self.assertEqual(self.indexed_file_ids('alpha'), set())
+        self.assertEqual(self.names('beta'), ['a.txt', 'copy.txt'])
+
+    @override_settings(SEARCH_EXTRACT_MAX_CHARS=20)
+    def test_extraction_budget_truncates(self):
+        file_record = self.add('long.pdf', 'application/pdf', pdf_bytes('Capacitors store charge', 'Inductors resist change'))
+        search.index_pending()
+        text = DocumentText.objects.get(file=file_record)
+        self.assertEqual((text.status, text.pages), ('truncated', 1))
+        self.assertEqual(self.names('capacitors'), ['long.pdf'])
+        self.assertEqual(self.names('inductors'), [])
+
+    def test_unsupported_and_purged_files(self):
+        legacy = self.add('old.doc', 'application/msword', b'\xd0\xcf\x11\xe0 not a zip')
+        kept = self.add('kept.txt', 'text/plain', b'Ampere and Kirchhoff')
+        search.index_pending()
+        self.assertEqual(DocumentText.objects.get(file=legacy).status, 'failed')
+
+        UploadedFile.objects.filter(id=kept.id).update(deleted_at=timezone.now() - timedelta(days=30))
+        trash.purge_expired()
+        self.assertEqual(self.indexed_file_ids('ampere'), set())
+
+
+class EnrollmentTests(TestCase):
+    def setUp(self):
+        self.teacher, self.other_teacher = UserSignup.objects.bulk_create([
+            UserSignup(full_name=name, email=f'{name}@example.com', password=PASSWORD_HASH, role='teacher', subject=name)
+            for name in ('Maths', 'Physics')
+        ])
+        self.enrolled, self.outsider = UserSignup.objects.bulk_create([
+            UserSignup(full_name=name, email=f'{name}@example.com', password=PASSWORD_HASH, role='student')
+            for name in ('enrolled', 'outsider')
+        ])
+        Enrollment.objects.create(student=self.enrolled, teacher=self.teacher)
+        NotificationCursor.objects.bulk_create([NotificationCursor(student=s) for s in (self.enrolled, self.outsider)])
+        for teacher in (self.teacher, self.other_teacher):
+            unit = CourseUnit.objects.create(teacher=teacher, name=f'{teacher.subject} unit')
+            NotificationEvent.objects.create(teacher=teacher, unit=unit, notification_type='unit_created')
+
+    def login(self, user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = user.id
+        session['user_role'] = user.role
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def test_catalog_and_notifications_cover_enrolled_courses_only(self):
+        self.login(self.enrolled)
+        teachers = self.client.get('/api/v1/teachers/').json()['teachers']
+        self.assertEqual([t['teacher']['email'] for t in teachers], ['Maths@example.com'])
+        page, _, _ = notifications.get_feed(self.enrolled.id)
+        self.assertEqual([event.teacher_id for event in page], [self.teacher.id])
+        self.assertEqual(notifications.get_unread_count(self.enrolled.id), 1)
+        self.assertEqual(notifications.get_unread_count(self.outsider.id), 0)
+
+    def test_bulk_enroll_and_unenroll(self):
+        self.login(self.teacher)
+
+        def post(action, **data):
+            return self.client.post('/api/v1/enrollments/', {'action': action, **data}, content_type='application/json').json()
+
+        result = post('enroll', student_ids=[self.enrolled.id, self.other_teacher.id], emails=['outsider@example.com', 'nobody@example.com'])
+        self.assertEqual(result, {'success': True, 'enrolled': 1, 'not_found': [self.other_teacher.id, 'nobody@example.com']})
+        self.assertEqual(set(Enrollment.objects.filter(teacher=self.teacher).values_list('student_id', flat=True)), {self.enrolled.id, self.outsider.id})
+
+        result = post('unenroll', emails=['enrolled@example.com', 'outsider@example.com'])
+        self.assertEqual(result, {'success': True, 'unenrolled': 2, 'not_found': []})
+        with self.assertNumQueries(1):
+            self.assertEqual(enrollments.unenroll(self.teacher.id, [self.enrolled.id]), 0)
+        self.assertFalse(Enrollment.objects.exists())
+
+    def test_students_cannot_enroll(self):
+        self.login(self.enrolled)
+        response = self.client.post(
+            '/api/v1/enrollments/', {'action': 'enroll', 'student_ids': [self.outsider.id]}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_emails_go_to_enrolled_students(self):
+        unit = self.teacher.course_units.get()
+        send_notification_email(self.teacher, unit, 'unit_created')
+        self.assertEqual([message.to for message in mail.outbox], [[self.enrolled.email]])
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class ReplicaRoutingTests(TestCase):
+    """Reads go to the replica unless the client just wrote or the replica is down"""
+
+    @classmethod
+    def setUpClass(cls):
+        # The alias only exists while this class runs, so it is added here rather than seen by the test runner
+        cls.databases = {'default', REPLICA}
+        cls.replica_dir = tempfile.mkdtemp(prefix='clouded-replica-')
+        cls.addClassCleanup(shutil.rmtree, cls.replica_dir, ignore_errors=True)
+        connections.settings[REPLICA] = dict(
+            connections.settings['default'], NAME=os.path.join(cls.replica_dir, 'replica.sqlite3')
+        )
+        cls.addClassCleanup(cls.remove_replica)
+        call_command('migrate', database=REPLICA, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def remove_replica(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+
+    def setUp(self):
+        # Rows written only to the primary or only to the replica tell them apart
+        self.teacher = UserSignup.objects.create(
+            full_name='Primary Teacher', email='primary@example.com', password=PASSWORD_HASH, role='teacher'
+        )
+        UserSignup.objects.using(REPLICA).create(
+            id=self.teacher.id, full_name='Replica Teacher', email='primary@example.com', password=PASSWORD_HASH, role='teacher'
+        )
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user_id'] = self.teacher.id
+        session['user_role'] = 'teacher'
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        cache.clear()
+        self.addCleanup(db_router._down_until.clear)
+
+    def catalog_names(self):
+        return [t['teacher']['full_name'] for t in self.client.get('/api/v1/teachers/').json()['teachers']]
+
+    def test_without_replicas_everything_uses_the_primary(self):
+        self.assertEqual(self.catalog_names(), ['Primary Teacher'])
+
+    @override_settings(DATABASE_REPLICAS=[REPLICA])
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.catalog_names(), ['Replica Teacher'])
+        # The session exists only on the primary; sessions are never read from a replica
+        self.assertEqual(self.client.get('/api/v1/auth/me/').json()['user']['full_name'], 'Replica Teacher')
+
+    @override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SECONDS=60)
+    def test_client_that_wrote_reads_from_the_primary(self):
+        response = self.client.post('/api/v1/units/create/', {'name': 'Fresh unit'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+        catalog = self.client.get('/api/v1/teachers/').json()['teachers']
+        self.assertEqual([u['name'] for u in catalog[0]['units']], ['Fresh unit'])
+
+        # Once the pin expires, reads go back to the replica
+        self.client.cookies[db_router.PIN_COOKIE] = '0'
+        self.assertEqual(self.catalog_names(), ['Replica Teacher'])
+
+    @override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SECONDS=30)
+    def test_pin_cookie_holds_reads_on_the_primary_until_it_expires(self):
+        before = int(time.time())
+        response = self.client.post('/api/v1/units/create/', {'name': 'Pinned unit'}, content_type='application/json')
+        cookie = response.cookies[db_router.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 30)
+        self.assertTrue(cookie['httponly'])
+        expires = int(cookie.value)
+        self.assertGreaterEqual(expires, before + 30)
+        self.assertLessEqual(expires, int(time.time()) + 30)
+
+        with mock.patch('time.time', return_value=expires - 1):
+            self.assertEqual(self.catalog_names(), ['Primary Teacher'])
+        with mock.patch('time.time', return_value=expires + 1):
+            self.assertEqual(self.catalog_names(), ['Replica Teacher'])
+        # Without the cookie (the browser dropped it at max-age) reads go to the replica too
+        del self.client.cookies[db_router.PIN_COOKIE]
+        self.assertEqual(self.catalog_names(), ['Replica Teacher'])
+
+    @override_settings(DATABASE_REPLICAS=[REPLICA])
+    def test_reads_without_writes_do_not_pin(self):
+        response = self.client.get('/api/v1/teachers/')
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=[REPLICA])
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+        replica = connections[REPLICA]
+        with mock.patch.object(replica, 'ensure_connection', side_effect=OperationalError('replica down')) as connect:
+            with self.assertLogs('Myapp.db_router', 'WARNING'):
+                self.assertEqual(self.catalog_names(), ['Primary Teacher'])
+            # Skipped without another connection attempt until REPLICA_RETRY_SECONDS pass
+            self.assertEqual(self.catalog_names(), ['Primary Teacher'])
+        self.assertEqual(connect.call_count, 1)
+
+    def test_queries_outside_requests_use_the_primary(self):
+        with override_settings(DATABASE_REPLICAS=[REPLICA]):
+            self.assertEqual(UserSignup.objects.get(id=self.teacher.id).full_name, 'Primary Teacher')
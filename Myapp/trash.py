@@ -0,0 +1,107 @@
+"""Background garbage collection of trashed files and units.
+
+Deletes only tombstone rows; the request that trashed them has long since
+returned. Each file's blob is removed through the storage API before its row,
+so a crash between the two just repeats a no-op storage delete on the next
+run. Storage failures are retried a few times, then counted on the row and
+retried on later runs up to ``MAX_PURGE_ATTEMPTS``. Files that reach the
+limit stay in the trash, and so does their unit; every run logs them as
+stuck until ``retry_stuck()`` (``purge_trash --retry-stuck``) puts them back
+in the queue.
+"""
+import logging
+import time
+from dataclasses import dataclass
+
+from django.db.models import F
+
+from . import search
+from .models import CourseUnit, UploadedFile
+from .services import trash_cutoff
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+STORAGE_RETRIES = 3
+RETRY_BACKOFF = 0.5  # seconds, doubled after each failed attempt
+MAX_PURGE_ATTEMPTS = 5
+
+
+@dataclass
+class PurgeResult:
+    files_purged: int = 0
+    files_failed: int = 0
+    units_purged: int = 0
+    files_stuck: int = 0  # Gave up after MAX_PURGE_ATTEMPTS; needs retry_stuck()
+
+
+def _delete_blob(file_record):
+    """Delete a stored blob, retrying transient storage errors; returns True on success"""
+    if not file_record.file:
+        return True
+    storage = file_record.file.storage
+    delay = RETRY_BACKOFF
+    for attempt in range(1, STORAGE_RETRIES + 1):
+        try:
+            storage.delete(file_record.file.name)
+            return True
+        except Exception:
+            logger.warning(
+                "Storage delete failed for %s (attempt %d/%d)",
+                file_record.file.name, attempt, STORAGE_RETRIES, exc_info=True,
+            )
+            if attempt < STORAGE_RETRIES:
+                time.sleep(delay)
+                delay *= 2
+    return False
+
+
+def purge_expired(batch_size=BATCH_SIZE):
+    """Permanently remove trash older than the retention window"""
+    result = PurgeResult()
+    cutoff = trash_cutoff()
+    last_id = 0
+    while True:
+        batch = list(
+            UploadedFile.all_objects.filter(
+                deleted_at__lt=cutoff, purge_attempts__lt=MAX_PURGE_ATTEMPTS, id__gt=last_id
+            ).order_by('id')[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+        purged, failed = [], []
+        for file_record in batch:
+            (purged if _delete_blob(file_record) else failed).append(file_record.id)
+        if purged:
+            search.unindex(purged)
+            # Queryset delete: no per-row model delete(), the blobs are already gone
+            UploadedFile.all_objects.filter(id__in=purged).delete()
+        if failed:
+            UploadedFile.all_objects.filter(id__in=failed).update(purge_attempts=F('purge_attempts') + 1)
+        result.files_purged += len(purged)
+        result.files_failed += len(failed)
+
+    # Units go once none of their files (live or trashed) remain
+    result.units_purged = CourseUnit.all_objects.filter(
+        deleted_at__lt=cutoff, files__isnull=True
+    ).delete()[1].get('Myapp.CourseUnit', 0)
+
+    stuck = _stuck(cutoff)
+    result.files_stuck = stuck.count()
+    if result.files_stuck:
+        logger.error(
+            "%d trashed file(s) could not be deleted from storage after %d attempts and block their units "
+            "from being purged (e.g. %s); fix storage and run purge_trash --retry-stuck",
+            result.files_stuck, MAX_PURGE_ATTEMPTS, list(stuck.values_list('file', flat=True)[:10]),
+        )
+    return result
+
+
+def _stuck(cutoff):
+    return UploadedFile.all_objects.filter(deleted_at__lt=cutoff, purge_attempts__gte=MAX_PURGE_ATTEMPTS)
+
+
+def retry_stuck():
+    """Give files the purge gave up on a fresh set of attempts; returns how many"""
+    return _stuck(trash_cutoff()).update(purge_attempts=0)
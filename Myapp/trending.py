@@ -0,0 +1,168 @@
+"""Trending materials: time-decayed popularity from download and preview events.
+
+A file's score is the sum of its events' weights, each halved every
+``TRENDING_HALF_LIFE_HOURS``. Scores are kept as log2 relative to a fixed
+epoch (``TrendingScore.log_score``): decay then never rewrites a row, a new
+event only raises its file's row, and the current order is the order of
+``log_score``. ``refresh()`` runs on a schedule (``refresh_trending``): it adds
+the events since its watermark, drops scores that have decayed to nothing,
+and stores the top ``TRENDING_TOP_K`` published files of each teacher's
+course as one ``TrendingSnapshot`` per course. A student's list is the
+top ``TRENDING_TOP_K`` of the snapshots of the courses they are enrolled
+in, read from the cache (:func:`materials`), so a request merges a few short
+lists but never ranks the scores.
+"""
+import logging
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Window
+from django.db.models.functions import RowNumber, TruncHour
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import DownloadEvent, RollupWatermark, TrendingScore, TrendingSnapshot, UploadedFile
+
+logger = logging.getLogger(__name__)
+
+WATERMARK = 'trending'
+SNAPSHOT_PREFIX = 'course:'
+CACHE_PREFIX = 'trending:'
+EMPTY = {'computed_at': None, 'materials': []}
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+WEIGHTS = {'download': 3.0, 'preview': 1.0}
+MIN_SCORE = 0.01  # Scores below this (a preview ~7 half-lives ago) are deleted
+
+
+def _exponent(moment):
+    """log2 of the weight-1 contribution of an event at ``moment``, relative to EPOCH"""
+    return (moment - EPOCH).total_seconds() / 3600 / settings.TRENDING_HALF_LIFE_HOURS
+
+
+def _log_sum(exponents):
+    """log2(sum(2 ** e)), without overflowing for large exponents"""
+    top = max(exponents)
+    return top + math.log2(sum(2 ** (e - top) for e in exponents))
+
+
+def add_events():
+    """Fold the events since the watermark into the scores; returns the number of files rescored"""
+    watermark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK)
+    with transaction.atomic():
+        # Scores are added to, not rebuilt: concurrent runs must not count the same events twice
+        watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK)
+        new_events = DownloadEvent.objects.filter(id__gt=watermark.last_event_id)
+        last_id = new_events.aggregate(last_id=Max('id'))['last_id']
+        if last_id is None:
+            return 0
+        # Events are decayed from the start of their hour: one row per file and hour, however busy
+        hourly = (
+            new_events.filter(id__lte=last_id).order_by()
+            .values('file', hour=TruncHour('created_at'))
+            .annotate(downloads=Count('id', filter=Q(kind='download')), previews=Count('id', filter=Q(kind='preview')))
+        )
+        exponents = {}
+        for row in hourly:
+            weight = row['downloads'] * WEIGHTS['download'] + row['previews'] * WEIGHTS['preview']
+            exponents.setdefault(row['file'], []).append(_exponent(row['hour']) + math.log2(weight))
+        # Purged files keep their events but get no score
+        exponents = {
+            file_id: exponents[file_id]
+            for file_id in UploadedFile.all_objects.filter(id__in=exponents).values_list('id', flat=True)
+        }
+        for score in TrendingScore.objects.filter(file_id__in=exponents):
+            exponents[score.file_id].append(score.log_score)
+        TrendingScore.objects.bulk_create(
+            [TrendingScore(file_id=file_id, log_score=_log_sum(values)) for file_id, values in exponents.items()],
+            update_conflicts=True, unique_fields=['file'], update_fields=['log_score'], batch_size=500,
+        )
+        watermark.last_event_id = last_id
+        watermark.save(update_fields=['last_event_id'])
+    return len(exponents)
+
+
+def _entries(rows, now_exponent):
+    return [
+        {
+            'id': row['file_id'],
+            'name': row['file__original_name'],
+            'file_kind': row['file__file_kind'],
+            'unit_id': row['file__unit_id'],
+            'unit_name': row['file__unit__name'],
+            'teacher_name': row['file__teacher__full_name'],
+            'subject': row['file__teacher__subject'],
+            'score': round(2 ** (row['log_score'] - now_exponent), 3),
+            'download_url': reverse('download_file', args=[row['file_id']]),
+            'preview_url': reverse('preview_file', args=[row['file_id']]),
+        }
+        for row in rows
+    ]
+
+
+def _snapshot_name(teacher_id):
+    return f'{SNAPSHOT_PREFIX}{teacher_id}'
+
+
+def refresh():
+    """Update the scores and the per-course snapshots; returns ``{teacher id: snapshot data}``"""
+    rescored = add_events()
+    now = timezone.now()
+    now_exponent = _exponent(now)
+    pruned, _ = TrendingScore.objects.filter(log_score__lt=now_exponent + math.log2(MIN_SCORE)).delete()
+
+    ranked = TrendingScore.objects.filter(
+        file__is_published=True, file__deleted_at__isnull=True, file__unit__deleted_at__isnull=True,
+    ).values(
+        'file_id', 'log_score', 'file__original_name', 'file__file_kind', 'file__unit_id', 'file__unit__name',
+        'file__teacher_id', 'file__teacher__full_name', 'file__teacher__subject',
+    ).annotate(
+        rank=Window(RowNumber(), partition_by=F('file__teacher_id'), order_by=F('log_score').desc()),
+    ).filter(rank__lte=settings.TRENDING_TOP_K).order_by('file__teacher_id', 'rank')
+    ranked = list(ranked)
+    courses = {}
+    for row, entry in zip(ranked, _entries(ranked, now_exponent)):
+        courses.setdefault(row['file__teacher_id'], {'computed_at': now.isoformat(), 'materials': []})['materials'].append(entry)
+
+    snapshots = {_snapshot_name(teacher_id): data for teacher_id, data in courses.items()}
+    with transaction.atomic():
+        # Courses with nothing trending any more (and snapshots of an older layout) are dropped
+        stale = set(TrendingSnapshot.objects.values_list('name', flat=True)) - set(snapshots)
+        TrendingSnapshot.objects.filter(name__in=stale).delete()
+        TrendingSnapshot.objects.bulk_create(
+            [TrendingSnapshot(name=name, data=data, computed_at=now) for name, data in snapshots.items()],
+            update_conflicts=True, unique_fields=['name'], update_fields=['data', 'computed_at'], batch_size=500,
+        )
+    cache.delete_many([CACHE_PREFIX + name for name in stale])
+    cache.set_many({CACHE_PREFIX + name: data for name, data in snapshots.items()}, settings.TRENDING_CACHE_TIMEOUT)
+    logger.info(
+        "Trending refreshed: %d files rescored, %d scores pruned, %d courses", rescored, pruned, len(snapshots),
+    )
+    return courses
+
+
+def materials(teacher_ids, subject=None):
+    """(computed_at, top trending files) across the courses of ``teacher_ids``, optionally of one subject.
+
+    One cache read; courses missing from this worker's cache cost one query
+    together, and are cached even when they have no snapshot.
+    """
+    keys = {CACHE_PREFIX + _snapshot_name(teacher_id): teacher_id for teacher_id in teacher_ids}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        rows = dict(
+            TrendingSnapshot.objects.filter(name__in=[key.removeprefix(CACHE_PREFIX) for key in missing])
+            .values_list('name', 'data')
+        )
+        loaded = {key: rows.get(key.removeprefix(CACHE_PREFIX), EMPTY) for key in missing}
+        cache.set_many(loaded, settings.TRENDING_CACHE_TIMEOUT)
+        found.update(loaded)
+    entries = [
+        entry for data in found.values() for entry in data['materials'] if subject is None or entry['subject'] == subject
+    ]
+    entries.sort(key=lambda entry: (-entry['score'], entry['id']))
+    computed_at = max((data['computed_at'] for data in found.values() if data['computed_at']), default=None)
+    return computed_at, entries[:settings.TRENDING_TOP_K]
@@ -11,6 +11,7 @@ urlpatterns = [
     path('student-dashboard/', views.student_view, name='student_dashboard'),
     path('teacher-dashboard/', views.teacher_view, name='teacher_dashboard'),
     path('logout/', views.logout_view, name='logout'),
+    path('metrics', views.metrics_view, name='metrics'),
     
     # API endpoints
     path('api/create-unit/', views.create_unit, name='create_unit'),
@@ -1,19 +1,20 @@
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
-from .models import UserSignup, EmailNotification
+from .models import UserSignup
+from .notifications import record_event
 import logging
 
 logger = logging.getLogger(__name__)
 
 def send_notification_email(teacher, unit, notification_type, file=None):
-    """Send email notifications to all students when teacher uploads content"""
+    """Send email notifications to the teacher's enrolled students when teacher uploads content"""
     try:
-        # Get all students
-        students = UserSignup.objects.filter(role='student')
+        # Only the students of this teacher's course
+        students = UserSignup.objects.filter(role='student', enrollments__teacher=teacher)
         
         if not students.exists():
-            logger.info("No students found to notify")
+            logger.info("No enrolled students to notify")
             return
         
         # Prepare email content based on notification type
@@ -70,7 +71,7 @@ cloudED Team
             """
         
         # Send email to each student
-        student_emails = [student.email for student in students]
+        student_emails = list(students.values_list('email', flat=True))
         
         try:
             send_mail(
@@ -81,15 +82,8 @@ cloudED Team
                 fail_silently=False,
             )
             
-            # Create notification records
-            for student in students:
-                EmailNotification.objects.create(
-                    teacher=teacher,
-                    student=student,
-                    unit=unit,
-                    file=file,
-                    notification_type=notification_type
-                )
+            # One broadcast notification row, however many students were emailed
+            record_event(teacher, unit, notification_type, file=file)
             
             logger.info(f"Email notifications sent to {len(student_emails)} students")
             return True
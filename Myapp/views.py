@@ -1,18 +1,28 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib import messages
 from django.contrib.auth import login as auth_login
 from django.http import JsonResponse, HttpResponse, Http404
+from django.template.defaultfilters import date as date_filter
+from django.template.response import TemplateResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
+import hmac
 import json
+import logging
 import os
 import mimetypes
 from .forms import SignupForm, LoginForm
-from .models import UserSignup, CourseUnit, UploadedFile, EmailNotification
+from .models import UserSignup, CourseUnit, UploadedFile
 from .utils import send_notification_email, format_file_size
+from .events import publish_event
+from .middleware import aget_principal, current_user
+from .login_guard import HashingBusy, check_login_throttle, verify_password
+from . import downloads, enrollments, metrics, notifications, quotas, services
+
+logger = logging.getLogger(__name__)
 
 def login_view(request):
     if request.method == "POST":
@@ -22,12 +32,17 @@ def login_view(request):
             password = form.cleaned_data['password']
             role = form.cleaned_data['role']
             
+            # Throttle before the user lookup and before any hashing work
+            if check_login_throttle(request, email):
+                messages.error(request, "Too many login attempts. Please wait a minute and try again.")
+                return render(request, 'login.html', {'form': form}, status=429)
+            
             try:
                 # Check if user exists with the given email and role
                 user = UserSignup.objects.get(email=email, role=role)
                 
-                # Check if password matches
-                if user.check_password(password):
+                # Check if password matches (on the bounded hashing pool)
+                if verify_password(user, password):
                     # Store user info in session for later use
                     request.session['user_id'] = user.id
                     request.session['user_name'] = user.full_name
@@ -47,6 +62,9 @@ def login_view(request):
                     
             except UserSignup.DoesNotExist:
                 messages.error(request, f"No {role} account found with email '{email}'. Please sign up first.")
+            except HashingBusy:
+                messages.error(request, "The server is busy right now. Please try again in a moment.")
+                return render(request, 'login.html', {'form': form}, status=503)
         else:
             messages.error(request, "Please fill in all required fields correctly.")
     else:
@@ -70,12 +88,14 @@ def signup_view(request):
                 
                 # Save the new user
                 user = form.save()
+                if user.role == 'student':
+                    notifications.start_cursors([user.id])
                 messages.success(request, f"Account created successfully for {user.full_name}! Please log in with your credentials.")
                 return redirect('login')
                 
             except Exception as e:
                 messages.error(request, "An error occurred while creating your account. Please try again.")
-                print(f"Signup error: {e}")  # For debugging
+                logger.exception("Signup failed")
         else:
             # Handle form validation errors
             error_messages = []
@@ -113,28 +133,19 @@ def student_view(request):
     
     # Get fresh user data from database
     try:
-        user = UserSignup.objects.get(id=request.session['user_id'])
+        user = current_user(request)
         
-        # Get all teachers with their units and published files only
-        teachers = UserSignup.objects.filter(role='teacher').prefetch_related(
+        # Teachers of the student's courses, with their units and published files only
+        teachers = UserSignup.objects.filter(role='teacher', course_enrollments__student_id=user.id).prefetch_related(
             'course_units__files'
         ).order_by('full_name')
         
-        # Filter to only show teachers who have published content
-        teachers_with_content = []
-        for teacher in teachers:
-            # Check if teacher has any published files
-            has_published_files = any(
-                unit.files.filter(is_published=True).exists() 
-                for unit in teacher.course_units.all()
-            )
-            if teacher.course_units.exists() or has_published_files:
-                teachers_with_content.append(teacher)
+        # Only show teachers who have created units (published files always belong to a unit);
+        # checked against the prefetched units, so no query per teacher
+        teachers_with_content = [teacher for teacher in teachers if teacher.course_units.all()]
         
         # Get recent notifications for this student
-        recent_notifications = EmailNotification.objects.filter(
-            student=user
-        ).select_related('teacher', 'unit', 'file').order_by('-sent_at')[:10]
+        recent_notifications, _, _ = notifications.get_feed(user.id, limit=10)
         
         context = {
             'user_name': user.full_name,
@@ -147,7 +158,7 @@ def student_view(request):
         messages.error(request, "User account not found. Please log in again.")
         return redirect('login')
     
-    return render(request, 'studentdashboard.html', context)
+    return TemplateResponse(request, 'studentdashboard.html', context)
 
 def teacher_view(request):
     # Check if user is logged in and has teacher role
@@ -161,35 +172,54 @@ def teacher_view(request):
     
     # Get fresh user data from database
     try:
-        user = UserSignup.objects.get(id=request.session['user_id'])
+        user = current_user(request)
         
         # Get teacher's units and files
         units = CourseUnit.objects.filter(teacher=user).prefetch_related('files').order_by('created_at')
+        subject = user.subject if user.subject else 'General Course'
         
         context = {
             'user_name': user.full_name,
             'user_email': user.email,
-            'user_subject': user.subject if user.subject else 'General Course',
+            'user_subject': subject,
             'user_role': user.role,
             'units': units,
+            'storage': quotas.account_usage(user.id),
+            # Read by static/js/teacherdashboard.js from a json_script block
+            'dashboard_data': {
+                'teacherName': user.full_name,
+                'teacherEmail': user.email,
+                'teacherSubject': subject,
+                'unitFiles': {
+                    unit.id: [
+                        {
+                            'id': f.id,
+                            'name': f.original_name,
+                            'size': f.get_file_size_display(),
+                            'uploaded_at': date_filter(f.uploaded_at, 'Y-m-d H:i'),
+                            'is_published': f.is_published,
+                            'icon': f.get_file_icon(),
+                            'color': f.get_file_color(),
+                            'can_preview': f.can_preview(),
+                        }
+                        for f in unit.files.all()
+                    ]
+                    for unit in units
+                },
+            },
         }
     except UserSignup.DoesNotExist:
         messages.error(request, "User account not found. Please log in again.")
         return redirect('login')
     
-    return render(request, 'teacherdashboard.html', context)
+    return TemplateResponse(request, 'teacherdashboard.html', context)
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def create_unit(request):
     """Create a new course unit"""
-    # Debug print
-    print(f"Session data: {dict(request.session)}")
-    print(f"POST data: {request.POST}")
-    print(f"Request body: {request.body}")
-    
     if 'user_id' not in request.session or request.session.get('user_role') != 'teacher':
-        print("Authorization failed - session check")
+        logger.info("Create unit rejected: not logged in as teacher", extra={'sample_rate': 0.1})
         return JsonResponse({'success': False, 'error': 'Unauthorized - Please log in as teacher'})
     
     try:
@@ -203,7 +233,7 @@ def create_unit(request):
         if not unit_name:
             return JsonResponse({'success': False, 'error': 'Unit name is required'})
         
-        teacher = UserSignup.objects.get(id=request.session['user_id'])
+        teacher = current_user(request)
         
         # Check if unit already exists
         if CourseUnit.objects.filter(teacher=teacher, name=unit_name).exists():
@@ -214,6 +244,8 @@ def create_unit(request):
             teacher=teacher,
             name=unit_name
         )
+        notifications.record_event(teacher, unit, 'unit_created')
+        publish_event('unit_created', teacher_id=teacher.id, unit_id=unit.id, unit_name=unit.name)
         
         # Email notification disabled
         # try:
@@ -233,60 +265,52 @@ def create_unit(request):
     except UserSignup.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Teacher not found'})
     except Exception as e:
-        print(f"Error creating unit: {e}")
+        logger.exception("Creating unit failed")
         return JsonResponse({'success': False, 'error': str(e)})
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def upload_file(request):
     """Handle file upload to a specific unit"""
-    # Debug print
-    print(f"=== UPLOAD REQUEST DEBUG ===")
-    print(f"Session data: {dict(request.session)}")
-    print(f"Content-Type: {request.content_type}")
-    print(f"Method: {request.method}")
-    print(f"POST data: {dict(request.POST)}")
-    print(f"POST data items: {list(request.POST.items())}")
-    print(f"FILES data: {request.FILES}")
-    print(f"All FILES keys: {list(request.FILES.keys())}")
-    
     if 'user_id' not in request.session or request.session.get('user_role') != 'teacher':
-        print("Authorization failed - session check")
+        logger.info("Upload rejected: not logged in as teacher", extra={'sample_rate': 0.1})
         return JsonResponse({'success': False, 'error': 'Unauthorized - Please log in as teacher'})
     
     try:
+        # Before the body is parsed: stop reading it once the files pass the teacher's remaining quota
+        quota_guard = quotas.guard_upload(request, request.session['user_id'])
+        
         # Try to get unit_id from POST
         unit_id = request.POST.get('unit_id')
-        print(f"Unit ID from POST.get('unit_id'): {unit_id}")
         
         # Fallback: Try different ways to get unit_id
         if not unit_id:
             unit_id = request.POST.get('unit_id[]')
-            print(f"Trying unit_id[]: {unit_id}")
         if not unit_id and 'unit_id' in request.POST:
             unit_id = request.POST['unit_id']
-            print(f"Trying POST['unit_id']: {unit_id}")
         
         uploaded_files = request.FILES.getlist('files')
-        print(f"Files from getlist('files'): {[f.name for f in uploaded_files]}")
         
         # Try different keys if 'files' doesn't work
         if not uploaded_files:
             for key in request.FILES.keys():
-                print(f"Trying key: {key}")
                 uploaded_files = request.FILES.getlist(key)
                 if uploaded_files:
-                    print(f"Found files under key '{key}': {[f.name for f in uploaded_files]}")
+                    logger.debug("Upload files found under key %r", key)
                     break
         
+        if quota_guard.exceeded:
+            logger.info("Upload rejected: over the storage quota")
+            return JsonResponse({'success': False, 'error': 'Storage quota exceeded for your account'}, status=413)
+        
         if not unit_id:
-            print(f"ERROR: Unit ID not found in POST data: {dict(request.POST)}")
+            logger.warning("Upload without unit_id", extra={'post_keys': list(request.POST.keys())})
             return JsonResponse({'success': False, 'error': 'Unit ID is required. Received POST data: ' + str(dict(request.POST))})
         
         if not uploaded_files:
             return JsonResponse({'success': False, 'error': 'No files found in request. FILES keys: ' + str(list(request.FILES.keys()))})
         
-        teacher = UserSignup.objects.get(id=request.session['user_id'])
+        teacher = current_user(request)
         unit = get_object_or_404(CourseUnit, id=unit_id, teacher=teacher)
         
         uploaded_file_data = []
@@ -309,11 +333,9 @@ def upload_file(request):
         skipped_files = []  # Track skipped files
 
         for uploaded_file in uploaded_files:
-            print(f"Processing file: {uploaded_file.name}, size: {uploaded_file.size}, type: {uploaded_file.content_type}")
-
             # Validate file type
             if uploaded_file.content_type not in ALLOWED_FILE_TYPES:
-                print(f"❌ File type not allowed: {uploaded_file.content_type}")
+                logger.info("Upload skipped: file type %s not allowed", uploaded_file.content_type)
                 skipped_files.append({
                     'name': uploaded_file.name,
                     'reason': f'File type not allowed: {uploaded_file.content_type}. Allowed types: PDF, DOCX, PPTX, TXT'
@@ -322,26 +344,20 @@ def upload_file(request):
 
             # Validate file size
             if uploaded_file.size > MAX_FILE_SIZE:
-                print(f"❌ File too large: {uploaded_file.size}")
+                logger.info("Upload skipped: %d bytes is over the size limit", uploaded_file.size)
                 skipped_files.append({
                     'name': uploaded_file.name,
                     'reason': f'File too large: {uploaded_file.size / (1024*1024):.1f}MB (max: 50MB)'
                 })
                 continue
 
-            print(f"✅ File validation passed, creating record...")
-            
-            # Create file record
-            file_record = UploadedFile.objects.create(
-                teacher=teacher,
-                unit=unit,
-                original_name=uploaded_file.name,
-                file=uploaded_file,
-                file_size=uploaded_file.size,
-                file_type=uploaded_file.content_type,
-                tag=tag,
-                is_published=False  # Files start as drafts
-            )
+            # Store the file and charge it to the teacher's and unit's quotas
+            try:
+                file_record = services.store_upload(teacher, unit, uploaded_file, tag)
+            except quotas.QuotaExceeded as e:
+                logger.info("Upload skipped: %s", e)
+                skipped_files.append({'name': uploaded_file.name, 'reason': str(e)})
+                continue
             
             uploaded_file_data.append({
                 'id': file_record.id,
@@ -373,9 +389,7 @@ def upload_file(request):
     except UserSignup.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Teacher not found'})
     except Exception as e:
-        print(f"Error uploading files: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Uploading files failed")
         return JsonResponse({'success': False, 'error': str(e)})
 
 @csrf_exempt
@@ -393,97 +407,82 @@ def publish_files(request):
         else:
             unit_id = request.POST.get('unit_id')
         
-        teacher = UserSignup.objects.get(id=request.session['user_id'])
+        teacher = current_user(request)
         unit = get_object_or_404(CourseUnit, id=unit_id, teacher=teacher)
         
-        # Publish all unpublished files in the unit
-        unpublished_files = UploadedFile.objects.filter(unit=unit, is_published=False)
+        # Publish all unpublished files in the unit with a single UPDATE
+        published_count = services.set_published(teacher, UploadedFile.objects.filter(unit=unit), True)
         
-        for file_record in unpublished_files:
-            file_record.is_published = True
-            file_record.save()
-            
-            # Email notification disabled
-            # try:
-            #     send_notification_email(teacher, unit, 'file_published', file_record)
-            # except Exception as e:
-            #     print(f"Email notification failed: {e}")
+        # Email notification disabled
+        # try:
+        #     send_notification_email(teacher, unit, 'file_published', file_record)
+        # except Exception as e:
+        #     print(f"Email notification failed: {e}")
         
         return JsonResponse({
             'success': True,
-            'message': f'{unpublished_files.count()} file(s) published successfully'
+            'message': f'{published_count} file(s) published successfully'
         })
         
     except UserSignup.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Teacher not found'})
     except Exception as e:
-        print(f"Error publishing files: {e}")
+        logger.exception("Publishing files failed")
         return JsonResponse({'success': False, 'error': str(e)})
 
+async def _visible_file(request, file_id):
+    """The session user and the file, if they may see it: students published files of their courses, teachers their own"""
+    if not await request.session.ahas_key('user_id'):
+        raise Http404("File not found")
+    user = await aget_principal(request)
+    if user is None:
+        raise Http404("File not found")
+    files = UploadedFile.objects.filter(id=file_id)
+    if user.role == 'student':
+        files = files.filter(is_published=True, teacher_id__in=enrollments.teacher_ids(user.id))
+    elif user.role == 'teacher':
+        files = files.filter(teacher_id=user.id)
+    file_record = await aget_object_or_404(files)
+    if not file_record.file:
+        raise Http404("File not found")
+    return user, file_record
+
 @require_http_methods(["GET"])
-def download_file(request, file_id):
+async def download_file(request, file_id):
     """Download a file"""
     try:
-        # Students can download published files, teachers can download their own files
-        if 'user_id' not in request.session:
-            raise Http404("File not found")
-        
-        user = UserSignup.objects.get(id=request.session['user_id'])
-        file_record = get_object_or_404(UploadedFile, id=file_id)
-        
-        # Check permissions
-        if user.role == 'student' and not file_record.is_published:
-            raise Http404("File not found")
-        elif user.role == 'teacher' and file_record.teacher != user:
-            raise Http404("File not found")
-        
+        user, file_record = await _visible_file(request, file_id)
+        if user.role == 'student':
+            # Buffered in memory; written in the background by the download events flusher
+            downloads.record(file_record.id, user.id, 'download')
         # For Cloudinary files, redirect to the cloud URL
         # Cloudinary URLs are already public and don't need to be served through Django
-        if file_record.file:
-            file_url = file_record.file.url
-            print(f"Redirecting to file URL: {file_url}")
-            # Redirect to Cloudinary URL directly
-            from django.shortcuts import redirect
-            return redirect(file_url)
-        else:
-            raise Http404("File not found")
-            
-    except Exception as e:
-        print(f"Download error: {e}")
-        import traceback
-        traceback.print_exc()
+        file_url = file_record.file.url
+        logger.debug("Redirecting download to %s", file_url)
+        return redirect(file_url)
+    except Http404:
+        # Missing or not visible to this user: a normal outcome, not worth a log line
+        raise
+    except Exception:
+        logger.exception("Download failed for file %s", file_id)
         raise Http404("File not found")
 
 @require_http_methods(["GET"])
-def preview_file(request, file_id):
+async def preview_file(request, file_id):
     """Preview a file in browser"""
     try:
-        # Students can preview published files, teachers can preview their own files
-        if 'user_id' not in request.session:
-            raise Http404("File not found")
-        
-        user = UserSignup.objects.get(id=request.session['user_id'])
-        file_record = get_object_or_404(UploadedFile, id=file_id)
-        
-        # Check permissions
-        if user.role == 'student' and not file_record.is_published:
-            raise Http404("File not found")
-        elif user.role == 'teacher' and file_record.teacher != user:
-            raise Http404("File not found")
-        
+        user, file_record = await _visible_file(request, file_id)
+        if user.role == 'student':
+            # Buffered in memory; written in the background by the download events flusher
+            downloads.record(file_record.id, user.id, 'preview')
         # For Cloudinary files, redirect to the cloud URL
-        if file_record.file:
-            file_url = file_record.file.url
-            print(f"Redirecting to preview URL: {file_url}")
-            from django.shortcuts import redirect
-            return redirect(file_url)
-        else:
-            raise Http404("File not found")
-            
-    except Exception as e:
-        print(f"Preview error: {e}")
-        import traceback
-        traceback.print_exc()
+        file_url = file_record.file.url
+        logger.debug("Redirecting preview to %s", file_url)
+        return redirect(file_url)
+    except Http404:
+        raise
+    except Exception:
+        logger.exception("Preview failed for file %s", file_id)
         raise Http404("File not found")
 
 @csrf_exempt
@@ -494,11 +493,12 @@ def delete_file(request, file_id):
         return JsonResponse({'success': False, 'error': 'Unauthorized'})
     
     try:
-        teacher = UserSignup.objects.get(id=request.session['user_id'])
+        teacher = current_user(request)
         file_record = get_object_or_404(UploadedFile, id=file_id, teacher=teacher)
         
         file_name = file_record.original_name
-        file_record.delete()  # This will also delete the actual file
+        # Moves the file to the trash; the blob is purged later by purge_trash
+        services.trash_files(teacher, UploadedFile.objects.filter(id=file_record.id))
         
         return JsonResponse({
             'success': True,
@@ -508,7 +508,7 @@ def delete_file(request, file_id):
     except UserSignup.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Teacher not found'})
     except Exception as e:
-        print(f"Error deleting file: {e}")
+        logger.exception("Deleting file failed")
         return JsonResponse({'success': False, 'error': str(e)})
 
 @csrf_exempt
@@ -519,11 +519,12 @@ def delete_unit(request, unit_id):
         return JsonResponse({'success': False, 'error': 'Unauthorized'})
     
     try:
-        teacher = UserSignup.objects.get(id=request.session['user_id'])
+        teacher = current_user(request)
         unit = get_object_or_404(CourseUnit, id=unit_id, teacher=teacher)
         
         unit_name = unit.name
-        unit.delete()  # This will cascade delete all files
+        # Moves the unit and its files to the trash in one transaction
+        services.trash_unit(teacher, unit)
         
         return JsonResponse({
             'success': True,
@@ -533,7 +534,7 @@ def delete_unit(request, unit_id):
     except UserSignup.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Teacher not found'})
     except Exception as e:
-        print(f"Error deleting unit: {e}")
+        logger.exception("Deleting unit failed")
         return JsonResponse({'success': False, 'error': str(e)})
 
 def logout_view(request):
@@ -541,3 +542,18 @@ def logout_view(request):
     request.session.flush()
     messages.success(request, "You have been logged out successfully.")
     return redirect('login')
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """Request metrics of all workers in Prometheus text format; needs ``Authorization: Bearer <METRICS_TOKEN>``"""
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    return HttpResponse(
+        metrics.render_prometheus(metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
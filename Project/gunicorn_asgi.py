@@ -0,0 +1,49 @@
+"""Gunicorn settings for serving Project.asgi under uvicorn workers.
+
+    gunicorn -c Project/gunicorn_asgi.py Project.asgi:application
+
+Each worker is one process with one event loop: async views (catalog,
+``/auth/me/``, downloads and the notification feed) wait on the database
+and cache without holding a thread, so a worker keeps many connections
+open at once. Sync views still work; Django runs them in a thread. This is
+the deployed profile (Procfile, Dockerfile): the live events stream
+(``/api/v1/events/``) is refused under WSGI.
+"""
+import os
+
+# The hooks below read METRICS_DIR from the Django settings
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Project.settings')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = 'uvicorn_worker.UvicornWorker'
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# Live events raised in one worker reach streams held by the others only through the DB bridge.
+# Set here, in the master, so every worker's settings see it.
+if workers > 1:
+    os.environ.setdefault('LIVE_EVENTS_DB_BRIDGE', 'True')
+# Seconds a worker may go without heartbeating before it is restarted. Uvicorn workers heartbeat
+# from their event loop, so this does not limit long-lived streams.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = 30
+keepalive = 5
+accesslog = None  # Requests are logged by RequestLogMiddleware
+errorlog = '-'
+
+
+def on_starting(server):
+    from Myapp import metrics
+    metrics.reset()
+
+
+def worker_exit(server, worker):
+    # In the exiting worker: write the totals since its last periodic flush
+    from django.conf import settings
+    from Myapp import metrics
+    if settings.METRICS_ENABLED:
+        metrics.registry.flush()
+
+
+def child_exit(server, worker):
+    # In the master, once the worker is gone: fold its totals into the retired ones
+    from Myapp import metrics
+    metrics.retire_worker(worker.pid)
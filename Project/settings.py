@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -50,6 +52,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Myapp.middleware.MetricsMiddleware',
+    'Myapp.middleware.RequestLogMiddleware',
+    'Myapp.middleware.ReplicaPinMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -57,6 +62,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Myapp.middleware.PrincipalMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -93,6 +99,86 @@ DATABASES = {
     )
 }
 
+# Read replicas: comma-separated database URLs. Requests read from them (see Myapp/db_router.py);
+# writes, sessions and background jobs use the primary.
+DATABASE_REPLICAS = []
+for _number, _url in enumerate(u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()):
+    _alias = f'replica{_number + 1}'
+    DATABASES[_alias] = dj_database_url.parse(_url)
+    # Tests read replicas through the primary's test database
+    DATABASES[_alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(_alias)
+DATABASE_ROUTERS = ['Myapp.db_router.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '10'))  # primary reads after a client writes
+REPLICA_RETRY_SECONDS = 30  # how long an unreachable replica is skipped
+
+# SQLite production profile (Myapp/sqlite_backend): WAL so readers never wait for writers, tuned pragmas,
+# BEGIN IMMEDIATE write transactions serialized per process, retried while another process holds the lock.
+# Opt-in because WAL changes the database file's journal mode for good.
+SQLITE_PRODUCTION = os.environ.get('SQLITE_PRODUCTION', 'False') == 'True'
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))  # ms SQLite waits for another process's lock
+SQLITE_WRITE_RETRIES = 3  # further BEGIN IMMEDIATE attempts after busy_timeout runs out
+SQLITE_RETRY_BACKOFF = 0.05  # seconds before the first retry; doubles each time
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT};'
+        'PRAGMA mmap_size=134217728;'  # 128 MiB
+        'PRAGMA cache_size=-20000;'  # ~20 MB per connection
+    ),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': SQLITE_BUSY_TIMEOUT / 1000,
+}
+if SQLITE_PRODUCTION:
+    for _database in DATABASES.values():
+        if _database['ENGINE'] == 'django.db.backends.sqlite3':
+            _database['ENGINE'] = 'Myapp.sqlite_backend'
+            _database.setdefault('OPTIONS', {}).update(SQLITE_PRODUCTION_OPTIONS)
+
+
+# Cache: per-process memory by default; set REDIS_URL to share it between workers
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'cloudED',
+        }
+    }
+
+# Sessions are read from the cache and written through to the DB, so warm requests skip the django_session query.
+# Run `python manage.py sweep_sessions` periodically to keep the table small.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Seconds a resolved request.principal (its public profile fields) stays cached. Saves/deletes invalidate
+# it, but only in a shared cache: with per-process memory other workers would keep a stale role or name,
+# so caching is off (0) unless REDIS_URL is set.
+PRINCIPAL_CACHE_TIMEOUT = int(os.environ.get('PRINCIPAL_CACHE_TIMEOUT', '60' if os.environ.get('REDIS_URL') else '0'))
+
+
+# Login protection: token buckets checked before any password hashing, and a bounded hashing pool.
+# The EMAIL buckets are per (client IP, email), so nobody can lock another user out of their account.
+LOGIN_THROTTLE_EMAIL_BURST = 5
+LOGIN_THROTTLE_EMAIL_PER_MINUTE = 5
+LOGIN_THROTTLE_IP_BURST = 30  # a classroom often shares one NAT address
+LOGIN_THROTTLE_IP_PER_MINUTE = 30
+LOGIN_THROTTLE_TRUST_X_FORWARDED_FOR = os.environ.get('LOGIN_THROTTLE_TRUST_X_FORWARDED_FOR', 'False') == 'True'
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))  # concurrent hashes per process
+PASSWORD_HASH_QUEUE_DEPTH = int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', '4'))  # waiting hashes before rejecting
+PASSWORD_HASH_TIMEOUT = 10  # seconds a request waits for its hash
+# Processes used to hash passwords during `import_roster` command runs (0 = one per CPU)
+ROSTER_HASH_WORKERS = int(os.environ.get('ROSTER_HASH_WORKERS', '0'))
+# Rows one /api/v1/roster/import/ upload may hold; hashed in the request at ~0.5 s per row, so keep it
+# well inside the worker timeout
+ROSTER_API_MAX_ROWS = int(os.environ.get('ROSTER_API_MAX_ROWS', '30'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -131,8 +217,16 @@ USE_TZ = True
 STATIC_URL = '/static/'
 # Static files (for production)
 STATIC_ROOT = BASE_DIR / 'staticfiles'
-# Use WhiteNoise's compressed manifest storage to serve static files efficiently
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# collectstatic minifies CSS/JS, adds content hashes to the names and writes gzip/brotli variants
+# (Myapp/storage.py); WhiteNoise serves the hashed files with far-future caching.
+# Django 5.x reads storages only from STORAGES; media stays on the local filesystem as before.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'Myapp.storage.MinifiedCompressedManifestStaticFilesStorage'},
+}
+# The test runner renders pages without running collectstatic, so it serves the unhashed names
+if sys.argv[1:2] == ['test']:
+    STORAGES['staticfiles'] = {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -175,6 +269,83 @@ ALLOWED_FILE_TYPES = [
 # Maximum file size (50MB)
 MAX_FILE_SIZE = 50 * 1024 * 1024
 
+# Logging: JSON lines on stdout, written by a background thread (see Myapp/log.py)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_ACCESS_SAMPLE_RATE = float(os.environ.get('LOG_ACCESS_SAMPLE_RATE', '0.1'))  # fraction of non-5xx requests logged
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_context': {'()': 'Myapp.log.RequestContextFilter'},
+        'sampling': {'()': 'Myapp.log.SamplingFilter'},
+    },
+    'formatters': {
+        'json': {'()': 'Myapp.log.JsonFormatter'},
+    },
+    'handlers': {
+        'queue': {
+            'class': 'Myapp.log.QueueHandler',
+            'formatter': 'json',
+            'filters': ['sampling', 'request_context'],
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': 'WARNING'},
+    'loggers': {
+        'Myapp': {'level': LOG_LEVEL},
+    },
+}
+# Keep the JSON lines out of the test runner's output; assertLogs still captures records
+if sys.argv[1:2] == ['test']:
+    LOGGING['handlers']['queue'] = {'class': 'logging.NullHandler'}
+
+# Request metrics, served in Prometheus format at /metrics (disabled unless METRICS_TOKEN is set;
+# scrape with `Authorization: Bearer <token>`). Each worker writes its totals to METRICS_DIR.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Recording defaults to on only when something can scrape it
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True' if METRICS_TOKEN else 'False') == 'True'
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'clouded-metrics'))
+METRICS_FLUSH_INTERVAL = 5  # seconds between writes of a worker's totals
+
+# Student downloads/previews are buffered per worker and written in batches (Myapp/downloads.py).
+# When the buffer is full the oldest unwritten events are dropped rather than slowing requests down.
+DOWNLOAD_EVENTS_ENABLED = os.environ.get('DOWNLOAD_EVENTS_ENABLED', 'True') == 'True'
+DOWNLOAD_EVENTS_BUFFER_SIZE = int(os.environ.get('DOWNLOAD_EVENTS_BUFFER_SIZE', '10000'))  # events held per worker
+DOWNLOAD_EVENTS_BATCH_SIZE = int(os.environ.get('DOWNLOAD_EVENTS_BATCH_SIZE', '500'))  # flush early at this many
+DOWNLOAD_EVENTS_FLUSH_INTERVAL = float(os.environ.get('DOWNLOAD_EVENTS_FLUSH_INTERVAL', '5'))  # seconds
+
+# Trending materials (Myapp/trending.py): download/preview scores halve every TRENDING_HALF_LIFE_HOURS;
+# `refresh_trending` keeps the top TRENDING_TOP_K files of each course, cached for TRENDING_CACHE_TIMEOUT seconds
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '24'))
+TRENDING_TOP_K = int(os.environ.get('TRENDING_TOP_K', '20'))
+TRENDING_CACHE_TIMEOUT = int(os.environ.get('TRENDING_CACHE_TIMEOUT', '300'))
+
+# Document search (Myapp/search.py): `index_documents` extracts text from files up to SEARCH_EXTRACT_MAX_BYTES,
+# keeping at most SEARCH_EXTRACT_MAX_CHARS characters and spending at most SEARCH_EXTRACT_SECONDS per file
+SEARCH_EXTRACT_MAX_BYTES = int(os.environ.get('SEARCH_EXTRACT_MAX_BYTES', str(50 * 1024 ** 2)))  # 50 MiB
+SEARCH_EXTRACT_MAX_CHARS = int(os.environ.get('SEARCH_EXTRACT_MAX_CHARS', '2000000'))
+SEARCH_EXTRACT_SECONDS = float(os.environ.get('SEARCH_EXTRACT_SECONDS', '30'))
+
+# Deleted units/files stay restorable from the trash for this long, then `purge_trash` removes the blobs and rows
+TRASH_RETENTION_DAYS = int(os.environ.get('TRASH_RETENTION_DAYS', '7'))
+
+# Storage quotas for live (not trashed) files, per teacher and per unit; 0 means unlimited.
+# max_bytes/max_files on a teacher's or unit's StorageUsage row override these.
+TEACHER_QUOTA_BYTES = int(os.environ.get('TEACHER_QUOTA_BYTES', str(5 * 1024 ** 3))) or None  # 5 GiB
+TEACHER_QUOTA_FILES = int(os.environ.get('TEACHER_QUOTA_FILES', '5000')) or None
+UNIT_QUOTA_BYTES = int(os.environ.get('UNIT_QUOTA_BYTES', str(1024 ** 3))) or None  # 1 GiB
+UNIT_QUOTA_FILES = int(os.environ.get('UNIT_QUOTA_FILES', '1000')) or None
+
+# Live dashboard events (Server-Sent Events at /api/v1/events/)
+# The DB bridge lets every worker see every event; it is on by default when WEB_CONCURRENCY runs more than one
+# worker (Project/gunicorn_asgi.py also turns it on for its worker count).
+LIVE_EVENTS_DB_BRIDGE = os.environ.get(
+    'LIVE_EVENTS_DB_BRIDGE', 'True' if int(os.environ.get('WEB_CONCURRENCY', '1')) > 1 else 'False'
+) == 'True'
+LIVE_EVENTS_POLL_INTERVAL = 1.0  # seconds between bridge polls (one query per worker, not per client)
+LIVE_EVENTS_HEARTBEAT = 15  # seconds between keepalive comments on idle streams
+LIVE_EVENTS_RETENTION = 60 * 60  # seconds of bridged events kept for Last-Event-ID resume
+LIVE_EVENTS_RETRY_MS = 3000  # client reconnect delay sent in the stream
+
 # Make sure your INSTALLED_APPS includes your app
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -183,11 +354,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     
-    # Cloudinary apps (MUST be BEFORE staticfiles)
+    # staticfiles before cloudinary_storage: static assets are served by WhiteNoise, so Django's
+    # collectstatic (not cloudinary_storage's, which skips unhashed copies) must win
+    'django.contrib.staticfiles',
+
+    # Cloudinary apps
     'cloudinary_storage',
     'cloudinary',
     
-    'django.contrib.staticfiles',
     'Myapp',  # Make sure this matches your app name exactly
     # Third-party apps for API
     'rest_framework',